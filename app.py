@@ -1,74 +1,85 @@
 import os
-import json
+import logging
+from functools import lru_cache
+import threading
 import numpy as np
 import requests
 import gradio as gr
-from PIL import Image
-from model_loader import load_model, preprocess_image, predict_disease
-from chat_app import groq_chatbot
+import metrics
+from diagnosis_runtime import DiagnosisRuntime
+from tiled_inference import render_heatmap
+from weather_service import WeatherService
+from city_index import CityIndex, Debouncer
+from treatments import DEMO_TREATMENTS
+from chat_app import groq_chatbot_stream, clear_chat
+
+logging.basicConfig(level=os.getenv("LOG_LEVEL", "INFO").upper())
+logger = logging.getLogger(__name__)
+
+# Lazy startup: load the model on a background warm-up thread, keep network
+# lookups off the startup path and degrade (instead of failing) on missing keys
+LAZY_STARTUP = os.getenv("PLANTDOCTOR_LAZY_STARTUP", "1").lower() in ("1", "true", "yes")
 
 # OpenWeatherMap API Key
 OWM_API_KEY = os.getenv("OPENWEATHER_API_KEY")
 if not OWM_API_KEY:
-    raise ValueError("Missing OPENWEATHER_API_KEY environment variable. Set it in Hugging Face Spaces Secrets.")
-
-# Load the disease diagnosis model
-model_path = "attached_assets/mobilenetv2.h5"
-model = load_model(model_path)
-
-# Load class labels
-with open("class_labels.json", "r") as f:
-    class_labels = json.load(f)
-
-# Disease treatments dictionary
-DEMO_TREATMENTS = {
-    "Apple - Apple Scab": "Rake and destroy fallen leaves, prune for good air circulation, apply fungicides like captan or sulfur before rainy periods, and plant resistant apple varieties.",
-    "Apple - Black Rot": "Prune and remove infected branches, destroy fallen leaves and fruit, apply copper-based fungicides, and ensure proper spacing between trees.",
-    "Apple - Cedar Apple Rust": "Remove nearby juniper or cedar trees if possible, apply fungicides like myclobutanil, and plant resistant apple varieties.",
-    "Apple - Healthy": "Your apple tree appears healthy! Continue regular maintenance, including pruning, watering, and monitoring for pests or disease symptoms.",
-    "Background without Leaves": "No plants detected. Please upload an image containing leaves to diagnose.",
-    "Blueberry - Healthy": "Your blueberry plant is healthy! Ensure consistent watering, proper mulching, and protect it from frost during early spring.",
-    "Cherry - Powdery Mildew": "Remove infected leaves, avoid overhead watering, ensure good air circulation, and apply fungicides containing sulfur or potassium bicarbonate.",
-    "Cherry - Healthy": "Your cherry tree is healthy! Continue providing proper care, including regular pruning, watering, and monitoring for pests or diseases.",
-    "Corn - Cercospora Leaf Spot (Gray Leaf Spot)": "Rotate crops annually, apply fungicides like strobilurins or triazoles, and ensure good field drainage and proper plant spacing.",
-    "Corn - Common Rust": "Apply fungicides containing propiconazole or azoxystrobin, plant resistant corn varieties, and avoid overhead irrigation.",
-    "Corn - Northern Leaf Blight": "Rotate crops, plant resistant varieties, and apply fungicides like mancozeb or strobilurin when symptoms first appear.",
-    "Corn - Healthy": "Your corn plant looks healthy! Continue to monitor for any signs of disease and ensure proper spacing for airflow.",
-    "Grape - Black Rot": "Remove mummified berries and infected leaves, prune for good air circulation, and apply fungicides such as myclobutanil or captan.",
-    "Grape - Esca (Black Measles)": "Prune and destroy infected parts, practice proper vineyard sanitation, and avoid mechanical injuries to the vines.",
-    "Grape - Leaf Blight (Isariopsis Leaf Spot)": "Remove and destroy infected leaves, apply fungicides containing copper, and ensure proper spacing for air circulation.",
-    "Grape - Healthy": "Your grapevine is healthy! Maintain regular pruning, proper watering, and monitoring for pests or diseases.",
-    "Orange - Huanglongbing (Citrus Greening)": "Unfortunately, there is no cure. Remove and destroy infected trees, control psyllid populations using insecticides, and plant disease-free certified saplings.",
-    "Peach - Bacterial Spot": "Apply copper-based bactericides, remove and destroy infected leaves and fruit, and plant resistant peach varieties.",
-    "Peach - Healthy": "Your peach tree looks healthy! Continue regular care, including pruning, fertilizing, and monitoring for pests or diseases.",
-    "Pepper (Bell) - Bacterial Spot": "Apply fixed copper sprays, avoid overhead irrigation, remove infected plants, and practice crop rotation.",
-    "Pepper (Bell) - Healthy": "Your bell pepper plant looks healthy! Ensure adequate sunlight, watering, and keep monitoring for any pests or diseases.",
-    "Potato - Early Blight": "Remove infected leaves, apply fungicides with active ingredients like chlorothalonil, and ensure proper spacing between plants.",
-    "Potato - Late Blight": "Apply fungicides like mancozeb or chlorothalonil, remove and destroy infected plants, and avoid overhead watering.",
-    "Potato - Healthy": "Your potato plant looks healthy! Maintain proper watering, ensure good soil drainage, and monitor for any signs of disease.",
-    "Raspberry - Healthy": "Your raspberry plant is healthy! Ensure proper support, regular pruning, and protect it from pests and harsh weather conditions.",
-    "Soybean - Healthy": "Your soybean crop is healthy! Monitor regularly for any signs of disease or pests, and maintain proper crop rotation.",
-    "Squash - Powdery Mildew": "Apply fungicides with sulfur or potassium bicarbonate, remove infected leaves, and ensure good air circulation.",
-    "Strawberry - Leaf Scorch": "Remove infected leaves, avoid overhead watering, and apply fungicides like captan or mancozeb.",
-    "Strawberry - Healthy": "Your strawberry plants are healthy! Maintain consistent watering, ensure good air circulation, and protect from frost.",
-    "Tomato - Bacterial Spot": "Remove infected leaves, apply fixed copper sprays, and avoid overhead irrigation. Ensure proper plant spacing.",
-    "Tomato - Early Blight": "Remove infected leaves, apply fungicides containing chlorothalonil or copper, and mulch around plants to prevent soil splashing.",
-    "Tomato - Late Blight": "Apply fungicides like chlorothalonil or mancozeb, remove infected plants, and ensure proper spacing for airflow.",
-    "Tomato - Leaf Mold": "Remove infected leaves, ensure proper air circulation, and apply fungicides containing chlorothalonil or copper.",
-    "Tomato - Septoria Leaf Spot": "Remove and destroy infected leaves, apply fungicides like mancozeb, and avoid overhead watering.",
-    "Tomato - Spider Mites (Two-Spotted Spider Mite)": "Spray the undersides of leaves with water, apply horticultural oils or insecticidal soaps, and maintain humidity around plants.",
-    "Tomato - Target Spot": "Remove infected leaves, apply fungicides like chlorothalonil, and ensure proper spacing between plants for air circulation.",
-    "Tomato - Tomato Yellow Leaf Curl Virus": "Remove infected plants, control whitefly populations with insecticides, and plant resistant tomato varieties.",
-    "Tomato - Tomato Mosaic Virus": "Remove infected plants, sterilize tools, and avoid handling plants when wet.",
-    "Tomato - Healthy": "Your tomato plant is healthy! Maintain regular watering, ensure adequate sunlight, and monitor for pests or diseases."
-}
+    if not LAZY_STARTUP:
+        raise ValueError("Missing OPENWEATHER_API_KEY environment variable. Set it in Hugging Face Spaces Secrets.")
+    logger.error("Missing OPENWEATHER_API_KEY environment variable; weather lookups will fail.")
+
+# Offline city gazetteer (see city_index.py) and the pooled, cached OpenWeatherMap client
+city_index = CityIndex.open()
+weather_service = WeatherService(OWM_API_KEY, gazetteer=city_index)
+
+# Remote city suggestions only fire once typing pauses on a prefix the local index misses
+suggestion_debouncer = Debouncer(delay=float(os.getenv("PLANTDOCTOR_SUGGEST_DEBOUNCE_MS", "350")) / 1000.0)
+REMOTE_SUGGEST_MIN_CHARS = 3
 
-# 🌐 Detect location using IP address
+# Disease diagnosis model (.h5 for Keras, or an exported .tflite/.onnx variant), labels,
+# micro-batching inference server (or a pool of worker processes) and prediction cache
+BATCH_MAX_SIZE = int(os.getenv("PLANTDOCTOR_BATCH_MAX_SIZE", "16"))
+WORKERS = int(os.getenv("PLANTDOCTOR_WORKERS", "0"))
+runtime = DiagnosisRuntime(
+    model_path=os.getenv("PLANTDOCTOR_MODEL_PATH", "attached_assets/mobilenetv2.h5"),
+    labels_path="class_labels.json",
+    uint8_input=os.getenv("PLANTDOCTOR_UINT8_INPUT", "0").lower() in ("1", "true", "yes"),
+    batch_max_size=BATCH_MAX_SIZE,
+    batch_max_wait_ms=float(os.getenv("PLANTDOCTOR_BATCH_MAX_WAIT_MS", "10")),
+    cache_options={
+        "max_entries": int(os.getenv("PLANTDOCTOR_CACHE_SIZE", "1024")),
+        "ttl_seconds": float(os.getenv("PLANTDOCTOR_CACHE_TTL", "3600")),
+        "disk_path": os.getenv("PLANTDOCTOR_CACHE_DB") or None,
+        "near_duplicate_distance": int(os.getenv("PLANTDOCTOR_CACHE_NEAR_DUP", "0")),
+    },
+    workers=WORKERS,
+    worker_options={
+        "threads_per_worker": int(os.getenv("PLANTDOCTOR_WORKER_THREADS", "0")) or None,
+        "slots": int(os.getenv("PLANTDOCTOR_WORKER_SLOTS", "4")),
+        "queue_timeout": float(os.getenv("PLANTDOCTOR_WORKER_QUEUE_TIMEOUT", "5")),
+    },
+    result_timeout=float(os.getenv("PLANTDOCTOR_RESULT_TIMEOUT", "60")),
+    treatments=DEMO_TREATMENTS,
+    min_confidence=float(os.getenv("PLANTDOCTOR_MIN_CONFIDENCE", "0")),
+    # Optional cascade: a small first-stage model answers confident images on its own
+    load_options={
+        "first_stage": os.getenv("PLANTDOCTOR_CASCADE_MODEL") or None,
+        "cascade_threshold": float(os.getenv("PLANTDOCTOR_CASCADE_THRESHOLD", "0.9")),
+    },
+).start(background=LAZY_STARTUP)
+
+# How long a diagnosis request waits for a model that is still warming up
+WARMUP_WAIT_SECONDS = float(os.getenv("PLANTDOCTOR_WARMUP_WAIT", "30"))
+
+DEFAULT_CITY = os.getenv("PLANTDOCTOR_DEFAULT_CITY", "Chennai")
+
+# 🌐 Detect location using IP address (looked up once, with a strict timeout)
+@lru_cache(maxsize=1)
 def detect_location_from_ip():
     try:
         IPINFO_TOKEN = os.getenv("IPINFO_TOKEN")
-        url = f"https://ipinfo.io/json?token={IPINFO_TOKEN}"
-        response = requests.get(url).json()
+        url = f"{os.getenv('IPINFO_URL', 'https://ipinfo.io/json')}?token={IPINFO_TOKEN}"
+        with metrics.http_call("ipinfo"):
+            response = requests.get(url, timeout=(1.0, 2.0)).json()
         city = response.get("city", "")
         region = response.get("region", "")
         if city and region:
@@ -76,77 +87,119 @@ def detect_location_from_ip():
         elif city:
             return city
         else:
-            return "Chennai"  # fallback
+            return DEFAULT_CITY  # fallback
     except Exception as e:
-        return "Chennai"  # fallback
+        return DEFAULT_CITY  # fallback
+
+if LAZY_STARTUP:
+    # Resolve the location in the background so the first page load finds it cached
+    threading.Thread(target=detect_location_from_ip, name="ip-location", daemon=True).start()
+
+# 🌤️ Fill in the detected location and its weather when the page loads
+def load_location_and_weather():
+    location = detect_location_from_ip()
+    return location, get_weather_and_aqi(location)
 
 # 🌍 Get coordinates for a city
 def get_coordinates(location):
-    url = f"http://api.openweathermap.org/geo/1.0/direct?q={location}&limit=1&appid={OWM_API_KEY}"
-    response = requests.get(url).json()
-    if not response:
-        return None, None
-    return response[0]["lat"], response[0]["lon"]
+    return weather_service.get_coordinates(location)
 
 # 🌦 Get weather & AQI info
 def get_weather_and_aqi(location):
-    lat, lon = get_coordinates(location)
-    if lat is None:
-        return "❌ Invalid Location"
-
-    weather_url = f"http://api.openweathermap.org/data/2.5/weather?lat={lat}&lon={lon}&appid={OWM_API_KEY}&units=metric"
-    aqi_url = f"http://api.openweathermap.org/data/2.5/air_pollution?lat={lat}&lon={lon}&appid={OWM_API_KEY}"
-
-    weather_res = requests.get(weather_url).json()
-    aqi_res = requests.get(aqi_url).json()
-
-    if "main" not in weather_res or "list" not in aqi_res:
-        return "❌ Weather/AQI data unavailable"
-
-    aqi_level = aqi_res["list"][0]["main"]["aqi"]
-    aqi_labels = ["🟢 Good", "🟡 Fair", "🟠 Moderate", "🔴 Poor", "🟣 Hazardous"]
-
-    return (
-        f"🌍 {location} | "
-        f"🌡️ {weather_res['main']['temp']}°C | "
-        f"💧 {weather_res['main']['humidity']}% | "
-        f"🌫️ {aqi_labels[aqi_level - 1]} ({aqi_level})"
-    )
+    return weather_service.get_weather_and_aqi(location)
 
 # 🔍 Get city suggestions dynamically
-def get_city_suggestions(query):
+def get_city_suggestions(query, request: gr.Request = None):
     if not query:
         return [], gr.update(visible=False)
-    url = f"http://api.openweathermap.org/geo/1.0/direct?q={query}&limit=5&appid={OWM_API_KEY}"
-    response = requests.get(url).json()
-    if not response:
+    choices = city_index.suggest(query) if city_index is not None else []
+    if not choices and len(query.strip()) >= REMOTE_SUGGEST_MIN_CHARS:
+        session = request.session_hash if request is not None else None
+        if not suggestion_debouncer.settle(session):
+            # A newer keystroke superseded this one; leave the dropdown as it is
+            return gr.update(), gr.update()
+        choices = weather_service.suggest_cities(query)
+    if not choices:
         return [], gr.update(visible=False)
-    choices = [f"{city['name']}, {city.get('country', '')}" for city in response]
     return choices, gr.update(choices=choices, visible=True)
 
+# Tiled mode: overlapping tiles at (up to) native resolution, for large field photos
+TILE_OPTIONS = {
+    "overlap": float(os.getenv("PLANTDOCTOR_TILE_OVERLAP", "0.25")),
+    "max_tiles": int(os.getenv("PLANTDOCTOR_MAX_TILES", "64")),
+    "min_green": float(os.getenv("PLANTDOCTOR_TILE_MIN_GREEN", "0.15")),
+    "aggregate": os.getenv("PLANTDOCTOR_TILE_AGGREGATE", "mean"),
+}
+
+def format_diagnosis(disease_label, confidence, details=""):
+    confidence_pct = f"{confidence:.1f}%"
+
+    # Below the confidence threshold the model abstains instead of prescribing a treatment
+    if confidence < runtime.min_confidence:
+        result = f"### 🤔 Uncertain diagnosis (best guess: {disease_label.replace('_', ' ')})\n"
+        result += f"**Confidence:** {confidence_pct}\n\n"
+        if details:
+            result += f"{details}\n\n"
+        result += "Try a sharper, well-lit close-up of a single affected leaf."
+        return result
+
+    treatment = runtime.catalog.treatment(disease_label)
+    
+    result = f"### 🌿 Diagnosis: {disease_label.replace('_', ' ')}\n"
+    result += f"**Confidence:** {confidence_pct}\n\n"
+    if details:
+        result += f"{details}\n\n"
+    result += f"### 🛠 Recommended Treatment:\n{treatment}"
+    return result
+
 # Function to diagnose plant disease
 def diagnose_image(image):
     if image is None:
         return "⚠️ Please upload an image for diagnosis."
     
+    if not runtime.wait_ready(timeout=WARMUP_WAIT_SECONDS):
+        return "⏳ The diagnosis model is still warming up. Please try again in a few seconds."
+
     try:
-        img_array = np.array(image)
-        preprocessed_img = preprocess_image(img_array)
-        disease_label, confidence = predict_disease(model, preprocessed_img, class_labels)
-        confidence_pct = f"{confidence:.1f}%"
-        
-        treatment = DEMO_TREATMENTS.get(
-            disease_label, 
-            "No specific treatment information available. Consult with an agricultural expert."
-        )
-        
-        result = f"### 🌿 Diagnosis: {disease_label.replace('_', ' ')}\n"
-        result += f"**Confidence:** {confidence_pct}\n\n"
-        result += f"### 🛠 Recommended Treatment:\n{treatment}"
-        return result
+        with metrics.STAGE_SECONDS.time(stage="decode"):
+            img_array = np.array(image)
+        disease_label, confidence = runtime.diagnose(img_array)
+        return format_diagnosis(disease_label, confidence)
+    except TimeoutError:
+        return "⏳ The server is busy. Please try again in a moment."
     except Exception as e:
         return f"❌ Error during diagnosis: {e}"
 
+# 🔍 Tiled diagnosis: returns the result text and a heatmap overlay (or None)
+def diagnose_image_tiled(image):
+    if image is None:
+        return "⚠️ Please upload an image for diagnosis.", None
+
+    if not runtime.wait_ready(timeout=WARMUP_WAIT_SECONDS):
+        return "⏳ The diagnosis model is still warming up. Please try again in a few seconds.", None
+
+    try:
+        img_array = np.asarray(image)
+        result = runtime.diagnose_tiled(img_array, **TILE_OPTIONS)
+        details = (
+            f"**Tiles:** {result['tiles_aggregated']} leaf tiles aggregated "
+            f"({result['tiles_kept']} of {result['tiles']} analysed, {result['tile_size']}px)"
+        )
+        heatmap = render_heatmap(img_array, result["heatmap"])
+        return format_diagnosis(result["label"], result["confidence"], details), heatmap
+    except TimeoutError:
+        return "⏳ The server is busy. Please try again in a moment.", None
+    except Exception as e:
+        return f"❌ Error during diagnosis: {e}", None
+
+def run_diagnosis(image, tiled):
+    with metrics.span("diagnose", tiled=bool(tiled)):
+        if tiled:
+            result, heatmap = diagnose_image_tiled(image)
+        else:
+            result, heatmap = diagnose_image(image), None
+    return result, gr.update(value=heatmap, visible=heatmap is not None)
+
 # Build Gradio UI
 with gr.Blocks(css="footer {visibility: hidden}") as app:
     gr.Markdown("# 🌱 AI-Powered Agricultural Assistant")
@@ -156,19 +209,22 @@ with gr.Blocks(css="footer {visibility: hidden}") as app:
     with gr.Row():
         with gr.Column(scale=1):
             gr.Markdown("### 🌤️ Weather & Air Quality")
-            default_city = detect_location_from_ip()
+            default_city = DEFAULT_CITY if LAZY_STARTUP else detect_location_from_ip()
             location_input = gr.Textbox(value=default_city, label="🌍 Enter or auto-detected location")
             suggestions = gr.Dropdown(choices=[], interactive=True, visible=False, label="📍 Suggestions")
             weather_display = gr.HTML()
             refresh_button = gr.Button("🔄 Refresh Weather")
 
-            # Auto-load weather on launch
-            app.load(fn=get_weather_and_aqi, inputs=location_input, outputs=weather_display)
+            # Auto-detect location and load weather on launch
+            app.load(fn=load_location_and_weather, inputs=None, outputs=[location_input, weather_display])
 
-            # Search functionality
-            location_input.change(fn=get_city_suggestions, inputs=location_input, outputs=[suggestions, suggestions])
+            # Search functionality (typing only, not programmatic updates)
+            location_input.input(
+                fn=get_city_suggestions, inputs=location_input, outputs=[suggestions, suggestions],
+                trigger_mode="always_last", concurrency_limit=None,
+            )
             suggestions.change(fn=get_weather_and_aqi, inputs=suggestions, outputs=weather_display)
-            refresh_button.click(fn=get_weather_and_aqi, inputs=location_input, outputs=weather_display)
+            refresh_button.click(fn=get_weather_and_aqi, inputs=location_input, outputs=weather_display, api_name="weather")
 
     gr.Markdown("---")
 
@@ -177,10 +233,16 @@ with gr.Blocks(css="footer {visibility: hidden}") as app:
         with gr.Column(scale=1):
             gr.Markdown("## 📸 Upload Image for Diagnosis")
             image_input = gr.Image(type="numpy", label="Upload Leaf Image")
+            tiled_input = gr.Checkbox(value=False, label="🧩 Tiled analysis (high-resolution / multi-leaf photos)")
             diagnose_button = gr.Button("🔍 Diagnose", variant="primary")
             diagnosis_output = gr.Markdown(label="Diagnosis Results")
+            heatmap_output = gr.Image(label="🗺️ Disease heatmap", visible=False, interactive=False)
 
-            diagnose_button.click(fn=diagnose_image, inputs=[image_input], outputs=[diagnosis_output])
+            # Allow enough concurrent diagnoses for the inference server (or every worker) to form batches
+            diagnose_button.click(
+                fn=run_diagnosis, inputs=[image_input, tiled_input], outputs=[diagnosis_output, heatmap_output],
+                concurrency_limit=BATCH_MAX_SIZE * max(1, WORKERS), api_name="diagnose",
+            )
 
     gr.Markdown("---")
 
@@ -191,10 +253,11 @@ with gr.Blocks(css="footer {visibility: hidden}") as app:
             chatbot = gr.Chatbot(height=400)
             msg = gr.Textbox(placeholder="Ask a question about agriculture...", label="Your Question")
             clear = gr.Button("🗑 Clear Chat")
-            chat_history_state = gr.State([])
 
-            msg.submit(fn=groq_chatbot, inputs=[msg, chat_history_state], outputs=[chatbot, msg])
-            clear.click(lambda: ([], ""), None, [chatbot, msg], queue=False)
+            # The chat display round-trips through the browser; the conversation
+            # memory sent to the LLM is kept per session in chat_app.chat_store
+            msg.submit(fn=groq_chatbot_stream, inputs=[msg, chatbot], outputs=[chatbot, msg], api_name="chat")
+            clear.click(clear_chat, None, [chatbot, msg], queue=False)
 
     gr.Markdown("---")
     gr.Markdown("### ℹ️ About this Application")
@@ -0,0 +1,295 @@
+import os
+import io
+import csv
+import json
+import tarfile
+import argparse
+import logging
+from collections import deque
+from functools import partial
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+
+import numpy as np
+
+from model_loader import load_model, load_image_file, preprocess_image, predict_batch, model_input_dtype
+from treatments import DEMO_TREATMENTS
+from label_catalog import LabelCatalog
+
+logger = logging.getLogger(__name__)
+
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".bmp", ".webp")
+CSV_FIELDS = ["path", "label", "confidence", "top_k", "treatment_key", "error"]
+
+def iter_directory(folder):
+    """
+    Stream image paths from a directory tree without listing it all up front
+
+    Yields:
+        Tuples of (path, path)
+    """
+    for root, dirs, files in os.walk(folder):
+        dirs.sort()
+        for name in sorted(files):
+            if name.lower().endswith(IMAGE_EXTENSIONS):
+                path = os.path.join(root, name)
+                yield path, path
+
+def iter_tar(archive):
+    """
+    Stream image members from a (possibly compressed) tar archive in a single pass
+
+    Yields:
+        Tuples of (member name, raw file bytes)
+    """
+    with tarfile.open(archive, "r|*") as tar:
+        for member in tar:
+            if member.isfile() and member.name.lower().endswith(IMAGE_EXTENSIONS):
+                f = tar.extractfile(member)
+                if f is not None:
+                    yield member.name, f.read()
+
+def iter_sources(source):
+    """
+    Stream (name, payload) pairs from a directory or a tar archive
+    """
+    if os.path.isdir(source):
+        return iter_directory(source)
+    if tarfile.is_tarfile(source):
+        return iter_tar(source)
+    raise ValueError(f"{source} is neither a directory nor a tar archive")
+
+def decode_and_preprocess(payload, dtype=np.float32):
+    """
+    Decode one image (path or raw bytes) and preprocess it for the model
+
+    Runs inside the thread/process pool, so it never raises: decode errors
+    are returned as strings and reported in the output file.
+
+    Returns:
+        Tuple of (preprocessed (224, 224, 3) array or None, error message or None)
+    """
+    try:
+        source = io.BytesIO(payload) if isinstance(payload, bytes) else payload
+        return preprocess_image(load_image_file(source), dtype=dtype)[0], None
+    except Exception as e:
+        return None, str(e)
+
+def top_k_predictions(probabilities, catalog, k=3):
+    """
+    Extract the k most likely labels for each row of a probability batch
+
+    Args:
+        probabilities: Array of shape (N, num_classes)
+        catalog: LabelCatalog of the model's classes
+        k: Number of candidates per image
+
+    Returns:
+        List (one per row) of ([(label, confidence percentage), ...] in
+        descending order, abstained flag)
+    """
+    top = catalog.top_k(probabilities, k)
+    return [
+        (list(zip(labels, confidences)), abstained)
+        for labels, confidences, abstained in zip(top.labels.tolist(), top.confidences.tolist(), top.abstained.tolist())
+    ]
+
+def _repair_tail(path, block_size=64 * 1024):
+    """
+    Drop a partially written last line (JSONL record or CSV row) left behind
+    by an interrupted run, so the next run's first record starts on a fresh line
+
+    Only the tail of the file is read, a block at a time backwards from the end.
+    """
+    with open(path, "rb+") as f:
+        end = f.seek(0, os.SEEK_END)
+        if end == 0:
+            return
+        f.seek(end - 1)
+        if f.read(1) == b"\n":
+            return
+        position = end
+        while position > 0:
+            start = max(0, position - block_size)
+            f.seek(start)
+            newline = f.read(position - start).rfind(b"\n")
+            if newline != -1:
+                f.truncate(start + newline + 1)
+                return
+            position = start
+        f.truncate(0)
+
+def load_completed(output_path, fmt):
+    """
+    Collect the paths already present in an existing output file
+
+    Returns:
+        Set of source names to skip when resuming
+    """
+    if not os.path.exists(output_path):
+        return set()
+    completed = set()
+    _repair_tail(output_path)
+    if fmt == "jsonl":
+        with open(output_path, encoding="utf-8") as f:
+            for line in f:
+                try:
+                    completed.add(json.loads(line)["path"])
+                except (ValueError, KeyError):
+                    continue
+    else:
+        with open(output_path, newline="", encoding="utf-8") as f:
+            for row in csv.DictReader(f):
+                if row.get("path"):
+                    completed.add(row["path"])
+    return completed
+
+class ResultWriter:
+    """
+    Append-only JSONL/CSV writer that flushes after every batch
+    """
+
+    def __init__(self, output_path, fmt):
+        self.fmt = fmt
+        new_file = not os.path.exists(output_path) or os.path.getsize(output_path) == 0
+        self._file = open(output_path, "a", newline="", encoding="utf-8")
+        self._csv = None
+        if fmt == "csv":
+            self._csv = csv.DictWriter(self._file, fieldnames=CSV_FIELDS)
+            if new_file:
+                self._csv.writeheader()
+
+    def write(self, rows):
+        for row in rows:
+            if self._csv is not None:
+                self._csv.writerow({**row, "top_k": json.dumps(row["top_k"])})
+            else:
+                self._file.write(json.dumps(row) + "\n")
+        self._file.flush()
+
+    def close(self):
+        self._file.close()
+
+def _result_row(name, prediction=None, error=None):
+    if error is not None:
+        return {"path": name, "label": None, "confidence": None, "top_k": [], "treatment_key": None, "error": error}
+    candidates, abstained = prediction
+    label, confidence = candidates[0]
+    # An abstaining row keeps its candidates but gets no label or treatment
+    return {
+        "path": name,
+        "label": None if abstained else label,
+        "confidence": round(confidence, 2),
+        "top_k": [{"label": l, "confidence": round(c, 2)} for l, c in candidates],
+        "treatment_key": None if abstained else label,
+        "error": None,
+    }
+
+def diagnose_stream(model, catalog, items, writer, batch_size=32, workers=4, executor="thread", top_k=3):
+    """
+    Diagnose a stream of images with parallel decode and batched inference
+
+    At most about ``3 * batch_size + 2 * workers`` decoded images are in
+    memory at any time (the bounded decode read-ahead, the batch being
+    filled and the reused model input buffer), whatever the size of the input.
+
+    Args:
+        model: Loaded model or RuntimeBackend
+        catalog: LabelCatalog of the model's classes
+        items: Iterable of (name, path or bytes) pairs
+        writer: ResultWriter receiving one row per image
+        batch_size: Images per forward pass
+        workers: Decode/preprocess pool size
+        executor: "thread" or "process"
+        top_k: Candidates reported per image
+
+    Returns:
+        Number of images written
+    """
+    pool_class = ProcessPoolExecutor if executor == "process" else ThreadPoolExecutor
+    # Enough read-ahead to fill the next batch while keeping every decoder busy
+    max_in_flight = batch_size + 2 * workers
+    decode = partial(decode_and_preprocess, dtype=model_input_dtype(model))
+    # Model input buffer reused for every batch
+    buffer = None
+    written = 0
+    pending = deque()
+    batch_names, batch_images = [], []
+
+    def flush_batch():
+        nonlocal written, buffer
+        if not batch_images:
+            return
+        if buffer is None:
+            buffer = np.empty((batch_size,) + batch_images[0].shape, dtype=batch_images[0].dtype)
+        batch = np.stack(batch_images, out=buffer[:len(batch_images)])
+        probabilities = predict_batch(model, batch)
+        predictions = top_k_predictions(probabilities, catalog, top_k)
+        writer.write([_result_row(n, p) for n, p in zip(batch_names, predictions)])
+        written += len(batch_names)
+        batch_names.clear()
+        batch_images.clear()
+
+    def drain_one():
+        nonlocal written
+        name, future = pending.popleft()
+        image, error = future.result()
+        if error is not None:
+            writer.write([_result_row(name, error=error)])
+            written += 1
+            return
+        batch_names.append(name)
+        batch_images.append(image)
+        if len(batch_images) >= batch_size:
+            flush_batch()
+
+    with pool_class(max_workers=workers) as pool:
+        for name, payload in items:
+            pending.append((name, pool.submit(decode, payload)))
+            # Bounded read-ahead: wait for the oldest decode before submitting more
+            if len(pending) >= max_in_flight:
+                drain_one()
+        while pending:
+            drain_one()
+    flush_batch()
+    return written
+
+def main(argv=None):
+    logging.basicConfig(level=os.getenv("LOG_LEVEL", "INFO").upper())
+    parser = argparse.ArgumentParser(description="Diagnose a folder or tar archive of leaf images.")
+    parser.add_argument("source", help="Directory of images or tar archive (.tar, .tar.gz, ...)")
+    parser.add_argument("-o", "--output", required=True, help="Output .jsonl or .csv file (appended to on resume)")
+    parser.add_argument("--format", choices=("jsonl", "csv"), help="Output format (default: from the output extension)")
+    parser.add_argument("--model", default=os.getenv("PLANTDOCTOR_MODEL_PATH", "attached_assets/mobilenetv2.h5"))
+    parser.add_argument("--labels", default="class_labels.json")
+    parser.add_argument("--batch-size", type=int, default=32)
+    parser.add_argument("--workers", type=int, default=min(8, os.cpu_count() or 4),
+                        help="Decode/preprocess workers (default: CPU count, at most 8)")
+    parser.add_argument("--executor", choices=("thread", "process"), default="thread")
+    parser.add_argument("--top-k", type=int, default=3)
+    parser.add_argument("--min-confidence", type=float, default=0.0,
+                        help="Leave the label empty when the top confidence (percent) is below this")
+    parser.add_argument("--no-resume", action="store_true", help="Do not skip files already in the output")
+    args = parser.parse_args(argv)
+
+    fmt = args.format or ("csv" if args.output.lower().endswith(".csv") else "jsonl")
+    completed = set() if args.no_resume else load_completed(args.output, fmt)
+    if completed:
+        print(f"⏭️ Resuming: skipping {len(completed)} images already in {args.output}")
+
+    catalog = LabelCatalog.load(args.labels, DEMO_TREATMENTS, args.min_confidence)
+    model = load_model(args.model)
+
+    items = ((name, payload) for name, payload in iter_sources(args.source) if name not in completed)
+    writer = ResultWriter(args.output, fmt)
+    try:
+        written = diagnose_stream(
+            model, catalog, items, writer,
+            batch_size=args.batch_size, workers=args.workers,
+            executor=args.executor, top_k=args.top_k,
+        )
+    finally:
+        writer.close()
+    print(f"✅ Diagnosed {written} images → {args.output}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,68 @@
+import os
+import sys
+import time
+import argparse
+
+import cv2
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from model_loader import preprocess_image, preprocess_batch
+
+def legacy_preprocess_image(image, target_size=(224, 224)):
+    """
+    The original single-image pipeline, kept here as the benchmark baseline
+    """
+    if len(image.shape) == 3 and image.shape[2] == 3:
+        image = cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
+    image_resized = cv2.resize(image, target_size)
+    image_normalized = image_resized.astype(np.float32) / 255.0
+    return np.expand_dims(image_normalized, axis=0)
+
+def _time_per_image(fn, images, repeat):
+    fn()  # warm-up
+    started = time.perf_counter()
+    for _ in range(repeat):
+        fn()
+    return (time.perf_counter() - started) / (repeat * len(images)) * 1000.0
+
+def run(sizes, batch_size, repeat):
+    """
+    Time each preprocessing variant per image, for every input size
+
+    Returns:
+        List of (size, variant, milliseconds per image) tuples
+    """
+    rng = np.random.default_rng(0)
+    results = []
+    for height, width in sizes:
+        images = [rng.integers(0, 256, (height, width, 3), dtype=np.uint8) for _ in range(batch_size)]
+        float_buffer = np.empty((batch_size, 224, 224, 3), dtype=np.float32)
+        uint8_buffer = np.empty((batch_size, 224, 224, 3), dtype=np.uint8)
+
+        variants = {
+            "legacy preprocess_image + concatenate": lambda: np.concatenate([legacy_preprocess_image(i) for i in images]),
+            "preprocess_image + concatenate": lambda: np.concatenate([preprocess_image(i) for i in images]),
+            "preprocess_batch (float32, reused buffer)": lambda: preprocess_batch(images, out=float_buffer),
+            "preprocess_batch (uint8, reused buffer)": lambda: preprocess_batch(images, out=uint8_buffer, dtype=np.uint8),
+        }
+        for name, fn in variants.items():
+            results.append((f"{height}x{width}", name, _time_per_image(fn, images, repeat)))
+    return results
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Micro-benchmark of the image preprocessing pipeline.")
+    parser.add_argument("--sizes", nargs="+", default=["256x256", "720x1280", "3024x4032"],
+                        help="Input sizes as HEIGHTxWIDTH")
+    parser.add_argument("--batch-size", type=int, default=16)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args(argv)
+
+    sizes = [tuple(int(v) for v in size.lower().split("x")) for size in args.sizes]
+    print(f"{'input':<12} {'variant':<45} {'ms/img':>8}")
+    for size, name, ms in run(sizes, args.batch_size, args.repeat):
+        print(f"{size:<12} {name:<45} {ms:>8.3f}")
+
+if __name__ == "__main__":
+    main()
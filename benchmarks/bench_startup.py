@@ -0,0 +1,102 @@
+import os
+import sys
+import json
+import argparse
+import subprocess
+
+from stubs import StubServer, stub_environment
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Heavy third-party imports, each timed in its own fresh interpreter
+MODULES = ["numpy", "cv2", "requests", "gradio", "groq", "tensorflow"]
+
+_IMPORT_SNIPPET = """
+import time, json
+started = time.perf_counter()
+import {module}
+print(json.dumps({{"seconds": time.perf_counter() - started}}))
+"""
+
+_APP_SNIPPET = """
+import time, json
+started = time.perf_counter()
+import app
+imported = time.perf_counter() - started
+app.runtime.wait_ready()
+status = app.runtime.status()
+print(json.dumps({"import_app": imported, "ready": time.perf_counter() - started,
+                  "error": status["error"], **status["timings_s"]}))
+"""
+
+def _run(snippet, env=None):
+    result = subprocess.run(
+        [sys.executable, "-c", snippet], cwd=REPO_ROOT, capture_output=True, text=True,
+        env={**os.environ, **(env or {})},
+    )
+    if result.returncode != 0:
+        raise RuntimeError(result.stderr.strip().splitlines()[-1] if result.stderr.strip() else "failed")
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+def run(modules=MODULES, repeat=1):
+    """
+    Time cold imports and app startup, each in a fresh subprocess
+
+    The app is pointed at local weather/ipinfo and chat stubs, so startup
+    never waits on the network.
+
+    Returns:
+        Dictionary with per-module import seconds and, for lazy and eager
+        startup, seconds until ``import app`` returns and until the model is
+        warm, plus the model load and first inference phases. A mode whose
+        startup fails reports only its ``error``.
+    """
+    results = {"imports": {}, "app": {}}
+    for module in modules:
+        try:
+            results["imports"][module] = min(_run(_IMPORT_SNIPPET.format(module=module))["seconds"] for _ in range(repeat))
+        except RuntimeError as e:
+            results["imports"][module] = None
+            print(f"⚠️ import {module} failed: {e}", file=sys.stderr)
+
+    weather_stub = StubServer("weather", latency_ms=0.0).start()
+    chat_stub = StubServer("chat", latency_ms=0.0).start()
+    env = stub_environment(weather_stub, chat_stub)
+    try:
+        for mode, lazy in (("lazy", "1"), ("eager", "0")):
+            try:
+                runs = [_run(_APP_SNIPPET, {**env, "PLANTDOCTOR_LAZY_STARTUP": lazy}) for _ in range(repeat)]
+                results["app"][mode] = min(runs, key=lambda r: r["ready"])
+            except (RuntimeError, ValueError) as e:
+                results["app"][mode] = {"error": str(e)}
+                print(f"⚠️ {mode} startup failed: {e}", file=sys.stderr)
+    finally:
+        weather_stub.stop()
+        chat_stub.stop()
+    return results
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Break down cold-start time: imports, model load, first inference.")
+    parser.add_argument("--modules", nargs="*", default=MODULES)
+    parser.add_argument("--repeat", type=int, default=1, help="Runs per measurement (best is reported)")
+    parser.add_argument("--json", action="store_true", help="Print the raw results as JSON")
+    args = parser.parse_args(argv)
+
+    results = run(args.modules, args.repeat)
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+
+    print(f"{'import':<24} {'seconds':>8}")
+    for module, seconds in results["imports"].items():
+        print(f"{module:<24} {'n/a' if seconds is None else f'{seconds:8.3f}':>8}")
+    print()
+    print(f"{'startup':<8} {'import app':>10} {'model load':>10} {'1st infer':>10} {'ready':>8}")
+    for mode, r in results["app"].items():
+        nan = float("nan")
+        print(f"{mode:<8} {r.get('import_app', nan):>10.3f} {r.get('model_load', nan):>10.3f} "
+              f"{r.get('first_inference', nan):>10.3f} {r.get('ready', nan):>8.3f}"
+              + (f"  ❌ {r['error']}" if r["error"] else ""))
+
+if __name__ == "__main__":
+    main()
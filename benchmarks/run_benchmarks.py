@@ -0,0 +1,493 @@
+import os
+import sys
+import json
+import time
+import random
+import asyncio
+import argparse
+import platform
+import subprocess
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import requests
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_ROOT = os.path.dirname(BENCH_DIR)
+sys.path.insert(0, REPO_ROOT)
+
+from stubs import StubServer, stub_environment
+
+SUITES = ["preprocess", "predict", "diagnose", "weather", "chat", "load"]
+
+# Questions the local pre-filter cannot settle, so every chat mode reaches the (stub) LLM
+UNDECIDED_QUESTIONS = ["How often should I water?", "Why are the edges turning brown?", "What causes this problem?"]
+
+# Replies with which the app handlers report a failure (busy, still warming up,
+# model or upstream error, rejected question) instead of raising
+ERROR_PREFIXES = ("❌", "⏳", "⚠️", "Error:")
+
+
+class _EventLoopThread:
+    """
+    One long-lived event loop for all chat calls: the shared AsyncGroq
+    client's connection pool is bound to the loop it was first used on
+    """
+
+    def __init__(self):
+        self.loop = asyncio.new_event_loop()
+        threading.Thread(target=self.loop.run_forever, name="bench-loop", daemon=True).start()
+
+    def run(self, coroutine):
+        return asyncio.run_coroutine_threadsafe(coroutine, self.loop).result()
+
+
+_event_loop = None
+
+
+def run_async(coroutine):
+    global _event_loop
+    if _event_loop is None:
+        _event_loop = _EventLoopThread()
+    return _event_loop.run(coroutine)
+
+
+def _metric(value, unit, better="lower"):
+    return {"value": float(value), "unit": unit, "better": better}
+
+
+def latency_metrics(prefix, samples):
+    """
+    p50/p95/p99 and mean of a list of durations in seconds, as millisecond metrics
+    """
+    ms = np.asarray(samples, dtype=np.float64) * 1000.0
+    metrics = {f"{prefix}.p{q}_ms": _metric(np.percentile(ms, q), "ms") for q in (50, 95, 99)}
+    metrics[f"{prefix}.mean_ms"] = _metric(ms.mean(), "ms")
+    return metrics
+
+
+def _time(fn, repeat, warmup=1):
+    for _ in range(warmup):
+        fn()
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - started)
+    return samples
+
+
+def _checked(name, reply):
+    """
+    Pass a handler's reply through, raising if it is an error message
+
+    Raises:
+        RuntimeError, so failed calls count as errors instead of fast successes
+    """
+    if not isinstance(reply, str) or reply.lstrip().startswith(ERROR_PREFIXES):
+        raise RuntimeError(f"{name} failed: {reply!r}")
+    return reply
+
+
+def _random_image(rng, height, width):
+    return rng.integers(0, 256, (height, width, 3), dtype=np.uint8)
+
+
+def bench_preprocess(sizes, repeat):
+    """
+    preprocess_image latency and throughput per input size
+    """
+    from model_loader import preprocess_image
+
+    rng = np.random.default_rng(0)
+    metrics = {}
+    for height, width in sizes:
+        image = _random_image(rng, height, width)
+        samples = _time(lambda: preprocess_image(image), repeat)
+        name = f"preprocess.{height}x{width}"
+        metrics.update(latency_metrics(name, samples))
+        metrics[f"{name}.images_per_s"] = _metric(len(samples) / sum(samples), "images/s", "higher")
+    return metrics
+
+
+def bench_predict(model, class_labels, batch_sizes, repeat):
+    """
+    predict_disease latency percentiles per batch size
+    """
+    from model_loader import predict_disease, preprocess_batch, model_input_dtype
+
+    rng = np.random.default_rng(1)
+    dtype = model_input_dtype(model)
+    metrics = {}
+    for batch_size in batch_sizes:
+        batch = preprocess_batch([_random_image(rng, 224, 224) for _ in range(batch_size)], dtype=dtype)
+        samples = _time(lambda: predict_disease(model, batch, class_labels), repeat, warmup=2)
+        metrics.update(latency_metrics(f"predict.batch{batch_size}", samples))
+        metrics[f"predict.batch{batch_size}.images_per_s"] = _metric(
+            batch_size * len(samples) / sum(samples), "images/s", "higher"
+        )
+    return metrics
+
+
+def bench_diagnose(app, repeat, size):
+    """
+    End-to-end diagnose_image latency: fresh uploads, a repeated (cached)
+    upload and the tiled mode
+    """
+    rng = np.random.default_rng(2)
+    height, width = size
+    images = iter([_random_image(rng, height, width) for _ in range(repeat + 1)])
+    diagnose = lambda image: _checked("diagnose", app.diagnose_image(image))
+    metrics = latency_metrics("diagnose.uncached", _time(lambda: diagnose(next(images)), repeat))
+
+    image = _random_image(rng, height, width)
+    metrics.update(latency_metrics("diagnose.cached", _time(lambda: diagnose(image), repeat)))
+
+    tiled_repeat = max(1, repeat // 4)
+    tiled = lambda: _checked("diagnose_tiled", app.diagnose_image_tiled(image)[0])
+    metrics.update(latency_metrics("diagnose.tiled", _time(tiled, tiled_repeat)))
+    return metrics
+
+
+def bench_weather(app, repeat):
+    """
+    get_weather_and_aqi against the stub: uncached cities and a cached one
+    """
+    counter = iter(range(10 ** 9))
+    weather = lambda city: _checked("weather", app.get_weather_and_aqi(city))
+    metrics = latency_metrics("weather.uncached", _time(lambda: weather(f"Benchtown {next(counter)}"), repeat))
+    metrics.update(latency_metrics("weather.cached", _time(lambda: weather("Chennai"), repeat)))
+    return metrics
+
+
+class _NoAnswerCache:
+    """
+    Stand-in for chat_prefilter.SemanticAnswerCache that never stores or serves answers
+    """
+
+    def get(self, question):
+        return None
+
+    def put(self, question, answer):
+        pass
+
+
+def bench_chat(repeat):
+    """
+    Time to first token and total time of the streaming chatbot, per
+    relevance-check mode, with the answer cache bypassed
+    """
+    import chat_app
+
+    # Measure the LLM path, not the cache: every lookup misses, including exact
+    # repeats of a question answered in an earlier mode
+    chat_app.answer_cache = _NoAnswerCache()
+
+    async def ask(question, mode):
+        started = time.perf_counter()
+        first = None
+        async for history, _ in chat_app.groq_chatbot_stream(question, [], mode=mode):
+            if first is None and history[-1][1]:
+                first = time.perf_counter() - started
+        _checked(f"chat ({mode})", history[-1][1])
+        return first, time.perf_counter() - started
+
+    metrics = {}
+    for mode in chat_app._ANSWER_MODES:
+        runs = [run_async(ask(UNDECIDED_QUESTIONS[i % len(UNDECIDED_QUESTIONS)], mode)) for i in range(repeat)]
+        metrics.update(latency_metrics(f"chat.{mode}.first_token", [first for first, _ in runs]))
+        metrics.update(latency_metrics(f"chat.{mode}.total", [total for _, total in runs]))
+    return metrics
+
+
+class InProcessTarget:
+    """
+    Calls the Gradio event handlers directly (no HTTP or Gradio queue);
+    error replies raise, so the load test counts them as errors
+    """
+
+    def __init__(self, app, image):
+        self.app = app
+        self.image = image
+
+    def diagnose(self):
+        return _checked("diagnose", self.app.diagnose_image(self.image))
+
+    def weather(self):
+        city = random.choice(["Chennai", "Madurai", "Coimbatore", "Salem"])
+        return _checked("weather", self.app.get_weather_and_aqi(city))
+
+    def chat(self):
+        async def ask():
+            async for history, _ in self.app.groq_chatbot_stream(random.choice(UNDECIDED_QUESTIONS), []):
+                pass
+            return history[-1][1]
+        return _checked("chat", run_async(ask()))
+
+
+class GradioHTTPTarget:
+    """
+    Calls a running app through Gradio's HTTP API (/call/<api_name>), so
+    the load includes the web server and Gradio's queue
+    """
+
+    def __init__(self, url, image, timeout=60.0):
+        from PIL import Image
+        import io
+
+        self.url = url.rstrip("/")
+        self.timeout = timeout
+        self.session = requests.Session()
+        buffer = io.BytesIO()
+        Image.fromarray(image).save(buffer, format="PNG")
+        response = self.session.post(f"{self.url}/upload", files={"files": ("leaf.png", buffer.getvalue())})
+        response.raise_for_status()
+        self.image = {"path": response.json()[0], "meta": {"_type": "gradio.FileData"}}
+
+    def _call(self, api_name, data):
+        response = self.session.post(f"{self.url}/call/{api_name}", json={"data": data}, timeout=self.timeout)
+        response.raise_for_status()
+        event_id = response.json()["event_id"]
+        with self.session.get(f"{self.url}/call/{api_name}/{event_id}", stream=True, timeout=self.timeout) as stream:
+            event = None
+            for line in stream.iter_lines(decode_unicode=True):
+                if line.startswith("event:"):
+                    event = line.split(":", 1)[1].strip()
+                elif line.startswith("data:") and event in ("complete", "error"):
+                    if event == "error":
+                        raise RuntimeError(f"{api_name} failed: {line[5:].strip()}")
+                    return json.loads(line[5:])
+        raise RuntimeError(f"{api_name} stream ended without a result")
+
+    def diagnose(self):
+        return _checked("diagnose", self._call("diagnose", [self.image, False])[0])
+
+    def weather(self):
+        city = random.choice(["Chennai", "Madurai", "Coimbatore", "Salem"])
+        return _checked("weather", self._call("weather", [city])[0])
+
+    def chat(self):
+        return _checked("chat", self._call("chat", [random.choice(UNDECIDED_QUESTIONS), []])[0][-1][1])
+
+
+def load_test(target, rate, duration, mix, concurrency, seed=0):
+    """
+    Open-loop load test: requests arrive as a Poisson process at ``rate``
+    per second regardless of how fast earlier ones finish, and latency is
+    measured from the scheduled arrival time, so queueing is included
+
+    Args:
+        target: Object with diagnose/weather/chat methods
+        rate: Mean arrivals per second
+        duration: Seconds of arrivals
+        mix: Dictionary of endpoint -> weight
+        concurrency: Client threads
+
+    Returns:
+        Dictionary of metrics
+    """
+    rng = random.Random(seed)
+    endpoints, weights = zip(*mix.items())
+    arrivals, t = [], rng.expovariate(rate)
+    while t < duration:
+        arrivals.append((t, rng.choices(endpoints, weights)[0]))
+        t += rng.expovariate(rate)
+
+    latencies = {endpoint: [] for endpoint in endpoints}
+    errors = {endpoint: 0 for endpoint in endpoints}
+    lock = threading.Lock()
+
+    def run(scheduled, endpoint):
+        try:
+            getattr(target, endpoint)()
+            ok = True
+        except Exception:
+            ok = False
+        elapsed = time.perf_counter() - scheduled
+        with lock:
+            if ok:
+                latencies[endpoint].append(elapsed)
+            else:
+                errors[endpoint] += 1
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        for offset, endpoint in arrivals:
+            delay = started + offset - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            executor.submit(run, started + offset, endpoint)
+    wall = time.perf_counter() - started
+
+    metrics = {
+        "load.offered_rps": _metric(len(arrivals) / duration, "req/s", "higher"),
+        "load.throughput_rps": _metric(sum(len(v) for v in latencies.values()) / wall, "req/s", "higher"),
+        "load.error_rate": _metric(sum(errors.values()) / max(1, len(arrivals)), "ratio"),
+    }
+    for endpoint in endpoints:
+        if latencies[endpoint]:
+            metrics.update(latency_metrics(f"load.{endpoint}", latencies[endpoint]))
+        metrics[f"load.{endpoint}.errors"] = _metric(errors[endpoint], "requests")
+    return metrics
+
+
+def compare(metrics, baseline, tolerance):
+    """
+    Metrics that got worse than the baseline by more than ``tolerance`` (a fraction)
+
+    Returns:
+        List of human-readable regression descriptions
+    """
+    regressions = []
+    for name, metric in metrics.items():
+        reference = baseline.get(name)
+        if reference is None or reference["value"] == 0:
+            continue
+        change = (metric["value"] - reference["value"]) / abs(reference["value"])
+        if metric["better"] == "higher":
+            change = -change
+        if change > tolerance:
+            regressions.append(
+                f"{name}: {metric['value']:.3f} {metric['unit']} vs baseline {reference['value']:.3f} "
+                f"({change:+.0%} worse)"
+            )
+    return regressions
+
+
+def check_limits(metrics, limits):
+    """
+    Absolute limits such as "diagnose.uncached.p95_ms<250" or "load.throughput_rps>5"
+
+    Returns:
+        List of violated limits
+    """
+    violations = []
+    for limit in limits:
+        operator = "<" if "<" in limit else ">"
+        name, bound = limit.split(operator)
+        metric = metrics.get(name.strip())
+        if metric is None:
+            violations.append(f"{limit}: metric not measured")
+            continue
+        value, bound = metric["value"], float(bound)
+        if (operator == "<" and value >= bound) or (operator == ">" and value <= bound):
+            violations.append(f"{limit}: measured {value:.3f} {metric['unit']}")
+    return violations
+
+
+def _git_revision():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=REPO_ROOT, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except Exception:
+        return None
+
+
+def _parse_size(text):
+    height, width = (int(v) for v in text.lower().split("x"))
+    return height, width
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark and load-test suite (runs offline against local stubs).")
+    parser.add_argument("--suites", nargs="+", choices=SUITES, default=SUITES)
+    parser.add_argument("--model", default=os.getenv("PLANTDOCTOR_MODEL_PATH", "attached_assets/mobilenetv2.h5"))
+    parser.add_argument("--repeat", type=int, default=30, help="Timed iterations per measurement")
+    parser.add_argument("--sizes", nargs="+", default=["256x256", "720x1280", "3024x4032"],
+                        help="preprocess input sizes as HEIGHTxWIDTH")
+    parser.add_argument("--batch-sizes", nargs="+", type=int, default=[1, 4, 16])
+    parser.add_argument("--image-size", default="720x1280", help="Upload size for diagnose and load tests")
+    parser.add_argument("--upstream-latency-ms", type=float, default=50.0, help="Stub response delay")
+    parser.add_argument("--token-latency-ms", type=float, default=5.0, help="Stub delay between chat tokens")
+    parser.add_argument("--rate", type=float, default=5.0, help="Load test arrivals per second")
+    parser.add_argument("--duration", type=float, default=20.0, help="Load test seconds")
+    parser.add_argument("--concurrency", type=int, default=32, help="Load test client threads")
+    parser.add_argument("--mix", default="diagnose=0.6,weather=0.3,chat=0.1", help="Load test endpoint weights")
+    parser.add_argument("--url", help="Load-test a running app over HTTP instead of calling handlers in-process")
+    parser.add_argument("-o", "--output", help="Write results JSON here")
+    parser.add_argument("--baseline", help="Results JSON of an earlier run to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="Allowed regression vs baseline (fraction)")
+    parser.add_argument("--fail-if-not", dest="limits", action="append", default=[], metavar="METRIC<VALUE",
+                        help='Absolute limit that must hold, e.g. "diagnose.uncached.p95_ms<250" (repeatable)')
+    args = parser.parse_args(argv)
+
+    weather_stub = StubServer("weather", args.upstream_latency_ms).start()
+    chat_stub = StubServer("chat", args.upstream_latency_ms, args.token_latency_ms).start()
+    # Point the app at the stubs before it is imported
+    os.environ.update(stub_environment(weather_stub, chat_stub))
+    os.environ["PLANTDOCTOR_MODEL_PATH"] = args.model
+    os.environ.setdefault("IPINFO_TOKEN", "")
+    os.chdir(REPO_ROOT)
+
+    metrics = {}
+    if "preprocess" in args.suites:
+        print("⏱️ preprocess")
+        metrics.update(bench_preprocess([_parse_size(s) for s in args.sizes], args.repeat))
+    if "predict" in args.suites:
+        print("⏱️ predict")
+        from model_loader import load_model
+        with open("class_labels.json") as f:
+            class_labels = json.load(f)
+        metrics.update(bench_predict(load_model(args.model), class_labels, args.batch_sizes, args.repeat))
+
+    app = None
+    if set(args.suites) & {"diagnose", "weather", "chat"} or ("load" in args.suites and not args.url):
+        import app
+        app.runtime.wait_ready()
+        if app.runtime.error is not None:
+            raise SystemExit(f"❌ Model failed to load: {app.runtime.error}")
+    if "diagnose" in args.suites:
+        print("⏱️ diagnose")
+        metrics.update(bench_diagnose(app, args.repeat, _parse_size(args.image_size)))
+    if "weather" in args.suites:
+        print("⏱️ weather")
+        metrics.update(bench_weather(app, args.repeat))
+    if "chat" in args.suites:
+        print("⏱️ chat")
+        metrics.update(bench_chat(max(1, args.repeat // 3)))
+    if "load" in args.suites:
+        print(f"⏱️ load ({args.rate}/s for {args.duration}s{' against ' + args.url if args.url else ''})")
+        image = _random_image(np.random.default_rng(3), *_parse_size(args.image_size))
+        target = GradioHTTPTarget(args.url, image) if args.url else InProcessTarget(app, image)
+        mix = {k: float(v) for k, v in (part.split("=") for part in args.mix.split(","))}
+        metrics.update(load_test(target, args.rate, args.duration, mix, args.concurrency))
+
+    weather_stub.stop()
+    chat_stub.stop()
+
+    failures = []
+    if args.baseline:
+        with open(args.baseline) as f:
+            failures += compare(metrics, json.load(f)["metrics"], args.tolerance)
+    failures += check_limits(metrics, args.limits)
+
+    results = {
+        "meta": {
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+            "revision": _git_revision(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "model": args.model,
+            "options": {k: v for k, v in vars(args).items() if k not in ("output", "baseline", "limits")},
+        },
+        "metrics": metrics,
+        "failures": failures,
+    }
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+
+    print(f"\n{'metric':<44} {'value':>12}")
+    for name, metric in metrics.items():
+        print(f"{name:<44} {metric['value']:>12.3f} {metric['unit']}")
+    if failures:
+        print("\n❌ Thresholds crossed:")
+        for failure in failures:
+            print(f"  {failure}")
+        raise SystemExit(1)
+    print("\n✅ No thresholds crossed")
+
+if __name__ == "__main__":
+    main()
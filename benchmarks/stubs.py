@@ -0,0 +1,191 @@
+import json
+import time
+import zlib
+import argparse
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlparse, parse_qs
+
+STUB_ANSWER = (
+    "Remove and destroy infected leaves, improve air circulation around the plants, avoid overhead "
+    "watering and apply a copper-based fungicide every 7 to 10 days until symptoms stop spreading."
+)
+
+
+class _StubHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send_json(self, payload, status=200):
+        body = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _delay(self):
+        self.server.stub.record()
+        time.sleep(self.server.stub.latency)
+
+
+class _WeatherHandler(_StubHandler):
+    """
+    OpenWeatherMap endpoints used by weather_service.py, plus the ipinfo
+    lookup app.py uses to detect the location
+    """
+
+    def do_GET(self):
+        self._delay()
+        url = urlparse(self.path)
+        params = {k: v[0] for k, v in parse_qs(url.query).items()}
+        if url.path == "/geo/1.0/direct":
+            query = params.get("q", "")
+            if query.lower() in self.server.stub.unknown_locations:
+                self._send_json([])
+                return
+            # Deterministic pseudo-coordinates so every city name resolves
+            seed = zlib.crc32(query.lower().encode())
+            limit = int(params.get("limit", 5))
+            self._send_json([
+                {"name": f"{query.split(',')[0].strip().title()}{'' if i == 0 else f' {i}'}", "country": "IN",
+                 "lat": (seed % 18000) / 100.0 - 90.0, "lon": (seed // 18000 % 36000) / 100.0 - 180.0}
+                for i in range(limit)
+            ])
+        elif url.path == "/data/2.5/weather":
+            self._send_json({"main": {"temp": 29.5, "humidity": 71}})
+        elif url.path == "/data/2.5/air_pollution":
+            self._send_json({"list": [{"main": {"aqi": 2}}]})
+        elif url.path == "/json":
+            self._send_json({"city": "Chennai", "region": "Tamil Nadu"})
+        else:
+            self._send_json({"message": "not found"}, status=404)
+
+
+class _ChatHandler(_StubHandler):
+    """
+    OpenAI-compatible chat completions endpoint as called by the Groq SDK
+    """
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+        self._delay()
+        if urlparse(self.path).path.rstrip("/") != "/openai/v1/chat/completions":
+            self._send_json({"error": {"message": "not found"}}, status=404)
+            return
+
+        # One-token completions are relevance checks
+        content = "Yes" if body.get("max_completion_tokens") == 1 or body.get("max_tokens") == 1 else STUB_ANSWER
+        created = int(time.time())
+        model = body.get("model", "stub")
+        if not body.get("stream"):
+            self._send_json({
+                "id": "chatcmpl-stub", "object": "chat.completion", "created": created, "model": model,
+                "choices": [{"index": 0, "message": {"role": "assistant", "content": content},
+                             "finish_reason": "stop"}],
+                "usage": {"prompt_tokens": 1, "completion_tokens": 1, "total_tokens": 2},
+            })
+            return
+
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Cache-Control", "no-cache")
+        self.send_header("Connection", "close")
+        self.end_headers()
+        self.close_connection = True
+        tokens = [token + " " for token in content.split(" ")]
+        for i, token in enumerate(tokens):
+            chunk = {
+                "id": "chatcmpl-stub", "object": "chat.completion.chunk", "created": created, "model": model,
+                "choices": [{"index": 0, "delta": {"content": token},
+                             "finish_reason": "stop" if i == len(tokens) - 1 else None}],
+            }
+            self.wfile.write(f"data: {json.dumps(chunk)}\n\n".encode())
+            self.wfile.flush()
+            time.sleep(self.server.stub.token_latency)
+        self.wfile.write(b"data: [DONE]\n\n")
+        self.wfile.flush()
+
+
+class StubServer:
+    """
+    Local HTTP stand-in for an upstream API with injected latency
+
+    Args:
+        kind: "weather" (OpenWeatherMap) or "chat" (Groq / OpenAI chat completions)
+        latency_ms: Delay before every response (``latency`` can be changed while running)
+        token_latency_ms: Delay between streamed chat tokens
+        port: Port to listen on (0 picks a free one)
+    """
+
+    HANDLERS = {"weather": _WeatherHandler, "chat": _ChatHandler}
+
+    def __init__(self, kind, latency_ms=50.0, token_latency_ms=5.0, port=0):
+        self.kind = kind
+        self.latency = latency_ms / 1000.0
+        self.token_latency = token_latency_ms / 1000.0
+        self.requests = 0
+        self.unknown_locations = set()  # lower-case city names the geocoding stub does not resolve
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer(("127.0.0.1", port), self.HANDLERS[kind])
+        self._server.daemon_threads = True
+        self._server.stub = self
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def record(self):
+        with self._lock:
+            self.requests += 1
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever, name=f"stub-{self.kind}", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+
+def stub_environment(weather, chat):
+    """
+    Environment variables that point the app at running weather and chat stubs
+
+    Returns:
+        Dictionary of variable name to value
+    """
+    return {
+        "OPENWEATHER_API_KEY": "benchmark",
+        "GROQ_API_KEY": "benchmark",
+        "OPENWEATHER_BASE_URL": weather.url,
+        "GROQ_BASE_URL": chat.url,
+        "IPINFO_URL": f"{weather.url}/json",
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run the OpenWeatherMap and Groq stub servers.")
+    parser.add_argument("--weather-port", type=int, default=8081)
+    parser.add_argument("--chat-port", type=int, default=8082)
+    parser.add_argument("--latency-ms", type=float, default=50.0)
+    parser.add_argument("--token-latency-ms", type=float, default=5.0)
+    args = parser.parse_args(argv)
+
+    weather = StubServer("weather", args.latency_ms, port=args.weather_port).start()
+    chat = StubServer("chat", args.latency_ms, args.token_latency_ms, port=args.chat_port).start()
+    for name, value in stub_environment(weather, chat).items():
+        print(f"{name}={value}")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        weather.stop()
+        chat.stop()
+
+if __name__ == "__main__":
+    main()
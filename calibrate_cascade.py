@@ -0,0 +1,243 @@
+import os
+import json
+import argparse
+import logging
+from difflib import SequenceMatcher
+
+import numpy as np
+
+from export_model import list_images, timed_predictions
+from label_catalog import LabelCatalog
+from model_loader import load_model, load_image_file, preprocess_image, resize_batch
+from utils import normalize_disease_name
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_THRESHOLDS = np.round(np.arange(0.50, 1.0, 0.01), 2)
+
+# Fuzzy folder-name matching: minimum similarity, and how far ahead of the
+# runner-up the best label must be to be trusted
+MATCH_CUTOFF = 0.6
+AMBIGUITY_MARGIN = 0.1
+
+def match_label(name, catalog):
+    """
+    Class label for a dataset sub-folder name
+
+    Names are matched leniently, so both "Tomato - Late Blight" and
+    PlantVillage-style "Tomato___Late_blight" work, but a fuzzy match must
+    clearly beat every other label.
+
+    Raises:
+        ValueError if no label is similar enough or two labels match about equally well
+    """
+    query = normalize_disease_name(name.replace("_", " "))
+    index = {normalize_disease_name(label): label for label in catalog.labels}
+    if query in index:
+        return index[query]
+    scores = sorted(((SequenceMatcher(None, query, key).ratio(), label) for key, label in index.items()), reverse=True)
+    (best, label), (runner_up, other) = (scores + [(0.0, None)])[:2]
+    if best < MATCH_CUTOFF:
+        raise ValueError(f"no class label matches {name!r}")
+    if best - runner_up < AMBIGUITY_MARGIN:
+        raise ValueError(f"{name!r} is ambiguous between {label!r} and {other!r}")
+    return label
+
+def labeled_images(folder, catalog, limit=None):
+    """
+    Images of a folder with one sub-folder per class (see match_label)
+
+    Args:
+        folder: Root directory of the labeled dataset
+        catalog: LabelCatalog of the model's classes
+        limit: Maximum images per class
+
+    Returns:
+        List of (image path, class index) pairs
+
+    Raises:
+        ValueError listing every sub-folder that matches no label, matches
+        more than one, or maps to the same label as another sub-folder
+    """
+    matched, problems = {}, []
+    for name in sorted(os.listdir(folder)):
+        if not os.path.isdir(os.path.join(folder, name)):
+            continue
+        try:
+            label = match_label(name, catalog)
+        except ValueError as e:
+            problems.append(str(e))
+            continue
+        if label in matched:
+            problems.append(f"{matched[label]!r} and {name!r} both map to {label!r}")
+            continue
+        matched[label] = name
+        logger.info(f"{name} -> {label}")
+    if problems:
+        raise ValueError(f"Cannot map the sub-folders of {folder} to class labels: " + "; ".join(problems))
+
+    samples = []
+    for label, name in sorted(matched.items(), key=lambda item: item[1]):
+        samples.extend((path, catalog.index[label]) for path in list_images(os.path.join(folder, name), limit))
+    return samples
+
+def _chunks(samples, batch_size):
+    """
+    Decode and preprocess labeled images a fixed-size batch at a time
+
+    Yields:
+        Tuples of (preprocessed batch, class indices)
+    """
+    images, truth = [], []
+    for path, index in samples:
+        try:
+            images.append(preprocess_image(load_image_file(path)))
+            truth.append(index)
+        except Exception as e:
+            logger.warning(f"Skipping {path}: {str(e)}")
+            continue
+        if len(images) == batch_size:
+            yield np.concatenate(images), truth
+            images, truth = [], []
+    if images:
+        yield np.concatenate(images), truth
+
+def calibrate(first_path, second_path, samples, thresholds=DEFAULT_THRESHOLDS, batch_size=32):
+    """
+    Run both cascade stages over a labeled sample and evaluate each threshold
+
+    Images are streamed through both models ``batch_size`` at a time; only
+    the first stage's confidence and each stage's predicted class are kept
+    per image, so memory does not grow with the dataset beyond that.
+
+    Args:
+        first_path: Small first-stage model
+        second_path: Full model
+        samples: Iterable of (image path, class index) pairs
+        thresholds: Candidate first-stage confidence thresholds (0-1)
+        batch_size: Images per forward pass
+
+    Returns:
+        Dictionary with the per-image latency and accuracy of each stage and
+        one row per threshold (escalation rate, accuracy, accuracy drop
+        against the full model, mean latency and latency saved per image)
+    """
+    first, second = load_model(first_path), load_model(second_path)
+    size = tuple(first.input_shape[1:3])
+    resize = all(isinstance(d, int) for d in size)
+
+    confidence, first_pred, second_pred, truth = [], [], [], []
+    first_seconds = second_seconds = 0.0
+    for batch, indices in _chunks(samples, batch_size):
+        first_probs, first_latency = timed_predictions(first, [resize_batch(batch, size) if resize else batch])
+        second_probs, second_latency = timed_predictions(second, [batch])
+        if first_probs.shape[1] != second_probs.shape[1]:
+            raise ValueError(f"Stages predict {first_probs.shape[1]} and {second_probs.shape[1]} classes")
+        first_seconds += first_latency * len(batch)
+        second_seconds += second_latency * len(batch)
+        confidence.append(first_probs.max(axis=1))
+        first_pred.append(first_probs.argmax(axis=1))
+        second_pred.append(second_probs.argmax(axis=1))
+        truth.extend(indices)
+    if not truth:
+        raise ValueError("No decodable labeled images found for calibration")
+
+    truth = np.asarray(truth)
+    first_latency, second_latency = first_seconds / len(truth), second_seconds / len(truth)
+    confidence = np.concatenate(confidence)
+    first_correct = np.concatenate(first_pred) == truth
+    second_correct = np.concatenate(second_pred) == truth
+    second_accuracy = float(second_correct.mean())
+
+    rows = []
+    for threshold in thresholds:
+        escalate = confidence < threshold
+        accuracy = float(np.where(escalate, second_correct, first_correct).mean())
+        latency = first_latency + escalate.mean() * second_latency
+        rows.append({
+            "threshold": float(threshold),
+            "escalation_rate": float(escalate.mean()),
+            "accuracy": accuracy,
+            "accuracy_drop": second_accuracy - accuracy,
+            "latency_ms": latency * 1000.0,
+            "latency_saved_ms": (second_latency - latency) * 1000.0,
+        })
+    return {
+        "images": int(len(truth)),
+        "first_stage": {"model": first_path, "accuracy": float(first_correct.mean()),
+                        "latency_ms": first_latency * 1000.0},
+        "full_model": {"model": second_path, "accuracy": second_accuracy, "latency_ms": second_latency * 1000.0},
+        "thresholds": rows,
+    }
+
+def recommend(report, max_drop=0.005):
+    """
+    Lowest threshold (fewest escalations) whose accuracy drop is within ``max_drop``
+
+    Returns:
+        The matching threshold row, or None if no threshold qualifies
+    """
+    for row in report["thresholds"]:
+        if row["accuracy_drop"] <= max_drop:
+            return row
+    return None
+
+def format_report(report, recommended=None, step=0.05):
+    """
+    Render a calibration report as a plain-text table (every ``step`` of
+    threshold, plus the recommended row)
+    """
+    first, full = report["first_stage"], report["full_model"]
+    lines = [
+        f"{report['images']} images | first stage: {first['accuracy'] * 100:.2f}% at {first['latency_ms']:.2f} ms/img"
+        f" | full model: {full['accuracy'] * 100:.2f}% at {full['latency_ms']:.2f} ms/img",
+        "",
+    ]
+    header = f"{'threshold':>9} {'escalated':>10} {'accuracy':>9} {'drop':>7} {'ms/img':>8} {'saved ms':>9}"
+    lines += [header, "-" * len(header)]
+    for row in report["thresholds"]:
+        if row is not recommended and not np.isclose(row["threshold"] / step, round(row["threshold"] / step)):
+            continue
+        marker = "  <- recommended" if row is recommended else ""
+        lines.append(
+            f"{row['threshold']:>9.2f} {row['escalation_rate'] * 100:>9.1f}% {row['accuracy'] * 100:>8.2f}% "
+            f"{row['accuracy_drop'] * 100:>6.2f}% {row['latency_ms']:>8.2f} {row['latency_saved_ms']:>9.2f}{marker}"
+        )
+    return "\n".join(lines)
+
+def main(argv=None):
+    logging.basicConfig(level=os.getenv("LOG_LEVEL", "INFO").upper())
+    parser = argparse.ArgumentParser(
+        description="Calibrate the confidence threshold of a two-stage model cascade on a labeled folder."
+    )
+    parser.add_argument("images", help="Folder with one sub-folder of images per class")
+    parser.add_argument("--first-stage", required=True, help="Small first-stage model (.h5, .tflite or .onnx)")
+    parser.add_argument("--model", default=os.getenv("PLANTDOCTOR_MODEL_PATH", "attached_assets/mobilenetv2.h5"))
+    parser.add_argument("--labels", default="class_labels.json")
+    parser.add_argument("--limit", type=int, help="Evaluate at most this many images per class")
+    parser.add_argument("--batch-size", type=int, default=32, help="Images per forward pass")
+    parser.add_argument("--max-drop", type=float, default=0.5,
+                        help="Largest acceptable accuracy drop against the full model, in percentage points")
+    parser.add_argument("--json", help="Also write the report to this JSON file")
+    args = parser.parse_args(argv)
+
+    catalog = LabelCatalog.load(args.labels)
+    report = calibrate(args.first_stage, args.model, labeled_images(args.images, catalog, args.limit),
+                       batch_size=args.batch_size)
+    recommended = recommend(report, args.max_drop / 100.0)
+    report["recommended"] = recommended
+    print(format_report(report, recommended))
+    if recommended is not None and recommended["latency_saved_ms"] <= 0:
+        print(f"\n⚠️ At threshold {recommended['threshold']:.2f} the cascade is slower than the full model alone; "
+              "do not enable it")
+    elif recommended is not None:
+        print(f"\n✅ PLANTDOCTOR_CASCADE_MODEL={args.first_stage} "
+              f"PLANTDOCTOR_CASCADE_THRESHOLD={recommended['threshold']:.2f}")
+    else:
+        print(f"\n⚠️ No threshold keeps the accuracy drop within {args.max_drop}%; the first stage is too weak")
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(report, f, indent=2)
+
+if __name__ == "__main__":
+    main()
@@ -1,62 +1,339 @@
 import os
-from groq import Groq
+import json
+import asyncio
+import threading
 import gradio as gr
+import metrics
+from chat_prefilter import RelevanceClassifier, SemanticAnswerCache
+from chat_history import ChatHistoryStore
+from treatments import DEMO_TREATMENTS
 
 # Load API key from environment variable
 API_KEY = os.getenv("GROQ_API_KEY")
-if not API_KEY:
-    raise ValueError("Missing GROQ_API_KEY environment variable. Set it in Hugging Face Spaces Secrets.")
 
-client = Groq(api_key=API_KEY)
+# Groq clients are created on first use, so importing this module stays cheap
+# and a missing key surfaces as a chat error instead of a startup failure
+_clients = {}
+_clients_lock = threading.Lock()
+
+def _get_or_create_client(kind):
+    with _clients_lock:
+        if kind not in _clients:
+            if not API_KEY:
+                raise ValueError("Missing GROQ_API_KEY environment variable. Set it in Hugging Face Spaces Secrets.")
+            import groq
+            _clients[kind] = getattr(groq, kind)(api_key=API_KEY)
+        return _clients[kind]
+
+def get_client():
+    """
+    Shared synchronous Groq client
+    """
+    return _get_or_create_client("Groq")
+
+def get_async_client():
+    """
+    Shared AsyncGroq client
+    """
+    return _get_or_create_client("AsyncGroq")
+
+# How the streaming chatbot checks relevance:
+#   "sequential"  - validate first, then stream the answer (two round trips)
+#   "folded"      - a single call whose prompt also performs the relevance check
+#   "speculative" - validate and stream in parallel, discarding the answer on "No"
+CHAT_MODE = os.getenv("PLANTDOCTOR_CHAT_MODE", "speculative")
 
 VALIDATION_PROMPT = "You are an intelligent assistant. Analyze the input question carefully. Respond with 'Yes' if the input is agriculture-related, and 'No' otherwise."
 RESPONSE_PROMPT = "You are an agriculture expert. Provide a concise and accurate answer to the following agriculture-related question:"
+NOT_AGRICULTURE = "NOT_AGRICULTURE"
+FOLDED_PROMPT = (
+    "You are an agriculture expert. If the following question is not related to agriculture, "
+    f"reply with exactly {NOT_AGRICULTURE} and nothing else. Otherwise provide a concise and "
+    "accurate answer to it:"
+)
+REJECTION_MESSAGE = "❌ This is not an agriculture-related question."
+
+# Local stage before validate_input: settle clear-cut relevance and serve
+# repeated questions without calling the LLM
+with open(os.path.join(os.path.dirname(os.path.abspath(__file__)), "class_labels.json"), "r") as f:
+    relevance_classifier = RelevanceClassifier(json.load(f), DEMO_TREATMENTS)
+answer_cache = SemanticAnswerCache(
+    max_entries=int(os.getenv("PLANTDOCTOR_CHAT_CACHE_SIZE", "512")),
+    similarity=float(os.getenv("PLANTDOCTOR_CHAT_CACHE_SIMILARITY", "0.85")),
+)
+
+# Per-session conversation memory; each request sends the LLM a token-budgeted
+# context of the latest turns plus a rolling summary of older ones
+chat_store = ChatHistoryStore(
+    max_sessions=int(os.getenv("PLANTDOCTOR_CHAT_SESSIONS", "1024")),
+    max_turns=int(os.getenv("PLANTDOCTOR_CHAT_MAX_TURNS", "8")),
+    idle_ttl=float(os.getenv("PLANTDOCTOR_CHAT_IDLE_TTL", "3600")),
+    disk_path=os.getenv("PLANTDOCTOR_CHAT_HISTORY_DB") or None,
+)
+CONTEXT_TOKENS = int(os.getenv("PLANTDOCTOR_CHAT_CONTEXT_TOKENS", "1024"))
+
+def _session_id(request):
+    return request.session_hash if request is not None else None
 
-def validate_input(input_text):
+def clear_chat(request: gr.Request = None):
+    """
+    Reset the chat display and forget the session's conversation memory
+    """
+    session_id = _session_id(request)
+    if session_id is not None:
+        chat_store.clear(session_id)
+    return [], ""
+
+class _Rejection(str):
+    """
+    Message shown instead of an answer (never cached)
+    """
+
+def validate_input(input_text, history=()):
     try:
-        validation_response = client.chat.completions.create(
-            model="llama-3.1-8b-instant",
-            messages=[
-                {"role": "system", "content": "You are a helpful assistant."},
-                {"role": "user", "content": VALIDATION_PROMPT},
-                {"role": "user", "content": input_text},
-            ],
-            temperature=0,
-            max_completion_tokens=1,
-        )
+        with metrics.http_call("groq"):
+            validation_response = get_client().chat.completions.create(
+                model="llama-3.1-8b-instant",
+                messages=[
+                    {"role": "system", "content": "You are a helpful assistant."},
+                    *history,
+                    {"role": "user", "content": VALIDATION_PROMPT},
+                    {"role": "user", "content": input_text},
+                ],
+                temperature=0,
+                max_completion_tokens=1,
+            )
         return validation_response.choices[0].message.content.strip()
     except Exception as e:
         return f"Error: {e}"
 
-def get_agriculture_response(input_text):
+def get_agriculture_response(input_text, history=()):
+    try:
+        with metrics.http_call("groq"):
+            detailed_response = get_client().chat.completions.create(
+                model="llama-3.1-8b-instant",
+                messages=[
+                    {"role": "system", "content": "You are a helpful assistant."},
+                    *history,
+                    {"role": "user", "content": RESPONSE_PROMPT},
+                    {"role": "user", "content": input_text},
+                ],
+                temperature=0.5,
+                max_completion_tokens=700,
+            )
+        return detailed_response.choices[0].message.content.strip()
+    except Exception as e:
+        return f"Error: {e}"
+
+def _relevance_and_cache(input_text, history):
+    """
+    Local relevance verdict and cached answer for a question
+
+    A follow-up can look off-topic on its own, so with conversation context a
+    local rejection becomes "uncertain" and the LLM decides; cached answers
+    are context-free, so they are only used for a session's first question.
+    """
+    relevant = relevance_classifier.classify(input_text)
+    if relevant is False and history:
+        relevant = None
+    cached = answer_cache.get(input_text) if relevant is not False and not history else None
+    return relevant, cached
+
+def groq_chatbot(input_text, chat_history, request: gr.Request = None):
+    session_id = _session_id(request)
+    history = chat_store.context(session_id, CONTEXT_TOKENS) if session_id is not None else []
+    relevant, cached = _relevance_and_cache(input_text, history)
+
+    if relevant is False:
+        response = REJECTION_MESSAGE
+    elif cached is not None:
+        response = cached
+        if session_id is not None:
+            chat_store.append(session_id, input_text, response)
+    else:
+        validation_result = "Yes" if relevant else validate_input(input_text, history[-2:])
+
+        if validation_result.lower() == "yes":
+            response = get_agriculture_response(input_text, history)
+            if not response.startswith("Error:"):
+                if not history:
+                    answer_cache.put(input_text, response)
+                if session_id is not None:
+                    chat_store.append(session_id, input_text, response)
+        elif validation_result.lower() == "no":
+            response = REJECTION_MESSAGE
+        else:
+            response = f"⚠️ Unexpected response: {validation_result}"
+
+    # Append to chat history
+    chat_history.append((input_text, response))
+    return chat_history, ""  # Clears input field after submission
+
+async def validate_input_async(input_text, client=None, history=()):
     try:
-        detailed_response = client.chat.completions.create(
+        with metrics.http_call("groq"):
+            validation_response = await (client or get_async_client()).chat.completions.create(
+                model="llama-3.1-8b-instant",
+                messages=[
+                    {"role": "system", "content": "You are a helpful assistant."},
+                    *history,
+                    {"role": "user", "content": VALIDATION_PROMPT},
+                    {"role": "user", "content": input_text},
+                ],
+                temperature=0,
+                max_completion_tokens=1,
+            )
+        return validation_response.choices[0].message.content.strip()
+    except Exception as e:
+        return f"Error: {e}"
+
+async def stream_completion(input_text, prompt=RESPONSE_PROMPT, client=None, history=()):
+    """
+    Stream an answer from the LLM as text deltas, after the conversation context in ``history``
+    """
+    # Timed until the response stream opens (time to first byte)
+    with metrics.http_call("groq"):
+        stream = await (client or get_async_client()).chat.completions.create(
             model="llama-3.1-8b-instant",
             messages=[
                 {"role": "system", "content": "You are a helpful assistant."},
-                {"role": "user", "content": RESPONSE_PROMPT},
+                *history,
+                {"role": "user", "content": prompt},
                 {"role": "user", "content": input_text},
             ],
             temperature=0.5,
             max_completion_tokens=700,
+            stream=True,
         )
-        return detailed_response.choices[0].message.content.strip()
-    except Exception as e:
-        return f"Error: {e}"
+    async for chunk in stream:
+        delta = chunk.choices[0].delta.content if chunk.choices else None
+        if delta:
+            yield delta
 
-def groq_chatbot(input_text, chat_history):
-    validation_result = validate_input(input_text)
-    
+def _verdict_message(validation_result):
+    """
+    None if the question may be answered, otherwise the message to show instead
+    """
     if validation_result.lower() == "yes":
-        response = get_agriculture_response(input_text)
-    elif validation_result.lower() == "no":
-        response = "❌ This is not an agriculture-related question."
-    else:
-        response = f"⚠️ Unexpected response: {validation_result}"
+        return None
+    if validation_result.lower() == "no":
+        return _Rejection(REJECTION_MESSAGE)
+    return _Rejection(f"⚠️ Unexpected response: {validation_result}")
 
-    # Append to chat history
+async def _direct_answer(input_text, client, history=()):
+    # Relevance already settled locally: no validation round trip at all
+    async for delta in stream_completion(input_text, client=client, history=history):
+        yield delta
+
+async def _sequential_answer(input_text, client, history=()):
+    message = _verdict_message(await validate_input_async(input_text, client, history[-2:]))
+    if message is not None:
+        yield message
+        return
+    async for delta in stream_completion(input_text, client=client, history=history):
+        yield delta
+
+async def _folded_answer(input_text, client, history=()):
+    # Hold tokens back only while they could still be the start of the sentinel
+    pending = ""
+    released = False
+    async for delta in stream_completion(input_text, prompt=FOLDED_PROMPT, client=client, history=history):
+        if released:
+            yield delta
+            continue
+        pending += delta
+        stripped = pending.lstrip()
+        if stripped.startswith(NOT_AGRICULTURE):
+            yield _Rejection(REJECTION_MESSAGE)
+            return
+        if not NOT_AGRICULTURE.startswith(stripped):
+            released = True
+            yield pending
+    if not released and pending.strip():
+        yield pending
+
+async def _speculative_answer(input_text, client, history=()):
+    queue = asyncio.Queue()
+
+    async def pump():
+        try:
+            async for delta in stream_completion(input_text, client=client, history=history):
+                queue.put_nowait(delta)
+        except Exception as e:
+            queue.put_nowait(e)
+        finally:
+            queue.put_nowait(None)
+
+    # The answer streams into the queue while the relevance check runs
+    answer = asyncio.create_task(pump())
+    try:
+        message = _verdict_message(await validate_input_async(input_text, client, history[-2:]))
+        if message is not None:
+            answer.cancel()
+            yield message
+            return
+        while (delta := await queue.get()) is not None:
+            if isinstance(delta, Exception):
+                raise delta
+            yield delta
+    finally:
+        answer.cancel()
+
+_ANSWER_MODES = {
+    "sequential": _sequential_answer,
+    "folded": _folded_answer,
+    "speculative": _speculative_answer,
+}
+
+async def groq_chatbot_stream(input_text, chat_history, mode=None, client=None, request: gr.Request = None):
+    """
+    Async generator version of groq_chatbot that streams the answer into the chat
+
+    Args:
+        input_text: User question
+        chat_history: List of (question, answer) pairs shown in the chat (display only)
+        mode: "sequential", "folded" or "speculative" (default: PLANTDOCTOR_CHAT_MODE)
+        client: AsyncGroq-compatible client (default: the module client)
+        request: Gradio request; its session hash keys the conversation memory
+
+    Yields:
+        Tuples of (chat history, "") with the last answer growing as tokens arrive
+    """
+    session_id = _session_id(request)
+    # The store may hit SQLite; keep it off the event loop
+    history = await asyncio.to_thread(chat_store.context, session_id, CONTEXT_TOKENS) if session_id is not None else []
+    relevant, cached = _relevance_and_cache(input_text, history)
+    if relevant is False:
+        chat_history.append((input_text, REJECTION_MESSAGE))
+        yield chat_history, ""
+        return
+    if cached is not None:
+        if session_id is not None:
+            await asyncio.to_thread(chat_store.append, session_id, input_text, cached)
+        chat_history.append((input_text, cached))
+        yield chat_history, ""
+        return
+
+    answer = _direct_answer if relevant else _ANSWER_MODES[mode or CHAT_MODE]
+    response = ""
+    cacheable = True
     chat_history.append((input_text, response))
-    return chat_history, ""  # Clears input field after submission
+    try:
+        async for delta in answer(input_text, client, history):
+            cacheable = cacheable and not isinstance(delta, _Rejection)
+            response += delta
+            chat_history[-1] = (input_text, response)
+            yield chat_history, ""
+    except Exception as e:
+        cacheable = False
+        response += f"Error: {e}"
+        chat_history[-1] = (input_text, response)
+    if cacheable and response:
+        if not history:
+            answer_cache.put(input_text, response)
+        if session_id is not None:
+            await asyncio.to_thread(chat_store.append, session_id, input_text, response)
+    yield chat_history, ""
 
 def launch_gradio_interface():
     with gr.Blocks() as demo:
@@ -67,13 +344,11 @@ def launch_gradio_interface():
         msg = gr.Textbox(placeholder="Ask a question about agriculture...", label="Your Question")
         clear = gr.Button("Clear Chat")
 
-        chat_history_state = gr.State([])  # Stores chat history
-
-        # ✅ Enter key submits the question
-        msg.submit(fn=groq_chatbot, inputs=[msg, chat_history_state], outputs=[chatbot, msg])
+        # ✅ Enter key submits the question (the conversation memory lives in chat_store)
+        msg.submit(fn=groq_chatbot_stream, inputs=[msg, chatbot], outputs=[chatbot, msg])
 
-        # ✅ Clicking "Clear Chat" resets history
-        clear.click(lambda: ([], ""), None, [chatbot, msg], queue=False)
+        # ✅ Clicking "Clear Chat" resets the display and the session's memory
+        clear.click(clear_chat, None, [chatbot, msg], queue=False)
 
     demo.launch(share=True)
 
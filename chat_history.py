@@ -0,0 +1,203 @@
+import re
+import json
+import time
+import sqlite3
+import logging
+import threading
+from collections import OrderedDict
+
+import metrics
+
+logger = logging.getLogger(__name__)
+
+_SENTENCE_END = re.compile(r"(?<=[.!?])\s")
+
+
+def estimate_tokens(text):
+    """
+    Rough LLM token count (about four characters per token for English text)
+    """
+    return (len(text) + 3) // 4
+
+
+def summarize_turn(question, answer, max_chars=200):
+    """
+    One-line extractive summary of a turn: the question and the first
+    sentence of the answer
+    """
+    first_sentence = _SENTENCE_END.split(answer.strip(), maxsplit=1)[0]
+    return f"Q: {question.strip()[:max_chars]} A: {first_sentence[:max_chars]}"
+
+
+class _Session:
+    __slots__ = ("turns", "summary", "last_used")
+
+    def __init__(self, turns=(), summary=(), last_used=0.0):
+        self.turns = list(turns)      # [(question, answer), ...], oldest first
+        self.summary = list(summary)  # summary lines of turns that rolled out
+        self.last_used = last_used
+
+
+class ChatHistoryStore:
+    """
+    Bounded per-session chat memory used to give the LLM conversation context.
+
+    Each session keeps its last ``max_turns`` turns verbatim (answers clipped
+    to ``max_answer_chars``); older turns are folded into a rolling
+    extractive summary capped at ``summary_tokens``, so a record never grows
+    with the length of the conversation. Sessions live in an in-process LRU
+    of at most ``max_sessions`` entries and are evicted once idle for
+    ``idle_ttl`` seconds. With ``disk_path`` every update is written through
+    to SQLite, so sessions survive restarts and evictions until they have
+    been idle for ``retention`` seconds.
+    """
+
+    def __init__(self, max_sessions=1024, max_turns=8, max_answer_chars=1000, summary_tokens=256,
+                 idle_ttl=3600.0, disk_path=None, retention=7 * 24 * 3600.0):
+        self.max_sessions = max_sessions
+        self.max_turns = max_turns
+        self.max_answer_chars = max_answer_chars
+        self.summary_tokens = summary_tokens
+        self.idle_ttl = idle_ttl
+        self.retention = retention
+
+        self._lock = threading.Lock()
+        self._sessions = OrderedDict()  # session id -> _Session, least recently used first
+        self._counters = {"hits": 0, "disk_hits": 0, "misses": 0, "evictions": 0}
+
+        self._db = None
+        if disk_path:
+            self._db = sqlite3.connect(disk_path, check_same_thread=False)
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS chat_sessions ("
+                "session TEXT PRIMARY KEY, turns TEXT, summary TEXT, last_used REAL)"
+            )
+            self._db.execute("DELETE FROM chat_sessions WHERE last_used < ?", (time.time() - retention,))
+            self._db.commit()
+
+    def append(self, session_id, question, answer):
+        """
+        Record a finished turn, rolling the oldest turn into the summary when full
+        """
+        now = time.time()
+        with self._lock:
+            session = self._load(session_id, now) or _Session()
+            session.turns.append((question, answer[:self.max_answer_chars]))
+            while len(session.turns) > self.max_turns:
+                session.summary.append(summarize_turn(*session.turns.pop(0)))
+            while len(session.summary) > 1 and estimate_tokens("\n".join(session.summary)) > self.summary_tokens:
+                session.summary.pop(0)
+            session.last_used = now
+            self._sessions[session_id] = session
+            self._sessions.move_to_end(session_id)
+            self._evict(now)
+            self._save(session_id, session)
+
+    def context(self, session_id, budget_tokens=1024):
+        """
+        Conversation context for the next request, newest turns first to fill
+        the token budget, behind a system message with the rolling summary
+
+        Returns:
+            List of chat messages ({"role", "content"}) in chronological order;
+            empty for an unknown session
+        """
+        now = time.time()
+        with self._lock:
+            session = self._load(session_id, now)
+            if session is None:
+                return []
+            session.last_used = now
+            turns, summary = list(session.turns), list(session.summary)
+
+        messages = []
+        remaining = budget_tokens
+        # The summary gets at most a third of the budget (oldest lines go first,
+        # possibly all of them); the rest goes to verbatim turns
+        while summary:
+            content = "Summary of the earlier conversation:\n" + "\n".join(summary)
+            if estimate_tokens(content) <= budget_tokens // 3:
+                remaining -= estimate_tokens(content)
+                break
+            summary.pop(0)
+        recent = []
+        for question, answer in reversed(turns):
+            cost = estimate_tokens(question) + estimate_tokens(answer)
+            if cost > remaining:
+                break
+            remaining -= cost
+            recent[:0] = [{"role": "user", "content": question}, {"role": "assistant", "content": answer}]
+        if summary:
+            messages.append({"role": "system", "content": content})
+        return messages + recent
+
+    def clear(self, session_id):
+        """
+        Forget a session (the Clear Chat button)
+        """
+        with self._lock:
+            self._sessions.pop(session_id, None)
+            if self._db is not None:
+                self._db.execute("DELETE FROM chat_sessions WHERE session = ?", (session_id,))
+                self._db.commit()
+
+    def stats(self):
+        """
+        Returns:
+            Dictionary of lookup counters and the number of sessions in memory
+        """
+        with self._lock:
+            counters = dict(self._counters)
+            counters["sessions"] = len(self._sessions)
+        return counters
+
+    def _load(self, session_id, now):
+        session = self._sessions.get(session_id)
+        if session is not None and now - session.last_used <= self.idle_ttl:
+            self._sessions.move_to_end(session_id)
+            self._counters["hits"] += 1
+            metrics.CACHE_REQUESTS.inc(cache="chat_session", result="hit")
+            return session
+        if session is not None:
+            del self._sessions[session_id]
+            self._counters["evictions"] += 1
+
+        session = self._disk_get(session_id, now)
+        if session is not None:
+            session.last_used = now
+            self._sessions[session_id] = session
+            self._evict(now)
+            self._counters["disk_hits"] += 1
+            metrics.CACHE_REQUESTS.inc(cache="chat_session", result="disk_hit")
+            return session
+        self._counters["misses"] += 1
+        metrics.CACHE_REQUESTS.inc(cache="chat_session", result="miss")
+        return None
+
+    def _evict(self, now):
+        # Least recently used first: drop idle sessions, then any over capacity
+        while self._sessions:
+            session_id, session = next(iter(self._sessions.items()))
+            if len(self._sessions) <= self.max_sessions and now - session.last_used <= self.idle_ttl:
+                break
+            del self._sessions[session_id]
+            self._counters["evictions"] += 1
+
+    def _disk_get(self, session_id, now):
+        if self._db is None:
+            return None
+        row = self._db.execute(
+            "SELECT turns, summary, last_used FROM chat_sessions WHERE session = ?", (session_id,)
+        ).fetchone()
+        if row is None or now - row[2] > self.retention:
+            return None
+        return _Session([tuple(turn) for turn in json.loads(row[0])], json.loads(row[1]), row[2])
+
+    def _save(self, session_id, session):
+        if self._db is None:
+            return
+        self._db.execute(
+            "INSERT OR REPLACE INTO chat_sessions (session, turns, summary, last_used) VALUES (?, ?, ?, ?)",
+            (session_id, json.dumps(session.turns), json.dumps(session.summary), session.last_used),
+        )
+        self._db.commit()
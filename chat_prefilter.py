@@ -0,0 +1,267 @@
+import re
+import math
+import zlib
+import logging
+import threading
+from collections import Counter
+
+import numpy as np
+
+import metrics
+from utils import normalize_disease_name
+
+logger = logging.getLogger(__name__)
+
+# Agriculture vocabulary; several words (plant, field, seed, yield, rust, ...) also have
+# everyday meanings, so one of them alone does not settle a question
+AGRICULTURE_TERMS = {
+    "agriculture", "agricultural", "agronomy", "crop", "farm", "farmer", "farming", "field", "garden",
+    "gardening", "harvest", "irrigation", "irrigate", "soil", "compost", "manure", "fertilizer",
+    "fertiliser", "npk", "nitrogen", "phosphorus", "potassium", "seed", "seedling", "sow", "sowing",
+    "plant", "planting", "leaf", "root", "stem", "fruit", "orchard", "vineyard", "greenhouse", "mulch",
+    "pest", "pesticide", "insecticide", "herbicide", "fungicide", "weed", "aphid", "blight", "mildew",
+    "rust", "rot", "wilt", "mold", "mould", "fungus", "fungal", "livestock", "cattle", "poultry",
+    "dairy", "rice", "wheat", "maize", "barley", "sorghum", "millet", "cotton", "sugarcane", "paddy",
+    "yield", "tractor", "tillage", "hydroponic", "organic", "agroforestry", "drip", "grass", "lawn",
+    "turf", "pruning", "prune", "graft", "grafting",
+}
+
+# Words that mark a question as clearly off-topic when no agriculture term is present
+OFF_TOPIC_TERMS = {
+    "movie", "film", "actor", "actress", "celebrity", "song", "music", "lyrics", "football", "soccer",
+    "cricket", "basketball", "nba", "bitcoin", "crypto", "stock", "forex", "javascript", "python",
+    "programming", "code", "computer", "laptop", "iphone", "android", "election", "president",
+    "politics", "game", "gaming", "anime", "netflix", "joke", "poem", "dating", "girlfriend",
+    "boyfriend", "horoscope", "car", "hotel", "flight",
+}
+
+STOPWORDS = {
+    "a", "an", "the", "and", "or", "of", "to", "in", "on", "for", "with", "without", "is", "are", "was",
+    "be", "by", "as", "at", "it", "its", "this", "that", "these", "those", "my", "your", "i", "you",
+    "we", "they", "what", "how", "why", "when", "which", "who", "do", "does", "can", "should", "could",
+    "would", "will", "any", "some", "like", "such", "if", "into", "from", "about", "there", "their",
+    "has", "have", "all", "also", "not", "no", "yes", "good", "proper", "ensure", "continue", "regular",
+    "possible", "two", "me", "best", "get", "use", "using", "please", "tell",
+}
+
+# Negations and polarity words: dropped when scoring relevance, but they flip the
+# meaning of a question, so the answer cache keeps them and never matches across them
+POLARITY_TERMS = (
+    "not", "no", "never", "nor", "without", "with", "dont", "doesnt", "didnt", "shouldnt", "cant",
+    "cannot", "wont", "isnt", "arent",
+)
+CACHE_STOPWORDS = STOPWORDS - set(POLARITY_TERMS)
+
+# Crop names that are also everyday words (brands, colours, sports) and so are
+# only ordinary strong terms rather than decisive on their own
+AMBIGUOUS_CROPS = {"apple", "orange", "cherry", "squash"}
+
+
+def tokenize(text):
+    """
+    Normalize text the same way disease names are normalized and split it
+    into crudely singularized tokens
+    """
+    tokens = []
+    for token in normalize_disease_name(text).split():
+        if len(token) > 4 and token.endswith("ies"):
+            token = token[:-3] + "y"
+        elif len(token) > 4 and token.endswith("oes"):
+            token = token[:-2]
+        elif len(token) > 3 and token.endswith("s") and not token.endswith("ss"):
+            token = token[:-1]
+        tokens.append(token)
+    return tokens
+
+
+class RelevanceClassifier:
+    """
+    Cheap local relevance check run before the remote validation call.
+
+    Only clear-cut questions are settled locally: a question is agricultural
+    when it names a crop or disease from the class labels, or contains at
+    least ``min_strong_terms`` distinct strong terms (label words and the
+    seed list above). It is off-topic when it contains an off-topic word and
+    no agriculture evidence at all, where words from the treatment texts count
+    as weaker evidence weighted by their inverse document frequency.
+    ``classify`` returns None whenever the remote check should decide.
+    """
+
+    def __init__(self, class_labels, treatments, min_strong_terms=2, max_document_frequency=0.3):
+        self.min_strong_terms = min_strong_terms
+        self.off_topic = {t for term in OFF_TOPIC_TERMS for t in tokenize(term)}
+
+        self.weights = {}
+        documents = [set(tokenize(f"{label} {text}")) - STOPWORDS for label, text in treatments.items()]
+        document_frequency = Counter(t for document in documents for t in document)
+        max_idf = math.log(len(documents) + 1)
+        for token, df in document_frequency.items():
+            if df / len(documents) <= max_document_frequency and not token.isdigit():
+                self.weights[token] = 0.5 * math.log((len(documents) + 1) / df) / max_idf
+
+        # Crop names ("Pepper (Bell) - ..." -> pepper) and disease names, including
+        # the alternatives in parentheses, matched as whole phrases
+        self.names = set()
+        strong = set()
+        for label in class_labels.values():
+            if "background" in label.lower():
+                continue
+            strong.update(tokenize(label))
+            crop, _, disease = label.partition(" - ")
+            crop = tuple(tokenize(re.sub(r"\(.*?\)", " ", crop)))
+            if crop and " ".join(crop) not in AMBIGUOUS_CROPS:
+                self.names.add(crop)
+            for name in re.split(r"[()]", disease):
+                name = tuple(tokenize(name))
+                if name and name != ("healthy",):
+                    self.names.add(name)
+        self.longest_name = max(map(len, self.names), default=0)
+        for term in AGRICULTURE_TERMS:
+            strong.update(tokenize(term))
+        self.strong = strong - STOPWORDS - {"healthy"}
+        for token in self.strong:
+            self.weights[token] = 1.0
+
+    def score(self, text):
+        """
+        Relevance score of a question: the summed weights of the distinct
+        agriculture terms it contains
+        """
+        return sum(self.weights.get(token, 0.0) for token in set(tokenize(text)))
+
+    def names_label(self, tokens):
+        """
+        Whether a token sequence contains a crop or disease name from the labels
+        """
+        for size in range(1, self.longest_name + 1):
+            for start in range(len(tokens) - size + 1):
+                if tuple(tokens[start:start + size]) in self.names:
+                    return True
+        return False
+
+    def classify(self, text):
+        """
+        Returns:
+            True (clearly agricultural), False (clearly off-topic) or None (undecided)
+        """
+        tokens = tokenize(text)
+        distinct = set(tokens)
+        if distinct & self.off_topic:
+            return False if not any(token in self.weights for token in distinct) else None
+        if len(distinct & self.strong) >= self.min_strong_terms or self.names_label(tokens):
+            return True
+        return None
+
+
+class SemanticAnswerCache:
+    """
+    Bounded cache of question -> answer pairs that also serves near-duplicate questions.
+
+    Questions are normalized and embedded as hashed bag-of-words vectors
+    (unigrams, plus bigrams at half weight so word order matters a little,
+    L2-normalized). A lookup first tries the exact normalized text, then
+    the most similar cached question by cosine similarity among those with
+    the same negation and polarity words, so "Should I not water tomatoes
+    daily?" never gets the answer to "Should I water tomatoes daily?". The
+    least recently used entry is evicted when full.
+    """
+
+    def __init__(self, max_entries=512, similarity=0.85, dimensions=2048):
+        self.max_entries = max_entries
+        self.similarity = similarity
+        self.dimensions = dimensions
+
+        self._lock = threading.Lock()
+        self._vectors = np.zeros((max_entries, dimensions), dtype=np.float32)
+        self._last_used = np.full(max_entries, -1, dtype=np.int64)
+        self._polarity = np.zeros(max_entries, dtype=np.int64)
+        self._questions = [None] * max_entries
+        self._answers = [None] * max_entries
+        self._slots = {}  # normalized question -> slot
+        self._clock = 0
+        self._counters = {"exact_hits": 0, "semantic_hits": 0, "misses": 0, "evictions": 0}
+
+    @staticmethod
+    def normalize(text):
+        return normalize_disease_name(text)
+
+    @staticmethod
+    def polarity(text):
+        """
+        Bit mask of the POLARITY_TERMS a question contains
+        """
+        tokens = set(tokenize(text))
+        return sum(1 << i for i, term in enumerate(POLARITY_TERMS) if term in tokens)
+
+    def embed(self, text):
+        """
+        Hashed unigram + bigram embedding of a question
+        """
+        tokens = [t for t in tokenize(text) if t not in CACHE_STOPWORDS]
+        vector = np.zeros(self.dimensions, dtype=np.float32)
+        for token in tokens:
+            vector[zlib.crc32(token.encode()) % self.dimensions] += 1.0
+        for bigram in zip(tokens, tokens[1:]):
+            vector[zlib.crc32(" ".join(bigram).encode()) % self.dimensions] += 0.5
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def get(self, question):
+        """
+        Returns:
+            Cached answer for the question or a near-duplicate, or None
+        """
+        key = self.normalize(question)
+        vector = self.embed(question)
+        polarity = self.polarity(question)
+        with self._lock:
+            self._clock += 1
+            slot = self._slots.get(key)
+            if slot is not None:
+                self._counters["exact_hits"] += 1
+                metrics.CACHE_REQUESTS.inc(cache="answer", result="exact_hit")
+            elif vector.any() and self._slots:
+                similarities = np.where(self._polarity == polarity, self._vectors @ vector, -1.0)
+                candidate = int(np.argmax(similarities))
+                if similarities[candidate] >= self.similarity:
+                    slot = candidate
+                    self._counters["semantic_hits"] += 1
+                    metrics.CACHE_REQUESTS.inc(cache="answer", result="semantic_hit")
+            if slot is None:
+                self._counters["misses"] += 1
+                metrics.CACHE_REQUESTS.inc(cache="answer", result="miss")
+                return None
+            self._last_used[slot] = self._clock
+            return self._answers[slot]
+
+    def put(self, question, answer):
+        """
+        Cache the answer to a question, evicting the least recently used entry if full
+        """
+        key = self.normalize(question)
+        vector = self.embed(question)
+        with self._lock:
+            self._clock += 1
+            slot = self._slots.get(key)
+            if slot is None:
+                slot = int(np.argmin(self._last_used))
+                if self._questions[slot] is not None:
+                    del self._slots[self._questions[slot]]
+                    self._counters["evictions"] += 1
+                self._slots[key] = slot
+            self._questions[slot] = key
+            self._answers[slot] = answer
+            self._vectors[slot] = vector
+            self._polarity[slot] = self.polarity(question)
+            self._last_used[slot] = self._clock
+
+    def stats(self):
+        """
+        Hit/miss counters, current size and hit rate
+        """
+        with self._lock:
+            counters = dict(self._counters)
+            counters["entries"] = len(self._slots)
+        lookups = counters["exact_hits"] + counters["semantic_hits"] + counters["misses"]
+        counters["hit_rate"] = (lookups - counters["misses"]) / lookups if lookups else 0.0
+        return counters
@@ -0,0 +1,314 @@
+import os
+import csv
+import mmap
+import time
+import struct
+import bisect
+import argparse
+import logging
+import threading
+import unicodedata
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+MAGIC = b"PDCITY2\0"
+HEADER = struct.Struct("<8sII")  # magic, record count, size of the crowded-prefix table in bytes
+DEFAULT_INDEX_PATH = os.getenv("PLANTDOCTOR_CITY_INDEX", "attached_assets/cities.idx")
+
+# Column positions in a GeoNames cities dump (cities500/1000/5000/15000.txt)
+GEONAMES_NAME, GEONAMES_ASCIINAME, GEONAMES_LAT, GEONAMES_LON = 1, 2, 4, 5
+GEONAMES_COUNTRY, GEONAMES_POPULATION = 8, 14
+
+# Prefixes matching more records than this get a precomputed most-populous list
+CROWDED_PREFIX = 512
+PREFIX_TOP = 32
+
+
+def normalize_city(text):
+    """
+    Fold a city name to the lowercase ASCII form used as the index key
+
+    Args:
+        text: City name or typed prefix, e.g. "São Paulo"
+
+    Returns:
+        Normalized key, e.g. "sao paulo"
+    """
+    decomposed = unicodedata.normalize("NFKD", text)
+    ascii_text = "".join(c for c in decomposed if not unicodedata.combining(c))
+    return " ".join(ascii_text.lower().split())
+
+
+def _crowded_prefixes(keys, populations, crowded=CROWDED_PREFIX, top=PREFIX_TOP):
+    """
+    Most populous records of every prefix that matches more than ``crowded`` keys
+
+    Returns:
+        Dictionary mapping the prefix to its top record indices, most populous first
+    """
+    table = {}
+    pending = [("", 0, len(keys))]
+    while pending:
+        parent, lo, hi = pending.pop()
+        length = len(parent) + 1
+        i = lo
+        while i < hi:
+            if len(keys[i]) < length:
+                i += 1
+                continue
+            prefix = keys[i][:length]
+            end = bisect.bisect_left(keys, prefix + "\U0010ffff", i, hi)
+            if end - i > crowded:
+                order = np.argsort(-populations[i:end], kind="stable")[:top]
+                table[prefix] = (order + i).tolist()
+                pending.append((prefix, i, end))
+            i = end
+    return table
+
+
+def build_index(gazetteer_path, output_path, min_population=0):
+    """
+    Compile a GeoNames cities dump into a sorted, memory-mappable index
+
+    The file holds a fixed header, a little-endian uint32 offset table, a
+    blob of newline-terminated records ``key\\tdisplay\\tpopulation\\tlat\\tlon``
+    sorted by key, so prefixes can be found by binary search directly in
+    the mapped pages, and a small table of ``prefix\\tindex,index,...``
+    lines with the most populous records of every prefix too crowded to
+    rank at query time (typically the first one or two letters).
+
+    Args:
+        gazetteer_path: Tab-separated GeoNames dump
+        output_path: Destination .idx file
+        min_population: Skip places smaller than this
+
+    Returns:
+        Number of records written
+    """
+    records = set()
+    with open(gazetteer_path, encoding="utf-8") as f:
+        for row in csv.reader(f, delimiter="\t", quoting=csv.QUOTE_NONE):
+            if len(row) <= GEONAMES_POPULATION:
+                continue
+            population = int(row[GEONAMES_POPULATION] or 0)
+            if population < min_population:
+                continue
+            display = f"{row[GEONAMES_NAME]}, {row[GEONAMES_COUNTRY]}"
+            # Index both the local and the ASCII spelling
+            for name in {row[GEONAMES_NAME], row[GEONAMES_ASCIINAME]}:
+                key = normalize_city(name)
+                if key:
+                    records.add((key, display, population, row[GEONAMES_LAT], row[GEONAMES_LON]))
+
+    records = sorted(records, key=lambda r: (r[0], -r[2]))
+    lines = [
+        f"{key}\t{display}\t{population}\t{lat}\t{lon}\n".encode("utf-8")
+        for key, display, population, lat, lon in records
+    ]
+    offsets = np.zeros(len(lines) + 1, dtype="<u4")
+    np.cumsum([len(line) for line in lines], out=offsets[1:])
+
+    crowded = _crowded_prefixes([r[0] for r in records], np.array([r[2] for r in records], dtype=np.int64))
+    prefix_table = "".join(
+        f"{prefix}\t{','.join(map(str, indices))}\n" for prefix, indices in sorted(crowded.items())
+    ).encode("utf-8")
+
+    with open(output_path, "wb") as f:
+        f.write(HEADER.pack(MAGIC, len(lines), len(prefix_table)))
+        f.write(offsets.tobytes())
+        for line in lines:
+            f.write(line)
+        f.write(prefix_table)
+    return len(lines)
+
+
+class _Keys:
+    """
+    Lazy sequence of record keys for bisect, read straight from the mapped file
+    """
+
+    def __init__(self, index):
+        self._index = index
+
+    def __len__(self):
+        return self._index.count
+
+    def __getitem__(self, i):
+        record = self._index._record(i)
+        return record[:record.index(b"\t")]
+
+
+class CityIndex:
+    """
+    Memory-mapped offline city gazetteer with prefix search
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._file = open(path, "rb")
+        self._mm = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, self.count, table_size = HEADER.unpack_from(self._mm, 0)
+        if magic != MAGIC:
+            raise ValueError(f"{path} is not a current PlantDoctor city index (rebuild it with `city_index.py build`)")
+        self._offsets = np.frombuffer(self._mm, dtype="<u4", count=self.count + 1, offset=HEADER.size)
+        self._blob_start = HEADER.size + self._offsets.nbytes
+        self._keys = _Keys(self)
+
+        # Only a few hundred lines even for a worldwide dump, so it is parsed eagerly
+        table_start = self._blob_start + int(self._offsets[-1])
+        self._crowded = {}
+        for line in self._mm[table_start:table_start + table_size].decode("utf-8").splitlines():
+            prefix, indices = line.split("\t")
+            self._crowded[prefix] = [int(i) for i in indices.split(",")]
+
+    @classmethod
+    def open(cls, path=DEFAULT_INDEX_PATH):
+        """
+        Open the index if it exists
+
+        Returns:
+            CityIndex, or None when the file is missing or invalid
+        """
+        if not os.path.exists(path):
+            logger.info(f"No city index at {path}; city suggestions use remote geocoding only")
+            return None
+        try:
+            return cls(path)
+        except Exception as e:
+            logger.warning(f"Could not open city index {path}: {str(e)}")
+            return None
+
+    def _record(self, i):
+        start = self._blob_start + int(self._offsets[i])
+        end = self._blob_start + int(self._offsets[i + 1]) - 1  # strip the newline
+        return self._mm[start:end]
+
+    def _parse(self, i):
+        key, display, population, lat, lon = self._record(i).decode("utf-8").split("\t")
+        return key, display, int(population), float(lat), float(lon)
+
+    def _prefix_range(self, prefix):
+        key = normalize_city(prefix).encode("utf-8")
+        lo = bisect.bisect_left(self._keys, key)
+        # "\xff" never occurs in UTF-8, so it sorts after every key starting with the prefix
+        hi = bisect.bisect_left(self._keys, key + b"\xff", lo)
+        return lo, hi
+
+    def suggest(self, prefix, limit=5):
+        """
+        Most populous cities whose name starts with the prefix
+
+        Prefixes matching more than CROWDED_PREFIX records are answered from
+        the table precomputed at build time, so at most that many records
+        are ranked per call and short prefixes still find the big cities.
+
+        Args:
+            prefix: Text typed so far
+            limit: Number of suggestions (at most about PREFIX_TOP / 2 for crowded prefixes)
+
+        Returns:
+            List of "City, CC" strings (empty if the prefix is not in the index)
+        """
+        key = normalize_city(prefix)
+        if not key:
+            return []
+        if key in self._crowded:
+            candidates = [self._parse(i) for i in self._crowded[key]]
+        else:
+            lo, hi = self._prefix_range(prefix)
+            candidates = [self._parse(i) for i in range(lo, hi)]
+        candidates.sort(key=lambda record: -record[2])
+        suggestions = []
+        for _, display, _, _, _ in candidates:
+            if display not in suggestions:
+                suggestions.append(display)
+                if len(suggestions) == limit:
+                    break
+        return suggestions
+
+    def coordinates(self, location):
+        """
+        Resolve "City" or "City, CC" to coordinates without a network call
+
+        Returns:
+            Tuple of (lat, lon), or None if the location is unknown or ambiguous
+        """
+        name, _, country = location.partition(",")
+        key = normalize_city(name).encode("utf-8")
+        if not key:
+            return None
+        lo = bisect.bisect_left(self._keys, key)
+        hi = bisect.bisect_right(self._keys, key, lo)
+        matches = [self._parse(i) for i in range(lo, hi)]
+        country = country.strip().lower()
+        if country:
+            matches = [m for m in matches if m[1].rsplit(", ", 1)[-1].lower() == country]
+        if not matches:
+            return None
+        best = max(matches, key=lambda record: record[2])
+        return best[3], best[4]
+
+    def close(self):
+        self._offsets = None
+        self._crowded = {}
+        self._mm.close()
+        self._file.close()
+
+
+class Debouncer:
+    """
+    Per-key debounce for blocking event handlers
+
+    ``settle(key)`` waits for the quiet period and reports whether no newer
+    call arrived for the same key in the meantime, so only the last
+    keystroke of a burst goes on to do expensive work.
+    """
+
+    def __init__(self, delay=0.35):
+        self.delay = delay
+        self._lock = threading.Lock()
+        self._latest = {}
+
+    def settle(self, key):
+        with self._lock:
+            token = self._latest.get(key, 0) + 1
+            self._latest[key] = token
+        time.sleep(self.delay)
+        with self._lock:
+            if self._latest.get(key) != token:
+                return False
+            del self._latest[key]
+            return True
+
+
+def main(argv=None):
+    logging.basicConfig(level=os.getenv("LOG_LEVEL", "INFO").upper())
+    parser = argparse.ArgumentParser(description="Build or query the offline city index.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    build = subparsers.add_parser("build", help="Compile a GeoNames cities dump")
+    build.add_argument("gazetteer", help="GeoNames file, e.g. cities15000.txt")
+    build.add_argument("-o", "--output", default=DEFAULT_INDEX_PATH)
+    build.add_argument("--min-population", type=int, default=0)
+
+    query = subparsers.add_parser("query", help="Print suggestions for a prefix")
+    query.add_argument("prefix")
+    query.add_argument("--index", default=DEFAULT_INDEX_PATH)
+
+    args = parser.parse_args(argv)
+    if args.command == "build":
+        count = build_index(args.gazetteer, args.output, args.min_population)
+        print(f"✅ Wrote {count} records to {args.output} ({os.path.getsize(args.output) / 1e6:.2f} MB)")
+    else:
+        index = CityIndex(args.index)
+        started = time.perf_counter()
+        suggestions = index.suggest(args.prefix)
+        elapsed_us = (time.perf_counter() - started) * 1e6
+        for suggestion in suggestions:
+            print(suggestion)
+        print(f"({elapsed_us:.0f} µs)")
+
+if __name__ == "__main__":
+    main()
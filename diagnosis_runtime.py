@@ -0,0 +1,199 @@
+import json
+import time
+import logging
+import threading
+
+import numpy as np
+
+from model_loader import load_model, preprocess_image, model_input_dtype, CascadeModel
+from inference_server import InferenceServer
+from worker_pool import InferenceWorkerPool
+from prediction_cache import PredictionCache, files_fingerprint
+from tiled_inference import diagnose_tiled
+from label_catalog import LabelCatalog
+
+logger = logging.getLogger(__name__)
+
+
+class DiagnosisRuntime:
+    """
+    Owns everything the Diagnose button needs: the model, the label
+    catalog, the micro-batching inference server and the prediction cache.
+
+    ``start(background=True)`` loads the model and runs a first inference on
+    a daemon thread so the web server can come up immediately; ``ready``
+    reports when inference is warm and ``status()`` gives the timing
+    breakdown for the readiness endpoint.
+
+    With ``workers`` > 0 the model is never loaded in this process: an
+    InferenceWorkerPool of that many processes takes the in-process
+    server's place (``worker_options`` are passed to it).
+
+    ``load_options`` go to model_loader.load_model in this process or in the
+    workers, e.g. ``first_stage`` and ``cascade_threshold`` for a cascade.
+
+    The label catalog is validated against ``treatments`` and the model's
+    output width during warm-up, so a mismatch fails readiness instead of
+    surfacing on some later request.
+
+    A request waits at most ``result_timeout`` seconds for its forward pass
+    and then raises TimeoutError, so a stuck backend cannot hang the UI.
+    """
+
+    def __init__(self, model_path, labels_path, uint8_input=False, batch_max_size=16, batch_max_wait_ms=10.0,
+                 cache_options=None, workers=0, worker_options=None, treatments=None, min_confidence=0.0,
+                 load_options=None, result_timeout=60.0):
+        self.model_path = model_path
+        self.labels_path = labels_path
+        self.treatments = treatments
+        self.min_confidence = min_confidence
+        self.uint8_input = uint8_input
+        self.batch_max_size = batch_max_size
+        self.batch_max_wait_ms = batch_max_wait_ms
+        self.workers = workers
+        self.worker_options = worker_options or {}
+        self.load_options = load_options or {}
+        self.result_timeout = result_timeout
+
+        self.model = None
+        self.class_labels = None
+        self.catalog = None
+        self.input_dtype = np.float32
+        self.inference_server = None
+        # Cached predictions are tied to the model files and labels loaded at
+        # warm-up and to the load options (backend, uint8 input, cascade threshold)
+        watch_paths = [model_path, labels_path] + [p for p in [self.load_options.get("first_stage")] if p]
+        salt = json.dumps({"uint8_input": uint8_input, **self.load_options}, sort_keys=True, default=str)
+        self.prediction_cache = PredictionCache(watch_paths=watch_paths, salt=salt, **(cache_options or {}))
+
+        self.error = None
+        self.timings = {}
+        self._ready = threading.Event()
+        self._thread = None
+
+    def start(self, background=True):
+        """
+        Load and warm up the model, on a daemon thread when ``background`` is set
+
+        Raises:
+            Any loading error, when running in the foreground
+        """
+        if background:
+            self._thread = threading.Thread(target=self._warm_up, name="model-warmup", daemon=True)
+            self._thread.start()
+        else:
+            self._warm_up()
+            if self.error is not None:
+                raise self.error
+        return self
+
+    @property
+    def ready(self):
+        return self._ready.is_set() and self.error is None
+
+    def wait_ready(self, timeout=None):
+        """
+        Block until warm-up has finished (successfully or not)
+
+        Returns:
+            False if the timeout expired first
+        """
+        return self._ready.wait(timeout)
+
+    def status(self):
+        """
+        Readiness report: whether inference is warm, the warm-up error if any,
+        and the time spent in each startup phase
+        """
+        status = {
+            "ready": self.ready,
+            "warming_up": not self._ready.is_set(),
+            "error": str(self.error) if self.error is not None else None,
+            "timings_s": dict(self.timings),
+        }
+        if self.ready:
+            status["inference"] = self.inference_server.stats()
+            if isinstance(self.model, CascadeModel):
+                status["cascade"] = self.model.stats()
+        return status
+
+    def diagnose(self, image):
+        """
+        Diagnose a decoded image, serving repeated uploads from the cache
+
+        Returns:
+            Tuple of (predicted disease label, confidence percentage)
+        """
+        if self.error is not None:
+            raise RuntimeError(f"Model failed to load: {self.error}")
+        if not self._ready.is_set():
+            raise RuntimeError("Model is still warming up")
+        return self.prediction_cache.get_or_compute(
+            image,
+            lambda: self.inference_server.predict(
+                preprocess_image(image, dtype=self.input_dtype), timeout=self.result_timeout
+            ),
+        )
+
+    def diagnose_tiled(self, image, **options):
+        """
+        Tile-by-tile diagnosis of a high-resolution photo, all kept tiles in
+        one inference-server request (see tiled_inference.diagnose_tiled)
+
+        Returns:
+            Dictionary with the aggregated label, confidence and tile heatmap
+        """
+        if self.error is not None:
+            raise RuntimeError(f"Model failed to load: {self.error}")
+        if not self._ready.is_set():
+            raise RuntimeError("Model is still warming up")
+        return diagnose_tiled(
+            image, lambda batch: self.inference_server.submit(batch).result(self.result_timeout), self.catalog,
+            dtype=self.input_dtype, **options,
+        )
+
+    def _warm_up(self):
+        started = time.perf_counter()
+        try:
+            # Taken before reading any file, so one replaced during the load
+            # shows up as a change instead of being attributed to this model
+            fingerprint = files_fingerprint(self.prediction_cache.watch_paths, self.prediction_cache.salt)
+            self.catalog = LabelCatalog.load(self.labels_path, self.treatments, self.min_confidence)
+            self.class_labels = self.catalog.class_labels
+
+            phase = time.perf_counter()
+            if self.workers > 0:
+                self.inference_server = InferenceWorkerPool(
+                    self.model_path, self.catalog, workers=self.workers,
+                    max_batch_size=self.batch_max_size, uint8_input=self.uint8_input, **self.worker_options,
+                    **self.load_options,
+                ).start()
+                self.input_dtype = self.inference_server.input_dtype
+                self.timings["model_load"] = time.perf_counter() - phase
+            else:
+                self.model = load_model(self.model_path, uint8_input=self.uint8_input, **self.load_options)
+                self.input_dtype = model_input_dtype(self.model)
+                self.timings["model_load"] = time.perf_counter() - phase
+
+                self.inference_server = InferenceServer(
+                    self.model, self.catalog,
+                    max_batch_size=self.batch_max_size, max_wait_ms=self.batch_max_wait_ms,
+                ).start()
+
+            phase = time.perf_counter()
+            probabilities = self.inference_server.submit(
+                preprocess_image(np.zeros((224, 224, 3), dtype=np.uint8), dtype=self.input_dtype)
+            ).result()
+            self.timings["first_inference"] = time.perf_counter() - phase
+            if probabilities.shape[-1] != len(self.catalog):
+                raise ValueError(
+                    f"Model predicts {probabilities.shape[-1]} classes but {self.labels_path} lists {len(self.catalog)}"
+                )
+            self.prediction_cache.bind(fingerprint)
+            logger.info(f"Diagnosis model warm after {time.perf_counter() - started:.2f}s")
+        except Exception as e:
+            logger.error(f"Error warming up diagnosis model: {str(e)}")
+            self.error = e
+        finally:
+            self.timings["warmup_total"] = time.perf_counter() - started
+            self._ready.set()
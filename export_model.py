@@ -0,0 +1,256 @@
+import os
+import json
+import time
+import argparse
+import logging
+import tempfile
+
+import numpy as np
+
+from model_loader import load_model, load_image_file, preprocess_image, predict_batch
+
+logger = logging.getLogger(__name__)
+
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".bmp", ".webp")
+QUANTIZATION_MODES = ("none", "dynamic", "fp16", "int8")
+
+def list_images(folder, limit=None):
+    """
+    List image files under a folder (recursively), in a stable order
+
+    Args:
+        folder: Directory containing leaf images
+        limit: Maximum number of files to return
+
+    Returns:
+        Sorted list of image paths
+    """
+    paths = []
+    for root, _, files in os.walk(folder):
+        for name in files:
+            if name.lower().endswith(IMAGE_EXTENSIONS):
+                paths.append(os.path.join(root, name))
+    paths.sort()
+    return paths[:limit] if limit else paths
+
+def iter_preprocessed(paths):
+    """
+    Yield preprocessed (1, 224, 224, 3) batches for the given image files,
+    skipping files that cannot be decoded
+    """
+    for path in paths:
+        try:
+            yield preprocess_image(load_image_file(path))
+        except Exception as e:
+            logger.warning(f"Skipping {path}: {str(e)}")
+
+def export_tflite(model, output_path, quantize="none", calibration_paths=()):
+    """
+    Convert the Keras model to TensorFlow Lite
+
+    Args:
+        model: Loaded Keras model
+        output_path: Destination .tflite file
+        quantize: "none", "dynamic" (int8 weights), "fp16" or "int8" (full integer)
+        calibration_paths: Image files used as the representative dataset for int8
+
+    Returns:
+        Path of the written model
+    """
+    import tensorflow as tf
+
+    converter = tf.lite.TFLiteConverter.from_keras_model(model)
+    if quantize in ("dynamic", "fp16", "int8"):
+        converter.optimizations = [tf.lite.Optimize.DEFAULT]
+    if quantize == "fp16":
+        converter.target_spec.supported_types = [tf.float16]
+    elif quantize == "int8":
+        if not calibration_paths:
+            raise ValueError("Full int8 quantization needs calibration images (--calibration-dir)")
+
+        def representative_dataset():
+            for batch in iter_preprocessed(calibration_paths):
+                yield [batch]
+
+        converter.representative_dataset = representative_dataset
+        converter.target_spec.supported_ops = [tf.lite.OpsSet.TFLITE_BUILTINS_INT8]
+        converter.inference_input_type = tf.uint8
+        converter.inference_output_type = tf.uint8
+
+    with open(output_path, "wb") as f:
+        f.write(converter.convert())
+    return output_path
+
+class _CalibrationReader:
+    """
+    onnxruntime CalibrationDataReader over a list of image files
+    """
+
+    def __init__(self, input_name, paths):
+        self.input_name = input_name
+        self._batches = iter_preprocessed(paths)
+
+    def get_next(self):
+        batch = next(self._batches, None)
+        return None if batch is None else {self.input_name: batch}
+
+    def rewind(self):
+        pass
+
+def export_onnx(model, output_path, quantize="none", calibration_paths=(), opset=13):
+    """
+    Convert the Keras model to ONNX (requires tf2onnx, plus onnxruntime for
+    quantization and onnxconverter-common for fp16)
+
+    Args:
+        model: Loaded Keras model
+        output_path: Destination .onnx file
+        quantize: "none", "dynamic", "fp16" or "int8" (static QDQ)
+        calibration_paths: Image files used to calibrate int8 activations
+        opset: ONNX opset version
+
+    Returns:
+        Path of the written model
+    """
+    import tensorflow as tf
+    import tf2onnx
+
+    input_signature = (tf.TensorSpec((None,) + tuple(model.input_shape[1:]), tf.float32, name="input"),)
+    if quantize == "none":
+        tf2onnx.convert.from_keras(model, input_signature=input_signature, opset=opset, output_path=output_path)
+        return output_path
+
+    with tempfile.TemporaryDirectory() as tmp:
+        float_path = os.path.join(tmp, "float.onnx")
+        tf2onnx.convert.from_keras(model, input_signature=input_signature, opset=opset, output_path=float_path)
+
+        if quantize == "fp16":
+            import onnx
+            from onnxconverter_common import float16
+            onnx.save(float16.convert_float_to_float16(onnx.load(float_path)), output_path)
+        elif quantize == "dynamic":
+            from onnxruntime.quantization import quantize_dynamic, QuantType
+            quantize_dynamic(float_path, output_path, weight_type=QuantType.QUInt8)
+        elif quantize == "int8":
+            if not calibration_paths:
+                raise ValueError("Static int8 quantization needs calibration images (--calibration-dir)")
+            from onnxruntime.quantization import quantize_static, QuantFormat, QuantType
+            reader = _CalibrationReader("input", calibration_paths)
+            quantize_static(
+                float_path, output_path, reader,
+                quant_format=QuantFormat.QDQ,
+                activation_type=QuantType.QUInt8,
+                weight_type=QuantType.QInt8,
+            )
+        else:
+            raise ValueError(f"Unknown quantization mode: {quantize}")
+    return output_path
+
+def timed_predictions(model, batches):
+    """
+    Run every batch through the model, returning stacked outputs and seconds per image
+    """
+    outputs = []
+    elapsed = 0.0
+    for batch in batches:
+        started = time.perf_counter()
+        outputs.append(predict_batch(model, batch))
+        elapsed += time.perf_counter() - started
+    stacked = np.concatenate(outputs)
+    return stacked, elapsed / max(len(stacked), 1)
+
+def drift_report(reference_path, variant_paths, image_paths):
+    """
+    Compare exported variants against the Keras reference model
+
+    Args:
+        reference_path: Path to the Keras .h5 model
+        variant_paths: Paths to exported .tflite/.onnx models
+        image_paths: Leaf images to evaluate on
+
+    Returns:
+        List of dictionaries (reference first) with file size, mean latency per
+        image, top-1 agreement with the reference and probability drift
+    """
+    batches = list(iter_preprocessed(image_paths))
+    if not batches:
+        raise ValueError("No decodable images found for the drift report")
+
+    reference = load_model(reference_path)
+    reference_probs, reference_latency = timed_predictions(reference, batches)
+    reference_top1 = reference_probs.argmax(axis=1)
+
+    rows = [{
+        "model": reference_path,
+        "size_mb": os.path.getsize(reference_path) / 1e6,
+        "latency_ms": reference_latency * 1000.0,
+        "top1_agreement": 1.0,
+        "mean_abs_diff": 0.0,
+        "max_abs_diff": 0.0,
+    }]
+    for path in variant_paths:
+        variant = load_model(path)
+        probs, latency = timed_predictions(variant, batches)
+        diff = np.abs(probs - reference_probs)
+        rows.append({
+            "model": path,
+            "size_mb": os.path.getsize(path) / 1e6,
+            "latency_ms": latency * 1000.0,
+            "top1_agreement": float(np.mean(probs.argmax(axis=1) == reference_top1)),
+            "mean_abs_diff": float(diff.mean()),
+            "max_abs_diff": float(diff.max()),
+        })
+    return rows
+
+def format_report(rows):
+    """
+    Render drift report rows as a plain-text table
+    """
+    header = f"{'model':<48} {'size MB':>8} {'ms/img':>8} {'top-1 agree':>12} {'mean |dp|':>10} {'max |dp|':>10}"
+    lines = [header, "-" * len(header)]
+    for row in rows:
+        lines.append(
+            f"{row['model'][-48:]:<48} {row['size_mb']:>8.2f} {row['latency_ms']:>8.2f} "
+            f"{row['top1_agreement'] * 100:>11.2f}% {row['mean_abs_diff']:>10.5f} {row['max_abs_diff']:>10.5f}"
+        )
+    return "\n".join(lines)
+
+def main(argv=None):
+    logging.basicConfig(level=os.getenv("LOG_LEVEL", "INFO").upper())
+    parser = argparse.ArgumentParser(
+        description="Export the PlantDoctor Keras model to TFLite/ONNX and report accuracy drift."
+    )
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    export = subparsers.add_parser("export", help="Convert the .h5 model to TFLite or ONNX")
+    export.add_argument("--model", default="attached_assets/mobilenetv2.h5", help="Source Keras model")
+    export.add_argument("--format", choices=("tflite", "onnx"), required=True)
+    export.add_argument("--quantize", choices=QUANTIZATION_MODES, default="none")
+    export.add_argument("--calibration-dir", help="Folder of leaf images for int8 calibration")
+    export.add_argument("--calibration-samples", type=int, default=200)
+    export.add_argument("-o", "--output", required=True, help="Destination model file")
+
+    drift = subparsers.add_parser("drift", help="Compare exported variants against the Keras model")
+    drift.add_argument("variants", nargs="+", help="Exported .tflite/.onnx files")
+    drift.add_argument("--model", default="attached_assets/mobilenetv2.h5", help="Reference Keras model")
+    drift.add_argument("--images", required=True, help="Folder of leaf images to evaluate on")
+    drift.add_argument("--limit", type=int, help="Evaluate at most this many images")
+    drift.add_argument("--json", help="Also write the report to this JSON file")
+
+    args = parser.parse_args(argv)
+
+    if args.command == "export":
+        calibration_paths = list_images(args.calibration_dir, args.calibration_samples) if args.calibration_dir else []
+        model = load_model(args.model, fast_path=False)
+        exporter = export_tflite if args.format == "tflite" else export_onnx
+        exporter(model, args.output, quantize=args.quantize, calibration_paths=calibration_paths)
+        print(f"✅ Wrote {args.output} ({os.path.getsize(args.output) / 1e6:.2f} MB)")
+    else:
+        rows = drift_report(args.model, args.variants, list_images(args.images, args.limit))
+        print(format_report(rows))
+        if args.json:
+            with open(args.json, "w") as f:
+                json.dump(rows, f, indent=2)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,232 @@
+import queue
+import threading
+import time
+import logging
+from collections import Counter
+from concurrent.futures import Future
+
+import numpy as np
+
+import metrics
+from model_loader import predict_batch, decode_prediction
+
+logger = logging.getLogger(__name__)
+
+# Sentinel pushed onto the queue to stop the batching thread
+_STOP = object()
+
+
+class _Request:
+    __slots__ = ("images", "future", "enqueued_at")
+
+    def __init__(self, images):
+        self.images = images
+        self.future = Future()
+        self.enqueued_at = time.perf_counter()
+
+
+class InferenceServer:
+    """
+    Dynamic micro-batching front end for the diagnosis model.
+
+    Callers submit preprocessed images from any thread. A single background
+    thread collects them into batches of up to ``max_batch_size`` images,
+    waiting at most ``max_wait_ms`` after the first queued request, runs one
+    forward pass per batch and resolves every caller's future with its own
+    rows of class probabilities. A forward pass never exceeds
+    ``max_batch_size`` images: larger submissions (e.g. all tiles of a tiled
+    diagnosis) are split into chunks, and a request that does not fit into
+    the batch being formed starts the next one.
+    """
+
+    def __init__(self, model, class_labels, max_batch_size=16, max_wait_ms=10.0):
+        if max_batch_size < 1:
+            raise ValueError("max_batch_size must be at least 1")
+        self.model = model
+        self.class_labels = class_labels
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000.0
+
+        self._queue = queue.Queue()
+        self._carry = None  # request that did not fit into the previous batch
+        self._thread = None
+        self._lock = threading.Lock()
+
+        # Tuning statistics
+        self._batch_sizes = Counter()
+        self._queue_depths = Counter()
+        self._requests = 0
+        self._total_wait = 0.0
+
+    def start(self):
+        """
+        Start the background batching thread (idempotent)
+        """
+        if self._thread is not None and self._thread.is_alive():
+            return self
+        self._thread = threading.Thread(target=self._run, name="inference-server", daemon=True)
+        self._thread.start()
+        logger.info(
+            f"Inference server started (max_batch_size={self.max_batch_size}, "
+            f"max_wait_ms={self.max_wait * 1000:.1f})"
+        )
+        return self
+
+    def stop(self, timeout=None):
+        """
+        Stop the batching thread after draining requests already queued
+        """
+        if self._thread is None:
+            return
+        self._queue.put(_STOP)
+        self._thread.join(timeout)
+        self._thread = None
+
+    def submit(self, preprocessed_image):
+        """
+        Queue a preprocessed image batch for inference
+
+        Args:
+            preprocessed_image: Array of shape (N, 224, 224, 3), usually N=1
+
+        Returns:
+            Future resolving to an array of class probabilities of shape (N, num_classes)
+        """
+        if self._thread is None:
+            raise RuntimeError("Inference server is not running; call start() first")
+        images = np.asarray(preprocessed_image)
+        if images.ndim == 3:
+            images = images[np.newaxis]
+        if len(images) <= self.max_batch_size:
+            request = _Request(images)
+            self._queue.put(request)
+            return request.future
+
+        chunks = [_Request(images[i:i + self.max_batch_size]) for i in range(0, len(images), self.max_batch_size)]
+        for chunk in chunks:
+            self._queue.put(chunk)
+        return _gather([chunk.future for chunk in chunks])
+
+    def predict(self, preprocessed_image, timeout=None):
+        """
+        Blocking helper with the same contract as model_loader.predict_disease
+
+        Args:
+            preprocessed_image: Preprocessed image batch
+            timeout: Seconds to wait for the result (None waits forever)
+
+        Returns:
+            Tuple of (predicted disease label, confidence percentage)
+        """
+        probabilities = self.submit(preprocessed_image).result(timeout)
+        return decode_prediction(probabilities[0], self.class_labels)
+
+    def stats(self):
+        """
+        Snapshot of queue and batching statistics for tuning the wait window
+
+        Returns:
+            Dictionary with the current queue depth, histograms of batch sizes
+            and of queue depths observed when a batch was formed, and the
+            mean time a request waited before its forward pass
+        """
+        with self._lock:
+            return {
+                "queue_depth": self._queue.qsize(),
+                "requests": self._requests,
+                "batches": sum(self._batch_sizes.values()),
+                "batch_size_histogram": dict(sorted(self._batch_sizes.items())),
+                "queue_depth_histogram": dict(sorted(self._queue_depths.items())),
+                "mean_queue_wait_ms": (self._total_wait / self._requests * 1000.0) if self._requests else 0.0,
+                "max_batch_size": self.max_batch_size,
+                "max_wait_ms": self.max_wait * 1000.0,
+            }
+
+    def _collect(self, first):
+        """
+        Gather requests into one batch until it is full or the window closes
+        """
+        batch = [first]
+        size = len(first.images)
+        deadline = first.enqueued_at + self.max_wait
+        stop = False
+        while size < self.max_batch_size:
+            remaining = deadline - time.perf_counter()
+            try:
+                item = self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is _STOP:
+                stop = True
+                break
+            if size + len(item.images) > self.max_batch_size:
+                # Close the batch; the request opens the next one
+                self._carry = item
+                break
+            batch.append(item)
+            size += len(item.images)
+        return batch, size, stop
+
+    def _run(self):
+        stop = False
+        while not stop or self._carry is not None:
+            if self._carry is not None:
+                first, self._carry = self._carry, None
+            else:
+                first = self._queue.get()
+            if first is _STOP:
+                break
+            depth = self._queue.qsize() + 1
+            batch, size, stopped = self._collect(first)
+            stop = stop or stopped
+            self._process(batch, size, depth)
+
+    def _process(self, batch, size, depth):
+        started = time.perf_counter()
+        with self._lock:
+            self._batch_sizes[size] += 1
+            self._queue_depths[depth] += 1
+            self._requests += len(batch)
+            self._total_wait += sum(started - r.enqueued_at for r in batch)
+        for request in batch:
+            metrics.QUEUE_WAIT_SECONDS.observe(started - request.enqueued_at, queue="batcher")
+
+        try:
+            images = batch[0].images if len(batch) == 1 else np.concatenate([r.images for r in batch])
+            probabilities = predict_batch(self.model, images)
+        except Exception as e:
+            logger.error(f"Error running batched inference: {str(e)}")
+            for request in batch:
+                request.future.set_exception(e)
+            return
+
+        offset = 0
+        for request in batch:
+            n = len(request.images)
+            request.future.set_result(probabilities[offset:offset + n])
+            offset += n
+
+
+def _gather(futures):
+    """
+    Future resolving to the concatenated results of ``futures``, in order,
+    or to the first exception among them
+    """
+    combined = Future()
+    remaining = [len(futures)]
+    lock = threading.Lock()
+
+    def done(_):
+        with lock:
+            remaining[0] -= 1
+            if remaining[0]:
+                return
+        errors = [f.exception() for f in futures if f.exception() is not None]
+        if errors:
+            combined.set_exception(errors[0])
+        else:
+            combined.set_result(np.concatenate([f.result() for f in futures]))
+
+    for future in futures:
+        future.add_done_callback(done)
+    return combined
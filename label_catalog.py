@@ -0,0 +1,130 @@
+import json
+import logging
+from collections import namedtuple
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_TREATMENT = "No specific treatment information available. Consult with an agricultural expert."
+
+# Vectorized top-k result for a batch: (N, k) arrays plus an (N,) abstain mask
+TopK = namedtuple("TopK", ["indices", "labels", "confidences", "abstained"])
+
+
+class LabelCatalog:
+    """
+    Class index -> label -> treatment table compiled once into arrays
+
+    The JSON label map (string keys "0".."N-1") is checked to be a complete,
+    contiguous index range and every label is checked to have a treatment,
+    so a broken labels file or a missing treatment fails at startup rather
+    than on the request that first predicts that class.
+
+    Args:
+        class_labels: Dictionary mapping class indices (as strings) to labels
+        treatments: Dictionary mapping labels to treatment texts; None skips
+                    the treatment table and its validation
+        min_confidence: Top-1 confidence percentage below which a prediction
+                        abstains (0 never abstains)
+
+    Raises:
+        ValueError: On non-integer, duplicate or missing indices, or labels without a treatment
+    """
+
+    def __init__(self, class_labels, treatments=None, min_confidence=0.0):
+        try:
+            indices = sorted(int(i) for i in class_labels)
+        except ValueError:
+            raise ValueError("Class label keys must be integer indices")
+        if indices != list(range(len(indices))):
+            raise ValueError(f"Class label indices must be 0..{len(indices) - 1} without gaps")
+
+        self.class_labels = dict(class_labels)
+        self.min_confidence = min_confidence
+        self.labels = np.array([class_labels[str(i)] for i in indices], dtype=object)
+        self.index = {label: i for i, label in enumerate(self.labels)}
+        if len(self.index) != len(self.labels):
+            raise ValueError("Class labels must be unique")
+        self.background = np.array(["background" in label.lower() for label in self.labels])
+
+        self.treatments = None
+        if treatments is not None:
+            missing = [label for label in self.labels if label not in treatments]
+            if missing:
+                raise ValueError(f"No treatment for {len(missing)} class label(s): {', '.join(missing)}")
+            self.treatments = np.array([treatments[label] for label in self.labels], dtype=object)
+
+    @classmethod
+    def load(cls, labels_path, treatments=None, min_confidence=0.0):
+        """
+        Build a catalog from a class_labels.json file
+        """
+        with open(labels_path, "r") as f:
+            catalog = cls(json.load(f), treatments, min_confidence)
+        logger.info(f"Label catalog ready: {len(catalog)} classes from {labels_path}")
+        return catalog
+
+    def __len__(self):
+        return len(self.labels)
+
+    def label(self, index):
+        index = int(index)
+        return self.labels[index] if 0 <= index < len(self.labels) else f"Unknown class {index}"
+
+    def treatment(self, label):
+        """
+        Treatment text for a label (DEFAULT_TREATMENT if unknown or no table)
+        """
+        index = self.index.get(label)
+        if index is None or self.treatments is None:
+            return DEFAULT_TREATMENT
+        return self.treatments[index]
+
+    def top_k(self, probabilities, k=3, min_confidence=None):
+        """
+        The k most likely classes for every row of a probability batch
+
+        Uses a partition to find each row's k-th largest score, so only the
+        k candidates per row are sorted, and array indexing for labels;
+        there is no per-row Python work. Ties are broken towards the lower
+        class index, exactly as a stable ``np.argsort`` of the negated row.
+
+        Args:
+            probabilities: Array of shape (N, num_classes) (a single row is accepted)
+            k: Candidates per row
+            min_confidence: Abstain threshold in percent (default: the catalog's)
+
+        Returns:
+            TopK of (N, k) indices, labels and confidence percentages in
+            descending order, and an (N,) mask of rows whose top-1
+            confidence is below the threshold
+        """
+        probabilities = np.atleast_2d(np.asarray(probabilities))
+        k = min(k, probabilities.shape[1])
+        if k < probabilities.shape[1]:
+            kth = np.partition(probabilities, -k, axis=1)[:, [-k]]
+            above = probabilities > kth
+            # Classes tied with the k-th score fill the remaining places lowest index first
+            tied = probabilities == kth
+            selected = above | (tied & (np.cumsum(tied, axis=1) <= k - above.sum(axis=1, keepdims=True)))
+            candidates = np.nonzero(selected)[1].reshape(len(probabilities), k)
+        else:
+            candidates = np.broadcast_to(np.arange(k), probabilities.shape)
+        scores = np.take_along_axis(probabilities, candidates, axis=1)
+        order = np.argsort(-scores, axis=1, kind="stable")
+        indices = np.take_along_axis(candidates, order, axis=1)
+        confidences = np.take_along_axis(scores, order, axis=1).astype(np.float64) * 100.0
+
+        threshold = self.min_confidence if min_confidence is None else min_confidence
+        return TopK(indices, self.labels[indices], confidences, confidences[:, 0] < threshold)
+
+    def decode(self, probabilities):
+        """
+        Same contract as model_loader.decode_prediction for one row
+
+        Returns:
+            Tuple of (predicted disease label, confidence percentage)
+        """
+        index = int(np.argmax(probabilities))
+        return self.label(index), float(probabilities[index] * 100)
@@ -0,0 +1,406 @@
+import os
+import sys
+import time
+import logging
+import threading
+import functools
+import contextvars
+from collections import Counter as _Tally, deque
+
+logger = logging.getLogger(__name__)
+
+# Seconds; covers sub-millisecond label lookups up to slow upstream calls
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+_state = {
+    "metrics": os.getenv("PLANTDOCTOR_METRICS", "1").lower() in ("1", "true", "yes"),
+    "tracing": os.getenv("PLANTDOCTOR_TRACING", "0").lower() in ("1", "true", "yes"),
+}
+
+
+def set_enabled(enabled):
+    """
+    Turn metric collection on or off at runtime
+    """
+    _state["metrics"] = bool(enabled)
+
+
+def enabled():
+    return _state["metrics"]
+
+
+def _label_key(labelnames, labels):
+    return tuple(str(labels.get(name, "")) for name in labelnames)
+
+
+def _format_labels(labelnames, key, extra=()):
+    pairs = [f'{name}="{value}"' for name, value in zip(labelnames, key)] + list(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class Counter:
+    """
+    Monotonic counter with optional labels
+    """
+
+    kind = "counter"
+
+    def __init__(self, name, help, labelnames=()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self._values = {}
+
+    def inc(self, amount=1.0, **labels):
+        if not _state["metrics"]:
+            return
+        key = _label_key(self.labelnames, labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def value(self, **labels):
+        return self._values.get(_label_key(self.labelnames, labels), 0.0)
+
+    def render(self):
+        with self._lock:
+            items = sorted(self._values.items())
+        return [f"{self.name}{_format_labels(self.labelnames, key)} {value:g}" for key, value in items]
+
+
+class Histogram:
+    """
+    Cumulative-bucket histogram (Prometheus semantics) with optional labels
+    """
+
+    kind = "histogram"
+
+    def __init__(self, name, help, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self._lock = threading.Lock()
+        self._series = {}  # key -> [bucket counts..., +Inf count, sum]
+
+    def observe(self, value, **labels):
+        if not _state["metrics"]:
+            return
+        key = _label_key(self.labelnames, labels)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [0] * (len(self.buckets) + 1) + [0.0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[i] += 1
+                    break
+            else:
+                series[len(self.buckets)] += 1
+            series[-1] += value
+
+    def time(self, **labels):
+        """
+        Context manager that observes the elapsed seconds
+        """
+        if not _state["metrics"]:
+            return _NULL_TIMER
+        return _Timer(self, labels)
+
+    def count(self, **labels):
+        series = self._series.get(_label_key(self.labelnames, labels))
+        return sum(series[:-1]) if series else 0
+
+    def render(self):
+        with self._lock:
+            items = sorted((key, list(series)) for key, series in self._series.items())
+        lines = []
+        for key, series in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), series[:-1]):
+                cumulative += count
+                le = 'le="+Inf"' if bound == float("inf") else f'le="{bound:g}"'
+                lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, key, [le])} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labelnames, key)} {series[-1]:.6f}")
+            lines.append(f"{self.name}_count{_format_labels(self.labelnames, key)} {cumulative}")
+        return lines
+
+
+class _Timer:
+    __slots__ = ("histogram", "labels", "started")
+
+    def __init__(self, histogram, labels):
+        self.histogram = histogram
+        self.labels = labels
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.histogram.observe(time.perf_counter() - self.started, **self.labels)
+        return False
+
+
+class _NullTimer:
+    """
+    Shared no-op returned while collection is disabled
+    """
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NULL_TIMER = _NullTimer()
+_registry = {}
+_registry_lock = threading.Lock()
+
+
+def _register(cls, name, help, labelnames, **options):
+    with _registry_lock:
+        metric = _registry.get(name)
+        if metric is None:
+            metric = _registry[name] = cls(name, help, labelnames, **options)
+        return metric
+
+
+def counter(name, help, labelnames=()):
+    """
+    Get or create a registered counter
+    """
+    return _register(Counter, name, help, labelnames)
+
+
+def histogram(name, help, labelnames=(), buckets=DEFAULT_BUCKETS):
+    """
+    Get or create a registered histogram
+    """
+    return _register(Histogram, name, help, labelnames, buckets=buckets)
+
+
+def timed(histogram, **labels):
+    """
+    Decorator observing every call's duration in ``histogram`` and, while
+    tracing is on, recording it as a span named after the function. When
+    both are off the wrapper only checks two flags before calling through.
+    """
+    def decorate(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not (_state["metrics"] or _state["tracing"]):
+                return func(*args, **kwargs)
+            started = time.perf_counter()
+            try:
+                with span(func.__name__, **labels):
+                    return func(*args, **kwargs)
+            finally:
+                histogram.observe(time.perf_counter() - started, **labels)
+        return wrapper
+    return decorate
+
+
+def render():
+    """
+    Every registered metric in the Prometheus text exposition format
+
+    Returns:
+        String for a /metrics response (content type text/plain; version=0.0.4)
+    """
+    lines = []
+    with _registry_lock:
+        metrics = sorted(_registry.values(), key=lambda m: m.name)
+    for metric in metrics:
+        lines.append(f"# HELP {metric.name} {metric.help}")
+        lines.append(f"# TYPE {metric.name} {metric.kind}")
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+
+# Hot-path metrics shared by the modules that record them
+STAGE_SECONDS = histogram(
+    "plantdoctor_stage_seconds", "Time spent in each diagnosis stage (decode, preprocess, forward, label_lookup, and the "
+    "cascade_first / cascade_full stages within a cascade forward pass)",
+    ["stage"],
+)
+HTTP_SECONDS = histogram(
+    "plantdoctor_http_request_seconds", "Latency of calls to external services", ["service"],
+)
+HTTP_REQUESTS = counter(
+    "plantdoctor_http_requests_total", "Calls to external services by outcome", ["service", "outcome"],
+)
+CACHE_REQUESTS = counter(
+    "plantdoctor_cache_requests_total", "Cache lookups by cache and result", ["cache", "result"],
+)
+QUEUE_WAIT_SECONDS = histogram(
+    "plantdoctor_queue_wait_seconds", "Time a request waited before its work started", ["queue"],
+)
+CASCADE_IMAGES = counter(
+    "plantdoctor_cascade_images_total", "Images answered by the cascade's first stage or escalated", ["stage"],
+)
+BATCH_IMAGES = histogram(
+    "plantdoctor_batch_images", "Images per forward pass", buckets=(1, 2, 4, 8, 16, 32, 64, 128),
+)
+
+
+class _HTTPCall:
+    __slots__ = ("service", "started")
+
+    def __init__(self, service):
+        self.service = service
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        HTTP_SECONDS.observe(time.perf_counter() - self.started, service=self.service)
+        HTTP_REQUESTS.inc(service=self.service, outcome="error" if exc_type is not None else "ok")
+        return False
+
+
+def http_call(service):
+    """
+    Context manager timing one external HTTP call and counting its outcome
+
+    Args:
+        service: "ipinfo", "geocoding", "weather", "aqi", "groq", ...
+    """
+    if not _state["metrics"]:
+        return _NULL_TIMER
+    return _HTTPCall(service)
+
+
+# ---------------------------------------------------------------------------
+# Per-request trace spans (off unless enabled at runtime)
+
+_current_span = contextvars.ContextVar("plantdoctor_span", default=None)
+_recent_traces = deque(maxlen=int(os.getenv("PLANTDOCTOR_TRACE_BUFFER", "100")))
+
+
+def set_tracing(enabled):
+    """
+    Turn per-request trace spans on or off at runtime
+    """
+    _state["tracing"] = bool(enabled)
+
+
+def tracing_enabled():
+    return _state["tracing"]
+
+
+class _Span:
+    __slots__ = ("name", "attributes", "children", "started", "duration", "_token")
+
+    def __init__(self, name, attributes):
+        self.name = name
+        self.attributes = attributes
+        self.children = []
+        self.duration = None
+
+    def __enter__(self):
+        parent = _current_span.get()
+        if parent is not None:
+            parent.children.append(self)
+        self._token = _current_span.set(self)
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.duration = time.perf_counter() - self.started
+        if exc_type is not None:
+            self.attributes["error"] = exc_type.__name__
+        _current_span.reset(self._token)
+        if _current_span.get() is None:
+            _recent_traces.append(self.to_dict())
+        return False
+
+    def to_dict(self):
+        return {
+            "name": self.name,
+            "duration_ms": round(self.duration * 1000.0, 3) if self.duration is not None else None,
+            **({"attributes": self.attributes} if self.attributes else {}),
+            **({"children": [child.to_dict() for child in self.children]} if self.children else {}),
+        }
+
+
+def span(name, **attributes):
+    """
+    Context manager recording a trace span; spans opened inside it become
+    its children (across threads only if the context is copied). Finished
+    top-level spans are kept in a bounded buffer, see recent_traces().
+    """
+    if not _state["tracing"]:
+        return _NULL_TIMER
+    return _Span(name, attributes)
+
+
+def recent_traces(limit=20):
+    """
+    Most recent finished traces, newest first
+    """
+    return list(_recent_traces)[::-1][:limit]
+
+
+# ---------------------------------------------------------------------------
+# Sampling profiler (off unless started at runtime)
+
+class SamplingProfiler:
+    """
+    Wall-clock sampling profiler: a daemon thread snapshots every other
+    thread's Python stack every ``interval`` seconds and tallies the
+    collapsed stacks ("outer;inner;leaf"), the input format of flame graph tools
+    """
+
+    def __init__(self, interval=0.01):
+        self.interval = interval
+        self.samples = _Tally()
+        self._stop = threading.Event()
+        self._thread = None
+
+    @property
+    def running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self):
+        if self.running:
+            return self
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="sampling-profiler", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def _run(self):
+        own = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own:
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f"{os.path.basename(code.co_filename)}:{code.co_name}")
+                    frame = frame.f_back
+                self.samples[";".join(reversed(stack))] += 1
+
+    def report(self, limit=None):
+        """
+        Collapsed stacks with sample counts, most frequent first
+
+        Returns:
+            Text with one "stack count" line per distinct stack
+        """
+        return "\n".join(f"{stack} {count}" for stack, count in self.samples.most_common(limit)) + "\n"
+
+
+profiler = SamplingProfiler(interval=float(os.getenv("PLANTDOCTOR_PROFILER_INTERVAL", "0.01")))
+if os.getenv("PLANTDOCTOR_PROFILER", "0").lower() in ("1", "true", "yes"):
+    profiler.start()
@@ -1,62 +1,480 @@
 import os
-import tensorflow as tf
+import threading
+import weakref
 import numpy as np
-import cv2
 import logging
 
-# Setup logging
-logging.basicConfig(level=logging.DEBUG)
+import metrics
+from label_catalog import LabelCatalog
+
 logger = logging.getLogger(__name__)
 
-def load_model(model_path):
+# Graph-mode predictors traced for each loaded model (see build_fast_predictor)
+_fast_predictors = weakref.WeakKeyDictionary()
+
+# cv2 conversion to the model's RGB order, by number of input channels
+# (filled on first use so importing this module does not load OpenCV)
+_TO_RGB = {}
+
+# Runtime backend inferred from the model file extension
+_BACKEND_BY_EXTENSION = {".tflite": "tflite", ".onnx": "onnx"}
+
+class RuntimeBackend:
+    """
+    Common interface for lightweight inference runtimes
+    
+    Keras models are used directly; other runtimes are wrapped in a subclass
+    exposing predict_batch so the rest of the app does not care which one
+    is loaded.
+    """
+    name = "base"
+    input_shape = (None, 224, 224, 3)
+    input_dtype = np.float32
+    accepts_raw_pixels = False
+
+    def predict_batch(self, batch):
+        raise NotImplementedError
+
+class TFLiteBackend(RuntimeBackend):
+    """
+    TensorFlow Lite interpreter backend (uses tflite_runtime when installed)
+    
+    Integer-quantized models are handled transparently: float batches are
+    quantized with the input tensor's scale and zero point and outputs are
+    dequantized back to probabilities.
+    """
+    name = "tflite"
+
+    def __init__(self, model_path, num_threads=None):
+        try:
+            from tflite_runtime.interpreter import Interpreter
+        except ImportError:
+            import tensorflow as tf
+            Interpreter = tf.lite.Interpreter
+        self._interpreter = Interpreter(model_path=model_path, num_threads=num_threads)
+        self._interpreter.allocate_tensors()
+        self._input = self._interpreter.get_input_details()[0]
+        self._output = self._interpreter.get_output_details()[0]
+        self._batch_size = int(self._input["shape"][0])
+        self._lock = threading.Lock()
+        self.input_shape = (None,) + tuple(int(d) for d in self._input["shape"][1:])
+        self.input_dtype = self._input["dtype"]
+        # A uint8 input quantized with scale 1/255 and zero point 0 is exactly
+        # the raw pixel value, so uint8 batches can be fed without conversion
+        scale, zero_point = self._input["quantization"]
+        self.accepts_raw_pixels = (
+            self.input_dtype == np.uint8 and zero_point == 0 and abs(scale * 255.0 - 1.0) < 1e-2
+        )
+
+    def _quantize_input(self, batch):
+        if batch.dtype == np.uint8 and not self.accepts_raw_pixels:
+            batch = batch.astype(np.float32) / 255.0
+        if batch.dtype == self.input_dtype:
+            return batch
+        scale, zero_point = self._input["quantization"]
+        if np.issubdtype(self.input_dtype, np.integer) and scale > 0:
+            info = np.iinfo(self.input_dtype)
+            batch = np.clip(np.round(batch / scale + zero_point), info.min, info.max)
+        return batch.astype(self.input_dtype)
+
+    def _dequantize_output(self, output):
+        scale, zero_point = self._output["quantization"]
+        if np.issubdtype(output.dtype, np.integer) and scale > 0:
+            return (output.astype(np.float32) - zero_point) * scale
+        return output.astype(np.float32, copy=False)
+
+    def predict_batch(self, batch):
+        batch = self._quantize_input(np.asarray(batch))
+        # The interpreter is not thread-safe and resizing reallocates its tensors
+        with self._lock:
+            if len(batch) != self._batch_size:
+                self._interpreter.resize_tensor_input(self._input["index"], batch.shape)
+                self._interpreter.allocate_tensors()
+                self._batch_size = len(batch)
+            self._interpreter.set_tensor(self._input["index"], batch)
+            self._interpreter.invoke()
+            output = self._interpreter.get_tensor(self._output["index"])
+        return self._dequantize_output(output)
+
+class OnnxBackend(RuntimeBackend):
+    """
+    ONNX Runtime backend (CPU execution provider)
+    """
+    name = "onnx"
+
+    def __init__(self, model_path, num_threads=None):
+        import onnxruntime as ort
+        options = ort.SessionOptions()
+        if num_threads:
+            options.intra_op_num_threads = num_threads
+        self._session = ort.InferenceSession(model_path, options, providers=["CPUExecutionProvider"])
+        model_input = self._session.get_inputs()[0]
+        self._input_name = model_input.name
+        self.input_shape = (None,) + tuple(model_input.shape[1:])
+        self.input_dtype = np.float16 if model_input.type == "tensor(float16)" else np.float32
+
+    def predict_batch(self, batch):
+        batch = np.asarray(batch)
+        if batch.dtype == np.uint8:
+            batch = batch.astype(np.float32) / 255.0
+        batch = batch.astype(self.input_dtype, copy=False)
+        output = self._session.run(None, {self._input_name: batch})[0]
+        return output.astype(np.float32, copy=False)
+
+class CascadeModel(RuntimeBackend):
+    """
+    Confidence-gated two-stage classifier
+    
+    A small first-stage model (lower width and/or input resolution) scores
+    every image; only images whose top probability is below ``threshold``
+    are sent to the full model. Both stages must predict the same classes.
+    Calibrate the threshold with calibrate_cascade.py.
+    
+    Args:
+        first: Loaded first-stage model or RuntimeBackend
+        second: Loaded full model or RuntimeBackend
+        threshold: Minimum first-stage top probability (0-1) to skip the full model
+    """
+    name = "cascade"
+
+    def __init__(self, first, second, threshold=0.9):
+        self.first = first
+        self.second = second
+        self.threshold = threshold
+        # Fixed first-stage input size, or None when the model accepts any size
+        dims = tuple(first.input_shape[1:3])
+        self.first_size = dims if all(isinstance(d, int) for d in dims) else None
+        self.input_shape = (None,) + tuple(second.input_shape[1:])
+        self._lock = threading.Lock()
+        self._counts = {"images": 0, "escalated": 0}
+
+    def predict_batch(self, batch):
+        batch = np.asarray(batch)
+        if batch.dtype == np.uint8:
+            batch = batch.astype(np.float32) / 255.0
+        first_input = resize_batch(batch, self.first_size) if self.first_size else batch
+        # The whole cascade is one "forward" observation (see predict_batch);
+        # the stages inside it get their own labels
+        with metrics.STAGE_SECONDS.time(stage="cascade_first"):
+            probabilities = np.array(_forward(self.first, first_input))
+        escalate = probabilities.max(axis=1) < self.threshold
+        escalated = int(escalate.sum())
+        if escalated:
+            with metrics.STAGE_SECONDS.time(stage="cascade_full"):
+                probabilities[escalate] = _forward(self.second, batch[escalate])
+        with self._lock:
+            self._counts["images"] += len(batch)
+            self._counts["escalated"] += escalated
+        metrics.CASCADE_IMAGES.inc(len(batch) - escalated, stage="first")
+        metrics.CASCADE_IMAGES.inc(escalated, stage="escalated")
+        return probabilities
+
+    def stats(self):
+        """
+        Images seen and the fraction escalated to the full model
+        """
+        with self._lock:
+            counts = dict(self._counts)
+        counts["escalation_rate"] = counts["escalated"] / counts["images"] if counts["images"] else 0.0
+        counts["threshold"] = self.threshold
+        return counts
+
+def resize_batch(batch, size):
+    """
+    Resize a preprocessed (N, H, W, C) batch to (N, size[0], size[1], C)
+    
+    Returns:
+        The batch itself when it already has that size
+    """
+    height, width = size
+    if batch.shape[1:3] == (height, width):
+        return batch
+    import cv2
+    out = np.empty((len(batch), height, width, batch.shape[3]), dtype=batch.dtype)
+    for i, image in enumerate(batch):
+        out[i] = cv2.resize(image, (width, height), interpolation=cv2.INTER_AREA).reshape(out.shape[1:])
+    return out
+
+def load_model(model_path, fast_path=True, jit_compile=None, backend=None, num_threads=None, uint8_input=False,
+               first_stage=None, cascade_threshold=0.9):
     """
     Load the MobileNetV2 model from the specified path
     
     Args:
-        model_path: Path to the .h5 model file
+        model_path: Path to the .h5, .tflite or .onnx model file
+        fast_path: Trace and warm up a graph-mode predictor at load time (Keras only)
+        jit_compile: Compile the fast path with XLA (default: PLANTDOCTOR_XLA env var)
+        backend: "keras", "tflite" or "onnx" (default: inferred from the file extension)
+        num_threads: Intra-op thread count for the TFLite/ONNX runtimes
+        uint8_input: Wrap a Keras model so it takes raw uint8 pixels (see build_uint8_model)
+        first_stage: Path of a small first-stage model; when given, returns a
+                     CascadeModel that only runs ``model_path`` on uncertain images
+        cascade_threshold: First-stage confidence (0-1) at which the full model is skipped
         
     Returns:
-        Loaded TensorFlow model
+        Loaded TensorFlow model, or a RuntimeBackend for TFLite/ONNX files and cascades
     """
+    if first_stage:
+        if uint8_input:
+            logger.warning("uint8_input is ignored in cascade mode; both stages take float inputs")
+        options = {"fast_path": fast_path, "jit_compile": jit_compile, "num_threads": num_threads}
+        return CascadeModel(
+            load_model(first_stage, **options), load_model(model_path, backend=backend, **options),
+            threshold=cascade_threshold,
+        )
+
+    if backend is None:
+        backend = _BACKEND_BY_EXTENSION.get(os.path.splitext(model_path)[1].lower(), "keras")
+
     try:
-        logger.info(f"Loading model from {model_path}")
-        model = tf.keras.models.load_model(model_path)
+        logger.info(f"Loading {backend} model from {model_path}")
+        if backend == "tflite":
+            model = TFLiteBackend(model_path, num_threads=num_threads)
+        elif backend == "onnx":
+            model = OnnxBackend(model_path, num_threads=num_threads)
+        elif backend == "keras":
+            # TensorFlow is only imported when a Keras model is actually requested
+            import tensorflow as tf
+            model = tf.keras.models.load_model(model_path)
+            if uint8_input:
+                model = build_uint8_model(model)
+        else:
+            raise ValueError(f"Unknown model backend: {backend}")
         logger.info("Model loaded successfully")
-        return model
     except Exception as e:
         logger.error(f"Error loading model: {str(e)}")
         raise
 
-def preprocess_image(image, target_size=(224, 224)):
+    if fast_path and backend == "keras":
+        if jit_compile is None:
+            jit_compile = os.getenv("PLANTDOCTOR_XLA", "0").lower() in ("1", "true", "yes")
+        build_fast_predictor(model, jit_compile=jit_compile)
+    return model
+
+def build_fast_predictor(model, jit_compile=False, atol=1e-4):
+    """
+    Trace a graph-mode predictor for the model and register it for predict_batch
+    
+    The predictor is a tf.function with a fixed (None, 224, 224, 3) input
+    signature, so it is traced exactly once and serves every batch size
+    without going through the Keras predict loop. It is warmed up here and
+    checked against model.predict; if the outputs differ by more than
+    ``atol`` the fast path is not registered and predictions fall back to
+    the Keras path.
+    
+    Args:
+        model: Loaded TensorFlow model
+        jit_compile: Compile the traced graph with XLA
+        atol: Maximum absolute difference allowed against model.predict
+        
+    Returns:
+        The traced tf.function, or None if verification failed
+    """
+    import tensorflow as tf
+
+    input_spec = tf.TensorSpec(shape=(None,) + tuple(model.input_shape[1:]), dtype=model.input.dtype)
+
+    @tf.function(input_signature=[input_spec], jit_compile=jit_compile)
+    def fast_predict(images):
+        return model(images, training=False)
+
+    try:
+        # Trace and run once so the first user does not pay the tracing cost
+        rng = np.random.default_rng(0)
+        warmup_shape = (2,) + tuple(model.input_shape[1:])
+        if input_spec.dtype.is_integer:
+            warmup_batch = rng.integers(0, 256, warmup_shape).astype(input_spec.dtype.as_numpy_dtype)
+        else:
+            warmup_batch = rng.random(warmup_shape).astype(input_spec.dtype.as_numpy_dtype)
+        fast_output = fast_predict(warmup_batch).numpy()
+        reference = model.predict(warmup_batch, verbose=0)
+    except Exception as e:
+        logger.warning(f"Fast-path predictor unavailable, using model.predict_on_batch: {str(e)}")
+        return None
+
+    max_diff = float(np.max(np.abs(fast_output - reference)))
+    if max_diff > atol:
+        logger.warning(f"Fast-path predictor differs from model.predict by {max_diff:.2e}; not using it")
+        return None
+
+    _fast_predictors[model] = fast_predict
+    logger.info(f"Fast-path predictor ready (xla={jit_compile}, max_diff={max_diff:.2e})")
+    return fast_predict
+
+def load_image_file(path):
+    """
+    Decode an image file the same way the Gradio upload widget does
+    
+    Args:
+        path: Path (or file-like object) of the image
+        
+    Returns:
+        RGB uint8 numpy array
+    """
+    from PIL import Image
+    with metrics.STAGE_SECONDS.time(stage="decode"), Image.open(path) as image:
+        return np.array(image.convert("RGB"))
+
+@metrics.timed(metrics.STAGE_SECONDS, stage="preprocess")
+def preprocess_batch(images, out=None, target_size=(224, 224), dtype=np.float32):
+    """
+    Preprocess a list of images straight into one model input batch
+    
+    Each image is resized once on its original pixels, converted to RGB in a
+    small reused scratch buffer and normalized with a single write into
+    ``out``. Grayscale and RGBA images are accepted: gray is broadcast to
+    three channels and alpha is dropped.
+    
+    Args:
+        images: List of H x W, H x W x 1, H x W x 3 or H x W x 4 arrays of any size
+        out: Optional preallocated (N, H, W, 3) buffer to reuse; only the
+             first len(images) rows are written
+        target_size: Target size for model input (default: 224x224)
+        dtype: np.float32 for [0, 1] inputs, or np.uint8 to skip the float
+               conversion for models that take raw pixels
+    
+    Returns:
+        Batch of shape (len(images), H, W, 3), a view into ``out`` when given
+    """
+    import cv2
+
+    if not _TO_RGB:
+        _TO_RGB.update({1: cv2.COLOR_GRAY2RGB, 3: cv2.COLOR_BGR2RGB, 4: cv2.COLOR_BGRA2RGB})
+
+    try:
+        width, height = target_size
+        n = len(images)
+        if out is None:
+            out = np.empty((n, height, width, 3), dtype=dtype)
+        elif out.shape[0] < n or out.shape[1:] != (height, width, 3) or out.dtype != dtype:
+            raise ValueError(
+                f"Buffer {out.shape}/{out.dtype} cannot hold {n} images of {target_size}/{np.dtype(dtype)}"
+            )
+        batch = out[:n]
+
+        # Small uint8 scratch image reused for the channel conversion
+        scratch = np.empty((height, width, 3), dtype=np.uint8)
+
+        for i, image in enumerate(images):
+            image = np.asarray(image)
+            if image.ndim == 3 and image.shape[2] == 1:
+                image = image[..., 0]
+            if image.shape[:2] != (height, width):
+                image = cv2.resize(image, target_size)
+
+            # Grayscale is broadcast to RGB, alpha is dropped, BGR is converted to RGB
+            channels = image.shape[2] if image.ndim == 3 else 1
+            rgb = cv2.cvtColor(image, _TO_RGB[channels], dst=scratch if image.dtype == np.uint8 else None)
+
+            if batch.dtype == np.uint8:
+                batch[i] = rgb
+            else:
+                np.divide(rgb, np.float32(255.0), out=batch[i], casting="unsafe")
+
+        return batch
+    except Exception as e:
+        logger.error(f"Error preprocessing image batch: {str(e)}")
+        raise
+
+def preprocess_image(image, target_size=(224, 224), dtype=np.float32):
     """
     Preprocess the image for model input
     
     Args:
         image: Input image (numpy array from OpenCV)
         target_size: Target size for model input (default: 224x224)
-        
+        dtype: np.float32 for [0, 1] inputs, or np.uint8 for raw-pixel models
+    
     Returns:
         Preprocessed image ready for model input
     """
-    try:
-        # Convert BGR to RGB if from OpenCV
-        if len(image.shape) == 3 and image.shape[2] == 3:
-            image = cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
-        
-        # Resize image
-        image_resized = cv2.resize(image, target_size)
-        
-        # Convert to float and normalize
-        image_normalized = image_resized.astype(np.float32) / 255.0
-        
-        # Expand dimensions to create batch
-        image_batch = np.expand_dims(image_normalized, axis=0)
+    return preprocess_batch([image], target_size=target_size, dtype=dtype)
+
+def model_input_dtype(model):
+    """
+    Pixel dtype the loaded model expects from preprocess_image/preprocess_batch
+    
+    Args:
+        model: Loaded TensorFlow model or RuntimeBackend
+    
+    Returns:
+        np.uint8 for raw-pixel models, otherwise np.float32
+    """
+    if isinstance(model, RuntimeBackend):
+        return np.uint8 if model.accepts_raw_pixels else np.float32
+    return np.uint8 if model.input.dtype.as_numpy_dtype == np.uint8 else np.float32
+
+def build_uint8_model(model):
+    """
+    Wrap a Keras model so it takes raw uint8 pixels and normalizes in-graph
+    
+    Args:
+        model: Loaded Keras model expecting [0, 1] float inputs
+    
+    Returns:
+        Keras model with a uint8 (None, 224, 224, 3) input
+    """
+    import tensorflow as tf
+
+    inputs = tf.keras.Input(shape=model.input_shape[1:], dtype=tf.uint8)
+    scaled = tf.keras.layers.Rescaling(1.0 / 255)(tf.cast(inputs, tf.float32))
+    return tf.keras.Model(inputs, model(scaled), name=f"{model.name}_uint8")
+
+@metrics.timed(metrics.STAGE_SECONDS, stage="forward")
+def predict_batch(model, batch):
+    """
+    Run a single forward pass over a batch of preprocessed images
+    
+    Args:
+        model: Loaded TensorFlow model or RuntimeBackend
+        batch: Preprocessed image batch of shape (N, 224, 224, 3)
         
-        return image_batch
+    Returns:
+        Numpy array of class probabilities with shape (N, num_classes)
+    """
+    metrics.BATCH_IMAGES.observe(len(batch))
+    try:
+        return _forward(model, batch)
     except Exception as e:
-        logger.error(f"Error preprocessing image: {str(e)}")
+        logger.error(f"Error running batch prediction: {str(e)}")
         raise
 
+def _forward(model, batch):
+    # Un-instrumented forward pass, also used for the stages inside a cascade
+    if isinstance(model, RuntimeBackend):
+        return model.predict_batch(batch)
+    fast_predict = _fast_predictors.get(model)
+    if fast_predict is not None:
+        return fast_predict(batch).numpy()
+    # predict_on_batch skips the data adapter that model.predict builds per call
+    return np.asarray(model.predict_on_batch(batch))
+
+@metrics.timed(metrics.STAGE_SECONDS, stage="label_lookup")
+def decode_prediction(probabilities, class_labels):
+    """
+    Convert one row of class probabilities into a label and confidence
+    
+    Args:
+        probabilities: 1-D array of class probabilities
+        class_labels: Dictionary mapping class indices to labels, or a LabelCatalog
+        
+    Returns:
+        Tuple of (predicted disease label, confidence percentage)
+    """
+    if isinstance(class_labels, LabelCatalog):
+        return class_labels.decode(probabilities)
+
+    # Get the predicted class index
+    predicted_class_idx = int(np.argmax(probabilities))
+    
+    # Get confidence score
+    confidence = float(probabilities[predicted_class_idx] * 100)
+    
+    # Convert to label
+    label = class_labels.get(str(predicted_class_idx), f"Unknown class {predicted_class_idx}")
+    
+    return label, confidence
+
 def predict_disease(model, preprocessed_image, class_labels):
     """
     Predict disease from preprocessed image
@@ -71,18 +489,9 @@ def predict_disease(model, preprocessed_image, class_labels):
     """
     try:
         # Make prediction
-        predictions = model.predict(preprocessed_image)
-        
-        # Get the predicted class index
-        predicted_class_idx = np.argmax(predictions[0])
-        
-        # Get confidence score
-        confidence = float(predictions[0][predicted_class_idx] * 100)
-        
-        # Convert to label
-        label = class_labels.get(str(predicted_class_idx), f"Unknown class {predicted_class_idx}")
+        predictions = predict_batch(model, preprocessed_image)
         
-        return label, confidence
+        return decode_prediction(predictions[0], class_labels)
     except Exception as e:
         logger.error(f"Error making prediction: {str(e)}")
         raise
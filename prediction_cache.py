@@ -0,0 +1,293 @@
+import os
+import time
+import hashlib
+import sqlite3
+import logging
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+import metrics
+
+logger = logging.getLogger(__name__)
+
+
+def content_key(image):
+    """
+    Fast content hash of a decoded pixel buffer (shape and dtype included)
+
+    Uses xxhash when it is installed and BLAKE2b otherwise.
+
+    Args:
+        image: Decoded image as a numpy array
+
+    Returns:
+        Hex digest string
+    """
+    image = np.ascontiguousarray(image)
+    header = f"{image.shape}|{image.dtype}".encode()
+    try:
+        import xxhash
+        hasher = xxhash.xxh3_128(header)
+    except ImportError:
+        hasher = hashlib.blake2b(header, digest_size=16)
+    hasher.update(memoryview(image).cast("B"))
+    return hasher.hexdigest()
+
+
+def perceptual_hash(image):
+    """
+    64-bit difference hash (dHash) used to match near-duplicate uploads
+
+    Args:
+        image: Decoded image as a numpy array (grayscale, RGB or RGBA)
+
+    Returns:
+        Hash as an int
+    """
+    import cv2
+
+    small = cv2.resize(np.asarray(image), (9, 8), interpolation=cv2.INTER_AREA)
+    if small.ndim == 3:
+        small = small[..., :3].mean(axis=2)
+    bits = (small[:, 1:] > small[:, :-1]).ravel()
+    return int.from_bytes(np.packbits(bits).tobytes(), "big")
+
+
+def files_fingerprint(paths, salt=""):
+    """
+    Fingerprint of the files a cached prediction depends on
+
+    Args:
+        paths: Model file, label file, ...
+        salt: Extra text mixed in, e.g. the model load options
+
+    Returns:
+        Hex digest that changes whenever any file is replaced or modified, or the salt changes
+    """
+    hasher = hashlib.blake2b(digest_size=8)
+    hasher.update(f"{salt}\n".encode())
+    for path in paths:
+        try:
+            stat = os.stat(path)
+            hasher.update(f"{path}|{stat.st_size}|{stat.st_mtime_ns}\n".encode())
+        except OSError:
+            hasher.update(f"{path}|missing\n".encode())
+    return hasher.hexdigest()
+
+
+class PredictionCache:
+    """
+    Content-addressed cache of diagnoses keyed by the decoded pixel buffer.
+
+    Lookups go through an in-process LRU bounded by entry count and TTL,
+    then an optional SQLite tier that survives restarts, then (optionally)
+    a perceptual-hash scan of the in-memory entries for near-duplicate
+    images. Every entry is tied to the fingerprint of ``watch_paths`` and
+    ``salt`` (settings that change predictions without touching a file, such
+    as the cascade threshold) taken when the model was loaded: pass it as
+    ``fingerprint`` or call ``bind()`` after loading. SQLite rows written
+    under any other fingerprint are discarded at startup and on ``bind()``.
+
+    If a watched file changes while the old model is still in memory, its
+    results are no longer written to SQLite (they would otherwise be served
+    for the new file after a restart) until ``bind()`` is called for the
+    reloaded model.
+    """
+
+    def __init__(self, watch_paths, max_entries=1024, ttl_seconds=3600.0, disk_path=None,
+                 near_duplicate_distance=0, check_interval=5.0, salt="", fingerprint=None):
+        self.watch_paths = list(watch_paths)
+        self.salt = salt
+        self.max_entries = max_entries
+        self.ttl = ttl_seconds
+        self.near_duplicate_distance = near_duplicate_distance
+        self.check_interval = check_interval
+
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()  # key -> (value, created_at, perceptual hash or None)
+        self._fingerprint = fingerprint or files_fingerprint(self.watch_paths, salt)
+        self._files_changed = False
+        self._checked_at = time.monotonic()
+        self._counters = {"hits": 0, "disk_hits": 0, "near_hits": 0, "misses": 0, "evictions": 0, "invalidations": 0}
+
+        self._db = None
+        if disk_path:
+            self._db = sqlite3.connect(disk_path, check_same_thread=False)
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS predictions ("
+                "key TEXT PRIMARY KEY, fingerprint TEXT, label TEXT, confidence REAL, created REAL)"
+            )
+            self._purge_disk()
+
+    def bind(self, fingerprint):
+        """
+        Tie the cache to the files a (re)loaded model was built from
+
+        Entries computed under a different fingerprint are dropped and
+        SQLite writes resume.
+
+        Args:
+            fingerprint: files_fingerprint(watch_paths, salt) taken before loading
+        """
+        with self._lock:
+            if fingerprint != self._fingerprint:
+                self._fingerprint = fingerprint
+                self._entries.clear()
+                self._counters["invalidations"] += 1
+                if self._db is not None:
+                    self._purge_disk()
+            self._files_changed = False
+            self._checked_at = time.monotonic()
+
+    def get_or_compute(self, image, compute):
+        """
+        Return the cached (label, confidence) for an image, computing it on a miss
+
+        Args:
+            image: Decoded image as a numpy array
+            compute: Zero-argument callable returning (label, confidence)
+
+        Returns:
+            Tuple of (label, confidence percentage)
+        """
+        key = content_key(image)
+        phash = perceptual_hash(image) if self.near_duplicate_distance > 0 else None
+
+        value = self.get(key, phash)
+        if value is not None:
+            return value
+
+        value = compute()
+        self.put(key, value, phash)
+        return value
+
+    def get(self, key, phash=None):
+        """
+        Look up a content key (and, if given, near-duplicates of its perceptual hash)
+
+        Returns:
+            Cached (label, confidence) or None
+        """
+        now = time.time()
+        with self._lock:
+            self._check_fingerprint()
+
+            entry = self._entries.get(key)
+            if entry is not None and now - entry[1] <= self.ttl:
+                self._entries.move_to_end(key)
+                self._counters["hits"] += 1
+                metrics.CACHE_REQUESTS.inc(cache="prediction", result="hit")
+                return entry[0]
+            if entry is not None:
+                del self._entries[key]
+
+            value = self._disk_get(key, now)
+            if value is not None:
+                self._store(key, value, now, phash)
+                self._counters["disk_hits"] += 1
+                metrics.CACHE_REQUESTS.inc(cache="prediction", result="disk_hit")
+                return value
+
+            if phash is not None:
+                value = self._near_duplicate(phash, now)
+                if value is not None:
+                    self._counters["near_hits"] += 1
+                    metrics.CACHE_REQUESTS.inc(cache="prediction", result="near_hit")
+                    return value
+
+            self._counters["misses"] += 1
+            metrics.CACHE_REQUESTS.inc(cache="prediction", result="miss")
+            return None
+
+    def put(self, key, value, phash=None):
+        """
+        Store a (label, confidence) result under a content key
+        """
+        now = time.time()
+        with self._lock:
+            self._check_fingerprint()
+            self._store(key, value, now, phash)
+            if self._db is not None and not self._files_changed:
+                self._db.execute(
+                    "INSERT OR REPLACE INTO predictions VALUES (?, ?, ?, ?, ?)",
+                    (key, self._fingerprint, value[0], value[1], now),
+                )
+                self._db.commit()
+
+    def clear(self):
+        """
+        Drop every cached entry, in memory and on disk
+        """
+        with self._lock:
+            self._entries.clear()
+            if self._db is not None:
+                self._db.execute("DELETE FROM predictions")
+                self._db.commit()
+
+    def stats(self):
+        """
+        Hit/miss counters and current size
+
+        Returns:
+            Dictionary of counters plus ``entries``, ``hit_rate`` and
+            ``files_changed`` (a watched file changed since the model was loaded)
+        """
+        with self._lock:
+            counters = dict(self._counters)
+            counters["entries"] = len(self._entries)
+            counters["files_changed"] = self._files_changed
+        lookups = counters["hits"] + counters["disk_hits"] + counters["near_hits"] + counters["misses"]
+        counters["hit_rate"] = (lookups - counters["misses"]) / lookups if lookups else 0.0
+        return counters
+
+    def _store(self, key, value, now, phash):
+        self._entries[key] = (value, now, phash)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self._counters["evictions"] += 1
+
+    def _disk_get(self, key, now):
+        if self._db is None:
+            return None
+        row = self._db.execute(
+            "SELECT label, confidence, created FROM predictions WHERE key = ? AND fingerprint = ?",
+            (key, self._fingerprint),
+        ).fetchone()
+        if row is None or now - row[2] > self.ttl:
+            return None
+        return row[0], row[1]
+
+    def _near_duplicate(self, phash, now):
+        candidates = [(value, h) for value, created, h in self._entries.values()
+                      if h is not None and now - created <= self.ttl]
+        if not candidates:
+            return None
+        hashes = np.array([h for _, h in candidates], dtype=np.uint64)
+        distances = np.unpackbits((hashes ^ np.uint64(phash)).view(np.uint8)).reshape(-1, 64).sum(axis=1)
+        best = int(np.argmin(distances))
+        if distances[best] <= self.near_duplicate_distance:
+            return candidates[best][0]
+        return None
+
+    def _purge_disk(self):
+        self._db.execute("DELETE FROM predictions WHERE fingerprint != ?", (self._fingerprint,))
+        self._db.commit()
+
+    def _check_fingerprint(self):
+        """
+        Notice a model or label file changing under the loaded model (rate-limited stat calls)
+
+        In-memory entries still match the model that is serving requests and
+        are kept; only the SQLite tier stops taking writes.
+        """
+        now = time.monotonic()
+        if now - self._checked_at < self.check_interval:
+            return
+        self._checked_at = now
+        changed = files_fingerprint(self.watch_paths, self.salt) != self._fingerprint
+        if changed and not self._files_changed:
+            logger.warning("Model or label file changed on disk; not persisting predictions until the model is reloaded")
+        self._files_changed = changed
@@ -0,0 +1,83 @@
+import os
+
+import uvicorn
+import gradio as gr
+from fastapi import FastAPI
+from fastapi.responses import JSONResponse, PlainTextResponse
+
+import app as plantdoctor
+import metrics
+
+# Runtime switches for metrics, tracing and the sampling profiler (off by default:
+# anyone who can reach the server could otherwise turn the profiler on)
+DEBUG_ENDPOINTS = os.getenv("PLANTDOCTOR_DEBUG_ENDPOINTS", "0").lower() in ("1", "true", "yes")
+
+# Health endpoints are registered before Gradio is mounted at "/" so they take precedence
+api = FastAPI()
+
+@api.get("/healthz")
+def healthz():
+    """
+    Liveness: the web server is up (the model may still be warming up)
+    """
+    return {"status": "ok"}
+
+@api.get("/ready")
+def ready():
+    """
+    Readiness: 200 once the diagnosis model is loaded and warm, 503 before
+    that (or if warm-up failed), with the startup timing breakdown
+    """
+    status = plantdoctor.runtime.status()
+    return JSONResponse(status, status_code=200 if status["ready"] else 503)
+
+@api.get("/metrics")
+def prometheus_metrics():
+    """
+    Hot-path timers and counters in the Prometheus text format
+    """
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
+if DEBUG_ENDPOINTS:
+    @api.post("/debug/metrics")
+    def toggle_metrics(enabled: bool):
+        metrics.set_enabled(enabled)
+        return {"metrics": metrics.enabled()}
+
+    @api.post("/debug/tracing")
+    def toggle_tracing(enabled: bool):
+        metrics.set_tracing(enabled)
+        return {"tracing": metrics.tracing_enabled()}
+
+    @api.get("/debug/traces")
+    def traces(limit: int = 20):
+        """
+        Most recent per-request trace spans, newest first
+        """
+        return {"tracing": metrics.tracing_enabled(), "traces": metrics.recent_traces(limit)}
+
+    @api.post("/debug/profiler")
+    def toggle_profiler(enabled: bool, reset: bool = False):
+        if reset:
+            metrics.profiler.samples.clear()
+        if enabled:
+            metrics.profiler.start()
+        else:
+            metrics.profiler.stop()
+        return {"profiler": metrics.profiler.running, "samples": sum(metrics.profiler.samples.values())}
+
+    @api.get("/debug/profile")
+    def profile(limit: int = 200):
+        """
+        Sampled stacks in the collapsed format read by flamegraph.pl and speedscope
+        """
+        return PlainTextResponse(metrics.profiler.report(limit))
+
+api = gr.mount_gradio_app(api, plantdoctor.app, path="/")
+
+if __name__ == "__main__":
+    uvicorn.run(
+        api,
+        host=os.getenv("GRADIO_SERVER_NAME", "0.0.0.0"),
+        port=int(os.getenv("GRADIO_SERVER_PORT", "7860")),
+    )
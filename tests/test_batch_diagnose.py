@@ -0,0 +1,107 @@
+import os
+import csv
+import json
+import tarfile
+
+import numpy as np
+import pytest
+from PIL import Image
+
+from batch_diagnose import ResultWriter, _repair_tail, diagnose_stream, iter_sources, load_completed
+from label_catalog import LabelCatalog
+from model_loader import RuntimeBackend
+from treatments import DEMO_TREATMENTS
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+class ConstantBackend(RuntimeBackend):
+    """
+    Backend that is certain every image shows class 29 (Tomato - Bacterial Spot)
+    """
+    name = "constant"
+
+    def predict_batch(self, batch):
+        probabilities = np.full((len(batch), 39), 0.1 / 38, dtype=np.float32)
+        probabilities[:, 29] = 0.9
+        return probabilities
+
+
+@pytest.fixture(scope="module")
+def catalog():
+    return LabelCatalog.load(os.path.join(REPO_ROOT, "class_labels.json"), DEMO_TREATMENTS)
+
+
+@pytest.fixture
+def photos(tmp_path):
+    folder = tmp_path / "photos"
+    folder.mkdir()
+    rng = np.random.default_rng(0)
+    for i in range(6):
+        Image.fromarray(rng.integers(0, 255, (64, 48, 3), dtype=np.uint8)).save(folder / f"leaf{i}.png")
+    (folder / "broken.jpg").write_bytes(b"not an image")
+    return folder
+
+
+def run(catalog, items, output, fmt):
+    writer = ResultWriter(str(output), fmt)
+    try:
+        return diagnose_stream(ConstantBackend(), catalog, items, writer, batch_size=4, workers=2)
+    finally:
+        writer.close()
+
+
+def read_rows(output, fmt):
+    with open(output, newline="", encoding="utf-8") as f:
+        if fmt == "jsonl":
+            return [json.loads(line) for line in f]
+        return list(csv.DictReader(f))
+
+
+@pytest.mark.parametrize("fmt, torn", [
+    ("jsonl", '{"path": "half-writ'),
+    ("csv", "half-written.png,Tomato - Bac"),
+])
+def test_resume_after_torn_tail(tmp_path, photos, catalog, fmt, torn):
+    output = tmp_path / f"results.{fmt}"
+    items = list(iter_sources(str(photos)))
+    assert run(catalog, items[:3], output, fmt) == 3
+    with open(output, "a", encoding="utf-8") as f:
+        f.write(torn)
+
+    completed = load_completed(str(output), fmt)
+    assert completed == {name for name, _ in items[:3]}
+    assert run(catalog, [(n, p) for n, p in items if n not in completed], output, fmt) == len(items) - 3
+
+    rows = read_rows(output, fmt)
+    assert sorted(row["path"] for row in rows) == sorted(name for name, _ in items)
+    by_name = {os.path.basename(row["path"]): row for row in rows}
+    assert by_name["leaf0.png"]["label"] == "Tomato - Bacterial Spot"
+    assert by_name["broken.jpg"]["error"]
+
+
+def test_repair_tail_reads_backwards_in_blocks(tmp_path):
+    output = tmp_path / "results.jsonl"
+    output.write_bytes(b'{"path": "a"}\n{"path": "b"}\n' + b"x" * 100)
+    _repair_tail(str(output), block_size=8)
+    assert output.read_bytes() == b'{"path": "a"}\n{"path": "b"}\n'
+
+    output.write_bytes(b"no newline at all")
+    _repair_tail(str(output), block_size=4)
+    assert output.read_bytes() == b""
+
+
+def test_tar_input(tmp_path, photos, catalog):
+    archive = tmp_path / "photos.tar.gz"
+    with tarfile.open(archive, "w:gz") as tar:
+        for name in sorted(os.listdir(photos)):
+            tar.add(photos / name, arcname=f"survey/{name}")
+        tar.add(photos / "leaf0.png", arcname="survey/notes.txt")
+
+    output = tmp_path / "results.jsonl"
+    assert run(catalog, iter_sources(str(archive)), output, "jsonl") == 7
+
+    rows = {row["path"]: row for row in read_rows(output, "jsonl")}
+    assert set(rows) == {f"survey/leaf{i}.png" for i in range(6)} | {"survey/broken.jpg"}
+    assert rows["survey/leaf3.png"]["top_k"][0] == {"label": "Tomato - Bacterial Spot", "confidence": 90.0}
+    assert rows["survey/broken.jpg"]["label"] is None and rows["survey/broken.jpg"]["error"]
@@ -0,0 +1,135 @@
+import os
+import json
+
+import numpy as np
+import pytest
+from PIL import Image
+
+import calibrate_cascade
+from calibrate_cascade import calibrate, labeled_images, match_label
+from label_catalog import LabelCatalog
+from model_loader import CascadeModel, RuntimeBackend
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+NUM_CLASSES = 39
+
+
+class FirstStage(RuntimeBackend):
+    """
+    Confident (0.95 on class 1) about bright images, unsure (0.5 on class 2) about dark ones
+    """
+    name = "first"
+
+    def __init__(self):
+        self.batches = []
+
+    def predict_batch(self, batch):
+        self.batches.append(np.array(batch))
+        probabilities = np.zeros((len(batch), NUM_CLASSES), dtype=np.float32)
+        bright = batch.reshape(len(batch), -1).mean(axis=1) > 0.5
+        probabilities[bright, 1] = 0.95
+        probabilities[bright, 0] = 0.05
+        probabilities[~bright, 2] = 0.5
+        probabilities[~bright, 0] = 0.5
+        return probabilities
+
+
+class FullModel(RuntimeBackend):
+    """
+    Always predicts class 3
+    """
+    name = "full"
+
+    def __init__(self):
+        self.batches = []
+
+    def predict_batch(self, batch):
+        self.batches.append(np.array(batch))
+        return np.tile(np.eye(NUM_CLASSES, dtype=np.float32)[3], (len(batch), 1))
+
+
+def images(*levels):
+    return np.stack([np.full((224, 224, 3), level, dtype=np.float32) for level in levels])
+
+
+def test_only_uncertain_rows_are_escalated():
+    first, full = FirstStage(), FullModel()
+    cascade = CascadeModel(first, full, threshold=0.9)
+    batch = images(0.9, 0.1, 0.8, 0.2, 0.7)
+
+    probabilities = cascade.predict_batch(batch)
+    assert probabilities.argmax(axis=1).tolist() == [1, 3, 1, 3, 1]
+    assert len(full.batches) == 1
+    np.testing.assert_array_equal(full.batches[0], batch[[1, 3]])
+    assert cascade.stats() == {"images": 5, "escalated": 2, "escalation_rate": 0.4, "threshold": 0.9}
+
+    # A fully confident batch never reaches the full model
+    cascade.predict_batch(images(0.9, 0.6))
+    assert len(full.batches) == 1
+    assert cascade.stats()["images"] == 7 and cascade.stats()["escalated"] == 2
+
+
+def test_uint8_input_and_threshold():
+    first, full = FirstStage(), FullModel()
+    cascade = CascadeModel(first, full, threshold=0.99)
+    probabilities = cascade.predict_batch(np.full((2, 224, 224, 3), 255, dtype=np.uint8))
+    # Pixels are scaled to [0, 1] for both stages; 0.95 is below the threshold
+    assert first.batches[0].dtype == np.float32 and first.batches[0].max() == 1.0
+    assert probabilities.argmax(axis=1).tolist() == [3, 3]
+    assert cascade.stats()["escalation_rate"] == 1.0
+
+
+@pytest.fixture(scope="module")
+def catalog():
+    with open(os.path.join(REPO_ROOT, "class_labels.json")) as f:
+        return LabelCatalog(json.load(f))
+
+
+@pytest.mark.parametrize("name, label", [
+    ("Tomato - Late Blight", "Tomato - Late Blight"),
+    ("Tomato___Late_blight", "Tomato - Late Blight"),
+    ("Corn_(maize)___Common_rust_", "Corn - Common Rust"),
+])
+def test_folder_names_match_labels(catalog, name, label):
+    assert match_label(name, catalog) == label
+
+
+@pytest.mark.parametrize("name, message", [
+    ("Durian___Leaf_curl", "no class label matches"),
+    ("Gray_leaf_spot", "ambiguous"),
+])
+def test_unmatched_or_ambiguous_folder_fails(tmp_path, catalog, name, message):
+    (tmp_path / "Apple___Black_rot").mkdir()
+    (tmp_path / name).mkdir()
+    with pytest.raises(ValueError, match=message):
+        labeled_images(str(tmp_path), catalog)
+
+
+def test_two_folders_for_one_class_fail(tmp_path, catalog):
+    (tmp_path / "Apple___Black_rot").mkdir()
+    (tmp_path / "Apple - Black Rot").mkdir()
+    with pytest.raises(ValueError, match="both map to 'Apple - Black Rot'"):
+        labeled_images(str(tmp_path), catalog)
+
+
+def test_calibrate_streams_fixed_size_batches(tmp_path, monkeypatch):
+    samples = []
+    for i, level in enumerate([230, 20, 200, 40, 250, 10, 220]):
+        path = tmp_path / f"leaf{i}.png"
+        Image.fromarray(np.full((32, 32, 3), level, dtype=np.uint8)).save(path)
+        samples.append((str(path), 1 if level > 128 else 3))
+    samples.append((str(tmp_path / "missing.png"), 1))
+
+    models = {"first.h5": FirstStage(), "full.h5": FullModel()}
+    monkeypatch.setattr(calibrate_cascade, "load_model", lambda path: models[path])
+    report = calibrate("first.h5", "full.h5", iter(samples), thresholds=[0.5, 0.9, 0.99], batch_size=3)
+
+    assert [len(b) for b in models["first.h5"].batches] == [3, 3, 1]
+    assert [len(b) for b in models["full.h5"].batches] == [3, 3, 1]
+    assert report["images"] == 7
+    assert report["first_stage"]["accuracy"] == pytest.approx(4 / 7)
+    assert report["full_model"]["accuracy"] == pytest.approx(3 / 7)
+    rows = {row["threshold"]: row for row in report["thresholds"]}
+    assert rows[0.5]["escalation_rate"] == 0.0 and rows[0.5]["accuracy"] == pytest.approx(4 / 7)
+    assert rows[0.9]["escalation_rate"] == pytest.approx(3 / 7) and rows[0.9]["accuracy"] == 1.0
+    assert rows[0.99]["escalation_rate"] == 1.0 and rows[0.99]["accuracy_drop"] == 0.0
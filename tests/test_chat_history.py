@@ -0,0 +1,91 @@
+import pytest
+
+import chat_history
+from chat_history import ChatHistoryStore, estimate_tokens
+
+
+class Clock:
+    def __init__(self, now=1_000_000.0):
+        self.now = now
+
+    def time(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(chat_history, "time", clock)
+    return clock
+
+
+def questions(store, session_id):
+    return [m["content"] for m in store.context(session_id) if m["role"] == "user"]
+
+
+def test_least_recently_used_session_is_evicted(clock):
+    store = ChatHistoryStore(max_sessions=2)
+    store.append("a", "Why are my tomato leaves yellow?", "Probably early blight.")
+    store.append("b", "When should I water?", "Early in the morning.")
+    clock.now += 1
+    # Touching "a" makes "b" the least recently used
+    assert questions(store, "a") == ["Why are my tomato leaves yellow?"]
+    store.append("c", "Is this rust?", "Yes, common rust.")
+
+    assert store.stats()["sessions"] == 2
+    assert store.stats()["evictions"] == 1
+    assert store.context("b") == []
+    assert questions(store, "a") and questions(store, "c")
+
+
+def test_idle_sessions_expire(clock):
+    store = ChatHistoryStore(idle_ttl=60.0)
+    store.append("a", "Why are my tomato leaves yellow?", "Probably early blight.")
+    clock.now += 30
+    store.append("b", "When should I water?", "Early in the morning.")
+    clock.now += 45
+
+    # "a" has been idle for 75 s, "b" for 45 s
+    assert store.context("a") == []
+    assert questions(store, "b") == ["When should I water?"]
+    clock.now += 61
+    store.append("c", "Is this rust?", "Yes, common rust.")
+    assert store.stats()["sessions"] == 1
+
+
+def test_sessions_survive_a_restart_in_sqlite(tmp_path, clock):
+    path = str(tmp_path / "chat.db")
+    store = ChatHistoryStore(disk_path=path, max_turns=2)
+    for i in range(4):
+        store.append("a", f"Question {i}?", f"Answer {i}. More detail.")
+    store.append("b", "Forget me?", "Yes.")
+    store.clear("b")
+
+    restarted = ChatHistoryStore(disk_path=path, max_turns=2)
+    messages = restarted.context("a")
+    assert restarted.stats()["disk_hits"] == 1
+    assert messages[0]["role"] == "system" and "Q: Question 1? A: Answer 1." in messages[0]["content"]
+    assert [m["content"] for m in messages[1:] if m["role"] == "user"] == ["Question 2?", "Question 3?"]
+    assert restarted.context("b") == []
+
+    # Sessions idle for longer than the retention period are dropped at startup
+    clock.now += 3600
+    expired = ChatHistoryStore(disk_path=path, retention=1800.0)
+    assert expired.context("a") == []
+
+
+@pytest.mark.parametrize("budget", [40, 100, 250, 1000])
+def test_context_stays_within_the_token_budget(budget):
+    store = ChatHistoryStore(max_turns=6, summary_tokens=200)
+    for i in range(20):
+        store.append("a", f"Question number {i} about my tomato plants? " * 3,
+                     f"Answer {i}: remove the affected leaves. " + "Keep the soil evenly moist. " * 10)
+
+    messages = store.context("a", budget_tokens=budget)
+    assert sum(estimate_tokens(m["content"]) for m in messages) <= budget
+    turns = [m for m in messages if m["role"] != "system"]
+    # The newest turns are kept first, in chronological order
+    if turns:
+        assert turns[-1]["content"].startswith("Answer 19:")
+    if budget >= 250:
+        assert messages[0]["role"] == "system" and len(turns) >= 2
@@ -0,0 +1,66 @@
+import json
+import os
+
+import pytest
+
+from chat_prefilter import RelevanceClassifier, SemanticAnswerCache
+from treatments import DEMO_TREATMENTS
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+@pytest.fixture(scope="module")
+def classifier():
+    with open(os.path.join(REPO_ROOT, "class_labels.json")) as f:
+        return RelevanceClassifier(json.load(f), DEMO_TREATMENTS)
+
+
+@pytest.mark.parametrize("question", [
+    "How do I handle errors in Rust?",
+    "How does a nuclear power plant work?",
+    "What is a field in a database schema?",
+    "How do I set a random seed in numpy?",
+    "What is the bond yield today?",
+    "How do I update my Apple Watch?",
+])
+def test_one_ambiguous_term_is_left_to_the_remote_check(classifier, question):
+    assert classifier.classify(question) is None
+
+
+@pytest.mark.parametrize("question", [
+    "How do I treat late blight?",
+    "My tomatoes have yellow leaves",
+    "What causes powdery mildew on squash?",
+    "How much fertilizer does a rice field need?",
+    "How to control aphids on my crop?",
+])
+def test_label_names_or_several_strong_terms_are_agricultural(classifier, question):
+    assert classifier.classify(question) is True
+
+
+def test_off_topic_without_agriculture_evidence(classifier):
+    assert classifier.classify("Who won the football match?") is False
+    assert classifier.classify("Which python library plots leaf blight data?") is None
+
+
+@pytest.mark.parametrize("cached, asked", [
+    ("Should I water tomatoes daily?", "Should I not water tomatoes daily?"),
+    ("Should I water tomatoes daily?", "Shouldn't I water tomatoes daily?"),
+    ("Can I grow rice with fertilizer?", "Can I grow rice without fertilizer?"),
+    ("Can I grow rice without fertilizer?", "Can I grow rice with fertilizer?"),
+])
+def test_answer_cache_keeps_polarity(cached, asked):
+    cache = SemanticAnswerCache()
+    cache.put(cached, "cached answer")
+    assert cache.get(asked) is None
+
+
+def test_answer_cache_serves_near_duplicates():
+    cache = SemanticAnswerCache()
+    cache.put("Should I water tomatoes daily?", "water")
+    cache.put("Should I not water tomatoes daily?", "do not water")
+
+    assert cache.get("should i water tomatoes daily") == "water"
+    assert cache.get("Should I water my tomatoes daily?") == "water"
+    assert cache.get("Should I not water my tomatoes daily?") == "do not water"
+    assert cache.stats()["semantic_hits"] == 2
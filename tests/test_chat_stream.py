@@ -0,0 +1,176 @@
+import asyncio
+import threading
+from types import SimpleNamespace
+
+import pytest
+
+import chat_app
+from chat_prefilter import SemanticAnswerCache
+
+ANSWER = ["Remove ", "infected ", "leaves ", "and ", "apply ", "a ", "copper ", "fungicide."]
+MODES = ["sequential", "folded", "speculative"]
+
+
+class FakeAsyncGroq:
+    """
+    AsyncGroq-compatible client: one-token validation calls return ``verdict``,
+    streamed calls yield ``tokens`` one chunk at a time
+    """
+
+    def __init__(self, verdict="Yes", tokens=ANSWER, verdict_delay=0.0, token_delay=0.0, fail_after=None):
+        self.verdict = verdict
+        self.tokens = list(tokens)
+        self.verdict_delay = verdict_delay
+        self.token_delay = token_delay
+        self.fail_after = fail_after
+        self.validations = 0
+        self.streams = 0
+        self.emitted = 0
+        self.cancelled = False
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self._create))
+
+    async def _create(self, stream=False, **kwargs):
+        if not stream:
+            self.validations += 1
+            await asyncio.sleep(self.verdict_delay)
+            return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=self.verdict))])
+        self.streams += 1
+        return self._stream()
+
+    async def _stream(self):
+        try:
+            for i, token in enumerate(self.tokens):
+                if i == self.fail_after:
+                    raise RuntimeError("connection reset by upstream")
+                await asyncio.sleep(self.token_delay)
+                self.emitted += 1
+                yield SimpleNamespace(choices=[SimpleNamespace(delta=SimpleNamespace(content=token))])
+        except asyncio.CancelledError:
+            self.cancelled = True
+            raise
+
+
+@pytest.fixture(autouse=True)
+def uncertain_relevance(monkeypatch):
+    # Every question goes through the LLM relevance handling of the chosen mode
+    monkeypatch.setattr(chat_app.relevance_classifier, "classify", lambda text: None)
+    monkeypatch.setattr(chat_app, "answer_cache", SemanticAnswerCache())
+
+
+def ask(question, mode, client):
+    """
+    Run the streaming chatbot to completion
+
+    Returns:
+        List of (shown answer, tokens the client had emitted) per yield
+    """
+    async def collect():
+        snapshots = []
+        async for chat_history, _ in chat_app.groq_chatbot_stream(question, [], mode=mode, client=client):
+            snapshots.append((chat_history[-1][1], client.emitted))
+        # Let cancelled tasks run their cleanup
+        await asyncio.sleep(0.05)
+        return snapshots
+
+    return asyncio.run(collect())
+
+
+@pytest.mark.parametrize("mode", MODES)
+def test_tokens_arrive_incrementally(mode):
+    client = FakeAsyncGroq(token_delay=0.005)
+    snapshots = ask("How do I treat this?", mode, client)
+
+    shown = [answer for answer, _ in snapshots]
+    assert shown[-1] == "".join(ANSWER)
+    assert len(set(shown)) >= len(ANSWER) - 1
+    assert all(later.startswith(earlier) for earlier, later in zip(shown, shown[1:]))
+    # The first text is shown long before the stream has finished
+    assert snapshots[0][1] < len(ANSWER)
+
+
+def test_sequential_rejection_skips_the_answer_stream():
+    client = FakeAsyncGroq(verdict="No")
+    snapshots = ask("Who won the match?", "sequential", client)
+
+    assert snapshots[-1][0] == chat_app.REJECTION_MESSAGE
+    assert client.streams == 0
+
+
+def test_folded_sentinel_is_never_shown():
+    client = FakeAsyncGroq(tokens=[" NOT_", "AGRI", "CULTURE"], token_delay=0.005)
+    snapshots = ask("Who won the match?", "folded", client)
+
+    assert all(chat_app.NOT_AGRICULTURE[:4] not in answer for answer, _ in snapshots)
+    assert snapshots[-1][0] == chat_app.REJECTION_MESSAGE
+    assert client.validations == 0
+    assert chat_app.answer_cache.get("Who won the match?") is None
+
+
+def test_folded_answer_resembling_the_sentinel_is_released():
+    client = FakeAsyncGroq(tokens=["NO", "T ", "all ", "crops ", "need ", "it."])
+    snapshots = ask("Do all crops need nitrogen?", "folded", client)
+
+    assert snapshots[-1][0] == "NOT all crops need it."
+
+
+def test_speculative_rejection_cancels_the_answer():
+    client = FakeAsyncGroq(verdict="No", verdict_delay=0.05, token_delay=0.02)
+    snapshots = ask("Who won the match?", "speculative", client)
+
+    assert [answer for answer, _ in snapshots if answer] == [chat_app.REJECTION_MESSAGE] * 2
+    assert client.streams == 1
+    assert client.cancelled
+    assert client.emitted < len(ANSWER)
+
+
+def test_speculative_answer_waits_for_the_verdict():
+    client = FakeAsyncGroq(verdict_delay=0.05)
+    snapshots = ask("How do I treat this?", "speculative", client)
+
+    # Tokens buffered during validation are only shown once it says "Yes"
+    assert snapshots[-1][0] == "".join(ANSWER)
+    assert client.validations == 1
+
+
+@pytest.mark.parametrize("mode", MODES)
+def test_stream_errors_are_reported(mode):
+    client = FakeAsyncGroq(fail_after=3)
+    snapshots = ask("How do I treat this?", mode, client)
+
+    assert snapshots[-1][0] == "".join(ANSWER[:3]) + "Error: connection reset by upstream"
+    assert chat_app.answer_cache.get("How do I treat this?") is None
+
+
+class ThreadRecordingStore:
+    """
+    ChatHistoryStore stand-in that records which thread each call runs on
+    """
+
+    def __init__(self):
+        self.threads = []
+        self.turns = []
+
+    def context(self, session_id, budget_tokens):
+        self.threads.append(threading.get_ident())
+        return []
+
+    def append(self, session_id, question, answer):
+        self.threads.append(threading.get_ident())
+        self.turns.append((session_id, question, answer))
+
+
+def test_session_memory_is_used_off_the_event_loop(monkeypatch):
+    store = ThreadRecordingStore()
+    monkeypatch.setattr(chat_app, "chat_store", store)
+    request = SimpleNamespace(session_hash="session-1")
+
+    async def collect():
+        loop_thread = threading.get_ident()
+        async for _ in chat_app.groq_chatbot_stream("How do I treat this?", [], mode="sequential",
+                                                    client=FakeAsyncGroq(), request=request):
+            pass
+        return loop_thread
+
+    loop_thread = asyncio.run(collect())
+    assert store.turns == [("session-1", "How do I treat this?", "".join(ANSWER))]
+    assert len(store.threads) == 2 and loop_thread not in store.threads
@@ -0,0 +1,41 @@
+import pytest
+
+from city_index import CROWDED_PREFIX, CityIndex, build_index
+
+
+def _row(name, ascii_name, country, population, lat="10.0", lon="20.0"):
+    return "\t".join(["0", name, ascii_name, "", lat, lon, "", "", country] + [""] * 5 + [str(population)])
+
+
+@pytest.fixture
+def index(tmp_path):
+    # More small "Sa..." towns than a prefix scan may rank, plus a few big cities
+    rows = [_row(f"Sa{i:04d}", f"Sa{i:04d}", "IN", 1000 + i) for i in range(CROWDED_PREFIX + 200)]
+    rows += [
+        _row("Shanghai", "Shanghai", "CN", 24000000, "31.2", "121.5"),
+        _row("São Paulo", "Sao Paulo", "BR", 12000000, "-23.5", "-46.6"),
+        _row("Surat", "Surat", "IN", 4500000),
+    ]
+    gazetteer = tmp_path / "cities.txt"
+    gazetteer.write_text("\n".join(rows) + "\n", encoding="utf-8")
+    build_index(str(gazetteer), str(tmp_path / "cities.idx"))
+    city_index = CityIndex(str(tmp_path / "cities.idx"))
+    yield city_index
+    city_index.close()
+
+
+def test_short_prefix_ranks_the_whole_range(index):
+    assert index.suggest("s", limit=3) == ["Shanghai, CN", "São Paulo, BR", "Surat, IN"]
+    assert index.suggest("Sa", limit=2) == ["São Paulo, BR", "Sa0711, IN"]
+
+
+def test_uncrowded_prefix_and_spellings(index):
+    assert index.suggest("sao") == ["São Paulo, BR"]
+    assert index.suggest("são p") == ["São Paulo, BR"]
+    assert index.suggest("x") == []
+    assert index.suggest("  ") == []
+
+
+def test_coordinates(index):
+    assert index.coordinates("Shanghai, CN") == (31.2, 121.5)
+    assert index.coordinates("Shanghai, IN") is None
@@ -0,0 +1,105 @@
+import time
+import threading
+
+import numpy as np
+import pytest
+
+from inference_server import InferenceServer
+from model_loader import RuntimeBackend
+
+NUM_CLASSES = 5
+
+
+class RecordingBackend(RuntimeBackend):
+    """
+    Backend whose "probabilities" encode the input, recording every batch size
+    """
+    name = "recording"
+
+    def __init__(self, fail=False):
+        self.batch_sizes = []
+        self.fail = fail
+        self._lock = threading.Lock()
+
+    def predict_batch(self, batch):
+        with self._lock:
+            self.batch_sizes.append(len(batch))
+        if self.fail:
+            raise RuntimeError("forward pass failed")
+        # Row i repeats the first pixel of image i, so callers can check they got their own rows
+        return np.repeat(batch[:, 0, 0, :1], NUM_CLASSES, axis=1).astype(np.float32)
+
+
+def images(values):
+    batch = np.zeros((len(values), 4, 4, 3), dtype=np.float32)
+    batch[:, 0, 0, 0] = values
+    return batch
+
+
+@pytest.fixture
+def backend():
+    return RecordingBackend()
+
+
+def test_large_request_is_split_into_full_batches(backend):
+    server = InferenceServer(backend, {}, max_batch_size=4, max_wait_ms=5).start()
+    try:
+        result = server.submit(images(np.arange(10))).result(5)
+    finally:
+        server.stop()
+
+    np.testing.assert_array_equal(result[:, 0], np.arange(10))
+    assert max(backend.batch_sizes) <= 4
+    assert sum(backend.batch_sizes) == 10
+
+
+def test_request_that_does_not_fit_starts_the_next_batch(backend):
+    gate = threading.Event()
+    predict = backend.predict_batch
+    backend.predict_batch = lambda batch: gate.wait(5) and predict(batch)
+    server = InferenceServer(backend, {}, max_batch_size=4, max_wait_ms=0).start()
+    try:
+        # The first forward pass blocks, so the next window sees everything queued behind it
+        blocked = server.submit(images([99]))
+        time.sleep(0.05)
+        futures = [server.submit(images([i])) for i in range(3)] + [server.submit(images([10, 11]))]
+        gate.set()
+        results = [future.result(5) for future in [blocked] + futures]
+    finally:
+        server.stop()
+
+    assert backend.batch_sizes == [1, 3, 2]
+    assert [r[:, 0].tolist() for r in results] == [[99], [0], [1], [2], [10, 11]]
+
+
+def test_concurrent_requests_never_exceed_the_batch_limit(backend):
+    server = InferenceServer(backend, {}, max_batch_size=8, max_wait_ms=20).start()
+    sizes = [1, 3, 5, 8, 2, 13, 1, 7] * 4
+    results = {}
+
+    def client(i, n):
+        results[i] = server.submit(images(np.full(n, i))).result(10)
+
+    threads = [threading.Thread(target=client, args=(i, n)) for i, n in enumerate(sizes)]
+    try:
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+    finally:
+        server.stop()
+
+    assert max(backend.batch_sizes) <= 8
+    assert sum(backend.batch_sizes) == sum(sizes)
+    for i, n in enumerate(sizes):
+        assert results[i].shape == (n, NUM_CLASSES)
+        assert (results[i] == i).all()
+
+
+def test_forward_errors_reach_every_chunk():
+    server = InferenceServer(RecordingBackend(fail=True), {}, max_batch_size=2, max_wait_ms=5).start()
+    try:
+        with pytest.raises(RuntimeError, match="forward pass failed"):
+            server.submit(images(np.arange(5))).result(5)
+    finally:
+        server.stop()
@@ -0,0 +1,81 @@
+import os
+import json
+
+import numpy as np
+import pytest
+
+from label_catalog import LabelCatalog
+from treatments import DEMO_TREATMENTS
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+LABELS_PATH = os.path.join(REPO_ROOT, "class_labels.json")
+
+
+@pytest.fixture(scope="module")
+def catalog():
+    return LabelCatalog.load(LABELS_PATH, DEMO_TREATMENTS)
+
+
+def reference_top_k(probabilities, k):
+    return np.argsort(-probabilities, axis=1, kind="stable")[:, :k]
+
+
+@pytest.mark.parametrize("k", [1, 3, 5, 39, 50])
+def test_top_k_matches_argsort(catalog, k):
+    probabilities = np.random.default_rng(k).dirichlet(np.ones(len(catalog)), size=64).astype(np.float32)
+    top = catalog.top_k(probabilities, k)
+
+    expected = reference_top_k(probabilities, k)
+    np.testing.assert_array_equal(top.indices, expected)
+    np.testing.assert_array_equal(top.labels, catalog.labels[expected])
+    np.testing.assert_allclose(top.confidences, np.take_along_axis(probabilities, expected, axis=1) * 100.0)
+
+
+@pytest.mark.parametrize("k", [1, 2, 3, 4])
+def test_top_k_breaks_ties_towards_the_lower_index(catalog, k):
+    # Coarse values make many ties, including across the k-th place
+    probabilities = np.random.default_rng(k).integers(0, 4, (200, len(catalog))).astype(np.float32) / 10.0
+    probabilities[0] = 0.0
+    probabilities[1, [7, 3, 30]] = 0.5
+    top = catalog.top_k(probabilities, k)
+    np.testing.assert_array_equal(top.indices, reference_top_k(probabilities, k))
+    assert top.indices[0].tolist() == list(range(k))
+
+
+def test_single_row_and_abstain_threshold(catalog):
+    row = np.zeros(len(catalog), dtype=np.float32)
+    row[[4, 9]] = [0.6, 0.4]
+    top = catalog.top_k(row, 2, min_confidence=60.0)
+    assert top.indices.tolist() == [[4, 9]]
+    # Abstains strictly below the threshold
+    assert top.abstained.tolist() == [False]
+    assert catalog.top_k(row, 2, min_confidence=60.5).abstained.tolist() == [True]
+
+    strict = LabelCatalog.load(LABELS_PATH, DEMO_TREATMENTS, min_confidence=75.0)
+    batch = np.stack([row, np.eye(len(catalog), dtype=np.float32)[2]])
+    assert strict.top_k(batch).abstained.tolist() == [True, False]
+    assert strict.top_k(batch, min_confidence=0.0).abstained.tolist() == [False, False]
+
+
+def write_labels(tmp_path, labels):
+    path = tmp_path / "class_labels.json"
+    path.write_text(json.dumps(labels))
+    return str(path)
+
+
+def test_label_without_treatment_fails_at_load(tmp_path):
+    with open(LABELS_PATH) as f:
+        labels = json.load(f)
+    labels[str(len(labels))] = "Tomato - Imaginary Wilt"
+    with pytest.raises(ValueError, match="No treatment for 1 class label.*Imaginary Wilt"):
+        LabelCatalog.load(write_labels(tmp_path, labels), DEMO_TREATMENTS)
+
+
+@pytest.mark.parametrize("labels, message", [
+    ({"0": "Apple - Scab", "2": "Apple - Rust"}, "without gaps"),
+    ({"0": "Apple - Scab", "one": "Apple - Rust"}, "integer indices"),
+    ({"0": "Apple - Scab", "1": "Apple - Scab"}, "unique"),
+])
+def test_malformed_label_file_fails_at_load(tmp_path, labels, message):
+    with pytest.raises(ValueError, match=message):
+        LabelCatalog.load(write_labels(tmp_path, labels))
@@ -0,0 +1,58 @@
+import os
+
+from prediction_cache import PredictionCache, files_fingerprint
+
+
+def replace_file(path, content):
+    stat = os.stat(path)
+    path.write_bytes(content)
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000_000))
+
+
+def open_cache(model, db, **options):
+    return PredictionCache([str(model)], disk_path=str(db), check_interval=0.0, **options)
+
+
+def test_results_of_old_model_are_not_persisted_after_the_file_changes(tmp_path):
+    model, db = tmp_path / "model.h5", tmp_path / "cache.db"
+    model.write_bytes(b"old weights")
+    cache = open_cache(model, db)
+    cache.put("before", ("Tomato - Early Blight", 91.0))
+
+    replace_file(model, b"new weights")
+    # The old model is still in memory: its result is served but not persisted
+    cache.put("after", ("Tomato - Early Blight", 88.0))
+    assert cache.get("after") == ("Tomato - Early Blight", 88.0)
+    assert cache.stats()["files_changed"]
+
+    restarted = open_cache(model, db)
+    assert restarted.get("before") is None
+    assert restarted.get("after") is None
+
+
+def test_bind_resumes_persistence_for_the_reloaded_model(tmp_path):
+    model, db = tmp_path / "model.h5", tmp_path / "cache.db"
+    model.write_bytes(b"old weights")
+    cache = open_cache(model, db)
+    cache.put("old", ("Apple - Scab", 75.0))
+
+    replace_file(model, b"new weights")
+    cache.bind(files_fingerprint([str(model)]))
+    assert cache.get("old") is None
+    cache.put("new", ("Apple - Black Rot", 82.0))
+    assert not cache.stats()["files_changed"]
+
+    restarted = open_cache(model, db)
+    assert restarted.get("new") == ("Apple - Black Rot", 82.0)
+
+
+def test_fingerprint_taken_at_load_time_wins_over_the_current_files(tmp_path):
+    model, db = tmp_path / "model.h5", tmp_path / "cache.db"
+    model.write_bytes(b"old weights")
+    loaded = files_fingerprint([str(model)])
+    replace_file(model, b"new weights")
+
+    cache = open_cache(model, db, fingerprint=loaded)
+    cache.put("key", ("Corn - Common Rust", 64.0))
+    assert cache.stats()["files_changed"]
+    assert open_cache(model, db).get("key") is None
@@ -0,0 +1,31 @@
+import numpy as np
+
+from run_benchmarks import InProcessTarget, load_test
+
+
+class FakeApp:
+    def __init__(self, diagnosis, weather):
+        self.diagnosis = diagnosis
+        self.weather = weather
+
+    def diagnose_image(self, image):
+        return self.diagnosis
+
+    def get_weather_and_aqi(self, city):
+        return self.weather
+
+
+def test_error_replies_count_as_load_test_errors():
+    app = FakeApp("⏳ The server is busy. Please try again in a moment.", "❌ Weather/AQI data unavailable")
+    target = InProcessTarget(app, np.zeros((8, 8, 3), dtype=np.uint8))
+    metrics = load_test(target, rate=200.0, duration=0.1, mix={"diagnose": 1, "weather": 1}, concurrency=2)
+    assert metrics["load.error_rate"]["value"] == 1.0
+    assert metrics["load.throughput_rps"]["value"] == 0.0
+
+
+def test_successful_replies_are_measured():
+    app = FakeApp("### 🌿 Tomato - Healthy\n**Confidence:** 97.0%", "🌡️ 29.5°C | 💧 71% | 🌫️ AQI 2")
+    target = InProcessTarget(app, np.zeros((8, 8, 3), dtype=np.uint8))
+    metrics = load_test(target, rate=200.0, duration=0.1, mix={"diagnose": 1, "weather": 1}, concurrency=2)
+    assert metrics["load.error_rate"]["value"] == 0.0
+    assert metrics["load.diagnose.errors"]["value"] == metrics["load.weather.errors"]["value"] == 0
@@ -0,0 +1,103 @@
+import time
+
+import pytest
+
+from stubs import StubServer
+from weather_service import WeatherService
+
+LATENCY = 0.2
+
+
+@pytest.fixture(scope="module")
+def stub():
+    server = StubServer("weather", latency_ms=LATENCY * 1000.0).start()
+    yield server
+    server.stop()
+
+
+@pytest.fixture
+def service(stub):
+    stub.latency = LATENCY
+    stub.unknown_locations.clear()
+    return WeatherService("test-key", base_url=stub.url, deadline=2.0)
+
+
+def wait_for(condition, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if condition():
+            return True
+        time.sleep(0.01)
+    return False
+
+
+def test_weather_and_aqi_are_fetched_concurrently(stub, service):
+    service.get_coordinates("Pune")
+    before = stub.requests
+
+    started = time.perf_counter()
+    observation = service.get_observation("Pune")
+    elapsed = time.perf_counter() - started
+
+    assert observation["weather"]["main"]["temp"] == 29.5
+    assert observation["aqi"]["list"][0]["main"]["aqi"] == 2
+    assert stub.requests - before == 2
+    # Two sequential calls would take at least 2 * LATENCY
+    assert elapsed < 1.5 * LATENCY
+
+
+def test_coordinates_are_cached(stub, service):
+    first = service.get_coordinates("Nashik")
+    before = stub.requests
+    assert service.get_coordinates("  nashik ") == first
+    assert stub.requests == before
+
+
+def test_observations_are_cached_within_ttl(stub, service):
+    service.get_observation("Nagpur")
+    before = stub.requests
+
+    started = time.perf_counter()
+    assert service.get_weather_and_aqi("Nagpur").startswith("🌍 Nagpur")
+    assert time.perf_counter() - started < LATENCY
+    assert stub.requests == before
+
+
+def test_stale_observation_is_served_and_refreshed(stub, service):
+    service.observation_ttl = 0.0
+    service.get_observation("Indore")
+    key = service._key("Indore")
+    before = stub.requests
+
+    started = time.monotonic()
+    assert service.get_observation("Indore") is not None
+    assert time.monotonic() - started < LATENCY
+
+    # The background refresh re-fetches weather and AQI (coordinates stay cached)
+    # and stores an observation newer than the stale read
+    assert wait_for(lambda: stub.requests - before == 2)
+    assert wait_for(lambda: service._observations.get(key)[1] < time.monotonic() - started)
+    assert wait_for(lambda: not service._refreshing)
+
+
+def test_deadline_raises_timeout_error(stub, service):
+    stub.latency = 0.5
+    service.deadline = 0.1
+
+    started = time.perf_counter()
+    with pytest.raises(TimeoutError):
+        service.get_observation("Surat")
+    assert time.perf_counter() - started < 0.4
+    assert service.get_weather_and_aqi("Rajkot") == "❌ Weather/AQI data unavailable"
+
+    # The timed-out fetch finishes in the background and warms the cache
+    assert wait_for(lambda: service._observations.get(service._key("Surat"))[0] is not None)
+    assert service.get_observation("Surat")["weather"]["main"]["humidity"] == 71
+
+
+def test_unknown_location(stub, service):
+    stub.unknown_locations.add("atlantis")
+
+    assert service.get_coordinates("Atlantis") == (None, None)
+    assert service.get_observation("Atlantis") is None
+    assert service.get_weather_and_aqi("Atlantis") == "❌ Invalid Location"
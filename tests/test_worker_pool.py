@@ -0,0 +1,159 @@
+import os
+import json
+import queue
+import signal
+from multiprocessing import shared_memory
+
+import numpy as np
+import pytest
+
+from worker_pool import InferenceWorkerPool, _Worker, _as_model_input, _slot_arrays, _slot_bytes
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+with open(os.path.join(REPO_ROOT, "class_labels.json")) as f:
+    CLASS_LABELS = json.load(f)
+
+
+def test_refuses_models_every_worker_would_copy():
+    with pytest.raises(ValueError, match="convert it to .tflite"):
+        InferenceWorkerPool("model.h5", CLASS_LABELS, workers=2)
+    with pytest.raises(ValueError, match="first.onnx"):
+        InferenceWorkerPool("model.tflite", CLASS_LABELS, workers=2, first_stage="first.onnx")
+    # A single worker holds the only copy; an explicit backend overrides the extension
+    InferenceWorkerPool("model.h5", CLASS_LABELS, workers=1)
+    InferenceWorkerPool("model.bin", CLASS_LABELS, workers=2, backend="tflite")
+
+
+def test_slot_ring_layout():
+    slots, capacity, num_classes = 3, 2, len(CLASS_LABELS)
+    shm = shared_memory.SharedMemory(create=True, size=_slot_bytes(slots, capacity, num_classes))
+    try:
+        inputs, outputs = _slot_arrays(shm.buf, slots, capacity, num_classes)
+        assert inputs.shape == (slots, capacity, 224, 224, 3) and outputs.shape == (slots, capacity, num_classes)
+        assert inputs.nbytes + outputs.nbytes <= shm.size
+
+        outputs[...] = 0.5
+        inputs[...] = 255
+        assert np.all(outputs == 0.5)
+
+        slot = inputs[1]
+        scratch = np.empty((capacity, 224, 224, 3), dtype=np.float32)
+        converted = _as_model_input(slot, np.float32, scratch)
+        assert converted.dtype == np.float32 and np.all(converted == 1.0)
+        assert _as_model_input(slot, np.uint8, None) is slot
+        del inputs, outputs, slot, converted
+    finally:
+        shm.close()
+        shm.unlink()
+
+
+@pytest.fixture
+def idle_pool():
+    """
+    Pool whose workers are bookkeeping only, so scheduling can be driven by hand
+    """
+    pool = InferenceWorkerPool("model.tflite", CLASS_LABELS, workers=2, max_batch_size=4, slots=2,
+                               queue_timeout=0.05, pin_cores=False)
+    size = _slot_bytes(pool.slots, pool.max_batch_size, pool.num_classes)
+    for worker_id in range(pool.workers):
+        worker = _Worker(worker_id, shared_memory.SharedMemory(create=True, size=size), pool.slots,
+                         pool.max_batch_size, pool.num_classes, None)
+        worker.tasks, worker.alive = queue.Queue(), True
+        pool._workers.append(worker)
+    yield pool
+    for worker in pool._workers:
+        worker.inputs = worker.outputs = None
+        worker.shm.close()
+        worker.shm.unlink()
+
+
+def images(n, value=0):
+    return np.full((n, 224, 224, 3), value, dtype=np.uint8)
+
+
+def complete(pool, worker_id):
+    """
+    Play the worker's part: answer the oldest queued slot with its first pixel value
+    """
+    worker = pool._workers[worker_id]
+    slot, n = worker.tasks.get_nowait()
+    worker.outputs[slot, :n] = worker.inputs[slot, :n, 0, 0, :1]
+    pool._finish(worker, slot, probabilities=worker.outputs[slot])
+
+
+def test_scheduler_picks_least_loaded_worker_and_applies_backpressure(idle_pool):
+    first = idle_pool.submit(images(3, 1))
+    second = idle_pool.submit(images(1, 2))
+    third = idle_pool.submit(images(1, 3))
+    fourth = idle_pool.submit(images(1, 4))
+    w0, w1 = idle_pool._workers
+    # 3 images on worker 0, then worker 1 until its two slots are taken
+    assert (w0.in_flight, w1.in_flight) == (4, 2)
+    assert list(w0.free_slots) == [] and list(w1.free_slots) == []
+
+    with pytest.raises(TimeoutError):
+        idle_pool.submit(images(1))
+
+    complete(idle_pool, 1)
+    assert second.result(0)[:, 0].tolist() == [2.0]
+    assert not third.done()
+    assert idle_pool.submit(images(1, 5)) is not None
+    assert w1.in_flight == 2
+
+    complete(idle_pool, 0)
+    complete(idle_pool, 0)
+    assert first.result(0)[:, 0].tolist() == [1.0, 1.0, 1.0]
+    assert fourth.result(0)[:, 0].tolist() == [4.0]
+
+
+def test_large_request_is_split_across_workers_and_reassembled(idle_pool):
+    batch = np.concatenate([images(4, 1), images(2, 2)])
+    future = idle_pool.submit(batch)
+    w0, w1 = idle_pool._workers
+    assert (w0.in_flight, w1.in_flight) == (4, 2)
+
+    complete(idle_pool, 1)
+    assert not future.done()
+    complete(idle_pool, 0)
+    assert future.result(0)[:, 0].tolist() == [1.0] * 4 + [2.0] * 2
+
+
+@pytest.fixture(scope="module")
+def tflite_model(tmp_path_factory):
+    tf = pytest.importorskip("tensorflow")
+    from export_model import export_tflite
+
+    tf.keras.utils.set_random_seed(0)
+    model = tf.keras.Sequential([
+        tf.keras.Input((224, 224, 3)),
+        tf.keras.layers.AveragePooling2D(32),
+        tf.keras.layers.Flatten(),
+        tf.keras.layers.Dense(len(CLASS_LABELS), activation="softmax"),
+    ])
+    return export_tflite(model, str(tmp_path_factory.mktemp("model") / "model.tflite"))
+
+
+def test_workers_serve_requests_and_dead_workers_fail_their_requests(tflite_model):
+    from model_loader import load_model
+
+    pool = InferenceWorkerPool(tflite_model, CLASS_LABELS, workers=2, max_batch_size=4, pin_cores=False,
+                               start_method="spawn").start(timeout=120)
+    try:
+        batch = np.random.default_rng(0).integers(0, 256, (6, 224, 224, 3), dtype=np.uint8)
+        expected = load_model(tflite_model).predict_batch(batch.astype(np.float32) / 255.0)
+        np.testing.assert_allclose(pool.submit(batch).result(30), expected, atol=1e-5)
+
+        # Freeze worker 0 so the next request stays in flight on it, then kill it
+        victim = pool._workers[0].pid
+        os.kill(victim, signal.SIGSTOP)
+        stuck = pool.submit(batch[:1])
+        assert pool.stats()["workers"][0]["in_flight"] == 1
+        os.kill(victim, signal.SIGKILL)
+        with pytest.raises(RuntimeError, match="worker 0 died"):
+            stuck.result(10)
+
+        assert [w["alive"] for w in pool.stats()["workers"]] == [False, True]
+        np.testing.assert_allclose(pool.submit(batch[:2]).result(30), expected[:2], atol=1e-5)
+    finally:
+        pool.stop()
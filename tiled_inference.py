@@ -0,0 +1,194 @@
+import math
+import logging
+
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+from model_loader import preprocess_batch, decode_prediction
+from label_catalog import LabelCatalog
+
+logger = logging.getLogger(__name__)
+
+
+def tile_origins(length, tile_size, stride):
+    """
+    Start offsets of tiles along one axis, the last one flush with the edge
+
+    Returns:
+        Sorted list of offsets covering [0, length)
+    """
+    if length <= tile_size:
+        return [0]
+    origins = list(range(0, length - tile_size + 1, stride))
+    if origins[-1] != length - tile_size:
+        origins.append(length - tile_size)
+    return origins
+
+
+def tile_grid(image, tile_size=224, overlap=0.25, max_tiles=64):
+    """
+    Overlapping square tiles of an image as strided views (no pixel copies)
+
+    Tiles are ``tile_size`` source pixels wide; if that would produce more
+    than ``max_tiles`` tiles the tile size grows until the grid fits, so
+    huge photos are covered by larger tiles that preprocessing scales down.
+
+    Args:
+        image: H x W or H x W x C array
+        tile_size: Preferred tile size in source pixels (the model input size)
+        overlap: Fraction of a tile shared with its neighbour
+        max_tiles: Upper bound on the number of tiles
+
+    Returns:
+        Tuple of (windows, row origins, column origins, tile size) where
+        ``windows[y, x]`` is the tile whose top-left corner is (y, x)
+    """
+    height, width = image.shape[:2]
+    tile = min(tile_size, height, width)
+    while True:
+        stride = max(1, int(tile * (1.0 - overlap)))
+        ys, xs = tile_origins(height, tile, stride), tile_origins(width, tile, stride)
+        if len(ys) * len(xs) <= max_tiles or tile >= min(height, width):
+            break
+        tile = min(int(math.ceil(tile * 1.25)), height, width)
+
+    windows = sliding_window_view(image, (tile, tile) + image.shape[2:])
+    if image.ndim == 3:
+        windows = windows[:, :, 0]
+    return windows, ys, xs, tile
+
+
+def green_fractions(image, ys, xs, tile, min_excess_green=20, samples_per_tile=16):
+    """
+    Fraction of vegetation pixels in every tile, from a subsampled
+    excess-green mask (2G - R - B) and a summed-area table
+
+    The green channel is in the middle for both RGB and BGR inputs and the
+    index is symmetric in the other two, so channel order does not matter.
+
+    Returns:
+        Array of shape (len(ys), len(xs)); all ones for grayscale images
+    """
+    if image.ndim != 3 or image.shape[2] < 3:
+        return np.ones((len(ys), len(xs)), dtype=np.float32)
+
+    step = max(1, tile // samples_per_tile)
+    sample = image[::step, ::step, :3].astype(np.int16)
+    mask = (2 * sample[..., 1] - sample[..., 0] - sample[..., 2]) > min_excess_green
+
+    table = np.zeros((mask.shape[0] + 1, mask.shape[1] + 1), dtype=np.int32)
+    np.cumsum(np.cumsum(mask, axis=0), axis=1, out=table[1:, 1:])
+
+    top = np.asarray(ys) // step
+    left = np.asarray(xs) // step
+    bottom = np.minimum((np.asarray(ys) + tile) // step, mask.shape[0])[:, None]
+    right = np.minimum((np.asarray(xs) + tile) // step, mask.shape[1])[None, :]
+    top, left = top[:, None], left[None, :]
+    counts = table[bottom, right] - table[top, right] - table[bottom, left] + table[top, left]
+    areas = np.maximum((bottom - top) * (right - left), 1)
+    return (counts / areas).astype(np.float32)
+
+
+def diagnose_tiled(image, predict, class_labels, tile_size=224, overlap=0.25, max_tiles=64, min_green=0.15,
+                   aggregate="mean", dtype=np.float32):
+    """
+    Diagnose a large photo tile by tile and aggregate the results
+
+    Tiles with too little vegetation are skipped before inference, every
+    kept tile runs in a single batch, and tiles the model itself calls
+    background are left out of the aggregate.
+
+    Args:
+        image: Decoded image as a numpy array
+        predict: Callable mapping a preprocessed batch to class probabilities (N, num_classes)
+        class_labels: Dictionary mapping class indices to labels, or a LabelCatalog
+        tile_size: Preferred tile size in source pixels
+        overlap: Fraction of a tile shared with its neighbour
+        max_tiles: Upper bound on the number of tiles
+        min_green: Minimum vegetation fraction for a tile to be kept (0 keeps every tile)
+        aggregate: "mean" averages leaf-tile probabilities; "max" takes each
+                   class's strongest tile, so a small lesion is not outvoted
+        dtype: Model input dtype (np.float32 or np.uint8)
+
+    Returns:
+        Dictionary with the image-level ``label`` and ``confidence``, the
+        ``probabilities`` vector, tile counts, the source ``tile_size`` and a
+        coarse ``heatmap`` (rows x cols) of each tile's probability for the
+        diagnosed class (0 for skipped or background tiles)
+    """
+    image = np.asarray(image)
+    windows, ys, xs, tile = tile_grid(image, tile_size, overlap, max_tiles)
+
+    green = green_fractions(image, ys, xs, tile)
+    keep = green >= min_green
+    if not keep.any():
+        # Nothing looks like a leaf: still diagnose the greenest tile
+        keep.flat[int(np.argmax(green))] = True
+
+    positions = np.argwhere(keep)
+    batch = preprocess_batch([windows[ys[r], xs[c]] for r, c in positions], dtype=dtype)
+    probabilities = np.asarray(predict(batch))
+
+    if isinstance(class_labels, LabelCatalog):
+        background = np.flatnonzero(class_labels.background)
+    else:
+        background = [int(i) for i, label in class_labels.items() if "background" in label.lower()]
+    leaf_tiles = ~np.isin(np.argmax(probabilities, axis=1), background)
+    if not leaf_tiles.any():
+        leaf_tiles[:] = True
+
+    if aggregate == "max":
+        combined = probabilities[leaf_tiles].max(axis=0)
+        label, confidence = decode_prediction(combined, class_labels)
+        combined = combined / combined.sum()
+    elif aggregate == "mean":
+        combined = probabilities[leaf_tiles].mean(axis=0)
+        label, confidence = decode_prediction(combined, class_labels)
+    else:
+        raise ValueError(f"Unknown aggregate {aggregate!r}; expected 'mean' or 'max'")
+
+    predicted = int(np.argmax(combined))
+    heatmap = np.zeros((len(ys), len(xs)), dtype=np.float32)
+    heatmap[positions[leaf_tiles, 0], positions[leaf_tiles, 1]] = probabilities[leaf_tiles, predicted]
+
+    logger.debug(f"Tiled diagnosis: {len(positions)}/{keep.size} tiles of {tile}px kept, "
+                 f"{int(leaf_tiles.sum())} aggregated")
+    return {
+        "label": label,
+        "confidence": confidence,
+        "probabilities": combined,
+        "tiles": int(keep.size),
+        "tiles_kept": int(len(positions)),
+        "tiles_aggregated": int(leaf_tiles.sum()),
+        "tile_size": tile,
+        "heatmap": heatmap,
+    }
+
+
+def render_heatmap(image, heatmap, max_side=512, alpha=0.45):
+    """
+    Blend a coarse tile heatmap over a thumbnail of the image for display
+
+    Args:
+        image: The diagnosed image (RGB, RGBA or grayscale)
+        heatmap: Grid of values in [0, 1] from diagnose_tiled
+        max_side: Longest side of the rendered thumbnail
+        alpha: Heatmap opacity
+
+    Returns:
+        RGB uint8 array
+    """
+    import cv2
+
+    image = np.asarray(image)
+    if image.ndim == 2:
+        image = np.repeat(image[..., None], 3, axis=2)
+    image = np.ascontiguousarray(image[..., :3])
+    scale = min(1.0, max_side / max(image.shape[:2]))
+    size = (max(1, int(image.shape[1] * scale)), max(1, int(image.shape[0] * scale)))
+    thumbnail = cv2.resize(image, size, interpolation=cv2.INTER_AREA)
+
+    levels = cv2.resize(np.clip(heatmap, 0.0, 1.0).astype(np.float32), size, interpolation=cv2.INTER_LINEAR)
+    colors = cv2.applyColorMap((levels * 255).astype(np.uint8), cv2.COLORMAP_JET)
+    colors = cv2.cvtColor(colors, cv2.COLOR_BGR2RGB)
+    return cv2.addWeighted(thumbnail.astype(np.uint8), 1.0 - alpha, colors, alpha, 0.0)
@@ -1,9 +1,8 @@
 import re
 import logging
+from functools import lru_cache
 from difflib import get_close_matches
 
-# Setup logging
-logging.basicConfig(level=logging.DEBUG)
 logger = logging.getLogger(__name__)
 
 def extract_disease_name(prediction):
@@ -59,6 +58,17 @@ def normalize_disease_name(disease_name):
     
     return normalized
 
+@lru_cache(maxsize=16)
+def _normalized_index(known_diseases):
+    """
+    Normalized name -> original name (first occurrence wins), built once per
+    tuple of known diseases
+    """
+    index = {}
+    for disease in known_diseases:
+        index.setdefault(normalize_disease_name(disease), disease)
+    return index
+
 def find_similar_disease(disease_name, known_diseases):
     """
     Find the most similar disease name in a list of known diseases
@@ -73,16 +83,16 @@ def find_similar_disease(disease_name, known_diseases):
     # Normalize the query
     norm_query = normalize_disease_name(disease_name)
     
-    # Normalize all known diseases
-    norm_known = [normalize_disease_name(d) for d in known_diseases]
+    # Known diseases are normalized once and reused across calls
+    index = _normalized_index(tuple(known_diseases))
+    if norm_query in index:
+        return index[norm_query]
     
     # Find close matches
-    matches = get_close_matches(norm_query, norm_known, n=1, cutoff=0.6)
+    matches = get_close_matches(norm_query, list(index), n=1, cutoff=0.6)
     
     if matches:
-        # Get the index of the match in the normalized list
-        match_idx = norm_known.index(matches[0])
         # Return the original form of the matched disease
-        return known_diseases[match_idx]
+        return index[matches[0]]
     
     return disease_name  # Return original if no good matches
@@ -0,0 +1,241 @@
+import os
+import time
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+
+import requests
+from requests.adapters import HTTPAdapter
+
+import metrics
+
+logger = logging.getLogger(__name__)
+
+OWM_BASE_URL = os.getenv("OPENWEATHER_BASE_URL", "http://api.openweathermap.org")
+AQI_LABELS = ["🟢 Good", "🟡 Fair", "🟠 Moderate", "🔴 Poor", "🟣 Hazardous"]
+
+# Service label recorded in the HTTP metrics for each OpenWeatherMap endpoint
+_SERVICES = {"/geo/1.0/direct": "geocoding", "/data/2.5/weather": "weather", "/data/2.5/air_pollution": "aqi"}
+
+
+class TTLCache:
+    """
+    Small thread-safe cache whose entries remember when they were stored
+    """
+
+    def __init__(self, max_entries=1024):
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._entries = {}
+
+    def get(self, key):
+        """
+        Returns:
+            Tuple of (value, age in seconds), or (None, None) if absent
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+        if entry is None:
+            return None, None
+        value, stored_at = entry
+        return value, time.monotonic() - stored_at
+
+    def set(self, key, value):
+        with self._lock:
+            if key not in self._entries and len(self._entries) >= self.max_entries:
+                # Drop the oldest entry (dicts keep insertion order)
+                self._entries.pop(next(iter(self._entries)))
+            self._entries[key] = (value, time.monotonic())
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+class WeatherService:
+    """
+    OpenWeatherMap client with connection pooling, caching and strict timeouts.
+
+    Coordinates are cached per city string practically forever. Weather and
+    AQI observations are fetched concurrently and cached for a few minutes;
+    once an observation is older than ``observation_ttl`` but younger than
+    ``stale_ttl`` it is served immediately while a background refresh runs
+    (stale-while-revalidate), so a slow upstream never blocks a Gradio worker
+    for longer than ``deadline`` seconds. When an offline ``gazetteer``
+    (city_index.CityIndex) is given, known cities are resolved without
+    calling the geocoding API at all.
+    """
+
+    def __init__(self, api_key, base_url=OWM_BASE_URL, timeout=(2.0, 3.0), deadline=4.0,
+                 coordinates_ttl=30 * 24 * 3600.0, observation_ttl=600.0, stale_ttl=3600.0, pool_size=8,
+                 gazetteer=None):
+        self.api_key = api_key
+        self.gazetteer = gazetteer
+        self.base_url = base_url.rstrip("/")
+        self.timeout = timeout
+        self.deadline = deadline
+        self.coordinates_ttl = coordinates_ttl
+        self.observation_ttl = observation_ttl
+        self.stale_ttl = stale_ttl
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=2, pool_maxsize=pool_size)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+        # Lookups (and background refreshes) run on one pool and fan their
+        # HTTP legs out to another, so a lookup never waits on its own pool
+        self._lookups = ThreadPoolExecutor(max_workers=pool_size, thread_name_prefix="weather-lookup")
+        self._requests = ThreadPoolExecutor(max_workers=2 * pool_size, thread_name_prefix="weather-http")
+        self._coordinates = TTLCache()
+        self._suggestions = TTLCache()
+        self._observations = TTLCache()
+        self._refreshing = set()
+        self._refresh_lock = threading.Lock()
+
+    def _get_json(self, path, **params):
+        params["appid"] = self.api_key
+        with metrics.http_call(_SERVICES.get(path, path)):
+            response = self.session.get(f"{self.base_url}{path}", params=params, timeout=self.timeout)
+            response.raise_for_status()
+            return response.json()
+
+    @staticmethod
+    def _key(text):
+        return " ".join(text.lower().split())
+
+    def geocode(self, query, limit=5):
+        """
+        Direct geocoding lookup, cached per normalized query
+
+        Returns:
+            List of OpenWeatherMap geocoding results
+        """
+        key = (self._key(query), limit)
+        results, age = self._suggestions.get(key)
+        if results is not None and age <= self.coordinates_ttl:
+            metrics.CACHE_REQUESTS.inc(cache="geocoding", result="hit")
+            return results
+        metrics.CACHE_REQUESTS.inc(cache="geocoding", result="miss")
+        results = self._get_json("/geo/1.0/direct", q=query, limit=limit)
+        self._suggestions.set(key, results)
+        return results
+
+    def get_coordinates(self, location):
+        """
+        Resolve a city string to coordinates
+
+        Returns:
+            Tuple of (lat, lon), or (None, None) if the location is unknown
+        """
+        key = self._key(location)
+        coordinates, age = self._coordinates.get(key)
+        if coordinates is not None and age <= self.coordinates_ttl:
+            metrics.CACHE_REQUESTS.inc(cache="coordinates", result="hit")
+            return coordinates
+        coordinates = self.gazetteer.coordinates(location) if self.gazetteer is not None else None
+        metrics.CACHE_REQUESTS.inc(cache="coordinates", result="miss" if coordinates is None else "gazetteer")
+        if coordinates is None:
+            response = self.geocode(location, limit=1)
+            coordinates = (response[0]["lat"], response[0]["lon"]) if response else (None, None)
+        self._coordinates.set(key, coordinates)
+        return coordinates
+
+    def _fetch_observation(self, location):
+        lat, lon = self.get_coordinates(location)
+        if lat is None:
+            return None
+        # Weather and AQI are independent: issue both requests at once
+        weather = self._requests.submit(self._get_json, "/data/2.5/weather", lat=lat, lon=lon, units="metric")
+        aqi = self._requests.submit(self._get_json, "/data/2.5/air_pollution", lat=lat, lon=lon)
+        return {"weather": weather.result(), "aqi": aqi.result()}
+
+    def _refresh(self, key, location):
+        try:
+            self._observations.set(key, self._fetch_observation(location))
+        except Exception as e:
+            logger.warning(f"Background weather refresh for {location!r} failed: {str(e)}")
+        finally:
+            with self._refresh_lock:
+                self._refreshing.discard(key)
+
+    def _schedule_refresh(self, key, location):
+        with self._refresh_lock:
+            if key in self._refreshing:
+                return
+            self._refreshing.add(key)
+        self._lookups.submit(self._refresh, key, location)
+
+    def get_observation(self, location):
+        """
+        Current weather and air-pollution payloads for a location
+
+        Returns:
+            Dictionary with "weather" and "aqi" responses, or None for an unknown location
+
+        Raises:
+            TimeoutError or requests.RequestException when the upstream fails
+            and no cached observation is available
+        """
+        key = self._key(location)
+        observation, age = self._observations.get(key)
+        if age is not None and age <= self.observation_ttl:
+            metrics.CACHE_REQUESTS.inc(cache="observation", result="hit")
+            return observation
+        if age is not None and age <= self.stale_ttl:
+            metrics.CACHE_REQUESTS.inc(cache="observation", result="stale")
+            self._schedule_refresh(key, location)
+            return observation
+        metrics.CACHE_REQUESTS.inc(cache="observation", result="miss")
+
+        future = self._lookups.submit(self._fetch_observation, location)
+        try:
+            observation = future.result(timeout=self.deadline)
+        except FutureTimeoutError:
+            # Let the fetch finish in the background so the next request is warm
+            def store_when_done(done):
+                if done.exception() is None:
+                    self._observations.set(key, done.result())
+
+            future.add_done_callback(store_when_done)
+            raise TimeoutError(f"Weather lookup for {location!r} exceeded {self.deadline}s")
+        self._observations.set(key, observation)
+        return observation
+
+    def get_weather_and_aqi(self, location):
+        """
+        Weather and AQI summary line for the UI
+        """
+        try:
+            observation = self.get_observation(location)
+        except Exception as e:
+            logger.warning(f"Weather lookup for {location!r} failed: {str(e)}")
+            return "❌ Weather/AQI data unavailable"
+        if observation is None:
+            return "❌ Invalid Location"
+
+        weather_res, aqi_res = observation["weather"], observation["aqi"]
+        if "main" not in weather_res or "list" not in aqi_res:
+            return "❌ Weather/AQI data unavailable"
+
+        aqi_level = aqi_res["list"][0]["main"]["aqi"]
+        return (
+            f"🌍 {location} | "
+            f"🌡️ {weather_res['main']['temp']}°C | "
+            f"💧 {weather_res['main']['humidity']}% | "
+            f"🌫️ {AQI_LABELS[aqi_level - 1]} ({aqi_level})"
+        )
+
+    def suggest_cities(self, query, limit=5):
+        """
+        City suggestions for the location box
+
+        Returns:
+            List of "City, CC" strings (empty on error)
+        """
+        try:
+            response = self.geocode(query, limit=limit)
+        except Exception as e:
+            logger.warning(f"City suggestion lookup for {query!r} failed: {str(e)}")
+            return []
+        return [f"{city['name']}, {city.get('country', '')}" for city in response]
@@ -0,0 +1,492 @@
+import os
+import sys
+import time
+import atexit
+import queue
+import logging
+import threading
+import multiprocessing
+from collections import deque
+from concurrent.futures import Future
+from multiprocessing import shared_memory
+
+import numpy as np
+
+import metrics
+from model_loader import load_model, model_input_dtype, predict_batch, decode_prediction
+
+logger = logging.getLogger(__name__)
+
+INPUT_SHAPE = (224, 224, 3)
+
+# Sentinel pushed onto the results queue to stop the collector thread
+_STOP = ("stop",)
+
+# Seconds between checks for dead workers, whether or not results keep arriving
+LIVENESS_INTERVAL = 1.0
+
+
+def _slot_arrays(buffer, slots, capacity, num_classes):
+    """
+    Views of one worker's shared-memory block: an input ring of uint8 pixel
+    batches followed by the matching float32 probability rows
+    """
+    inputs = np.ndarray((slots, capacity) + INPUT_SHAPE, dtype=np.uint8, buffer=buffer)
+    outputs = np.ndarray((slots, capacity, num_classes), dtype=np.float32, buffer=buffer, offset=inputs.nbytes)
+    return inputs, outputs
+
+
+def _slot_bytes(slots, capacity, num_classes):
+    return slots * capacity * (int(np.prod(INPUT_SHAPE)) + num_classes * 4)
+
+
+def _shares_weights(model_path, backend=None):
+    """
+    Whether worker processes loading this model share one copy of its weights
+    """
+    return (backend or os.path.splitext(model_path)[1].lower().lstrip(".")) == "tflite"
+
+
+def _as_model_input(images, dtype, out):
+    """
+    Convert raw uint8 pixels from the ring into the model's input dtype,
+    matching preprocess_batch exactly for float models
+    """
+    if dtype == np.uint8:
+        return images
+    batch = out[:len(images)]
+    np.divide(images, np.float32(255.0), out=batch, casting="unsafe")
+    return batch
+
+
+def _worker_main(worker_id, model_path, load_options, shm, slots, capacity, num_classes, tasks, results, cores,
+                 threads):
+    """
+    Inference worker process: load the model, then run forward passes over
+    ring slots named in task messages until a None task arrives
+    """
+    if cores and hasattr(os, "sched_setaffinity"):
+        os.sched_setaffinity(0, cores)
+    # Read by TensorFlow, OpenMP and MKL when they initialize in this process
+    os.environ["OMP_NUM_THREADS"] = os.environ["MKL_NUM_THREADS"] = str(threads)
+    os.environ["TF_NUM_INTRAOP_THREADS"] = str(threads)
+    os.environ["TF_NUM_INTEROP_THREADS"] = "1"
+
+    started = time.perf_counter()
+    try:
+        if os.path.splitext(model_path)[1].lower() not in (".tflite", ".onnx"):
+            import tensorflow as tf
+            tf.config.threading.set_intra_op_parallelism_threads(threads)
+            tf.config.threading.set_inter_op_parallelism_threads(1)
+        model = load_model(model_path, num_threads=threads, **load_options)
+        dtype = model_input_dtype(model)
+        inputs, outputs = _slot_arrays(shm.buf, slots, capacity, num_classes)
+        scratch = np.empty((capacity,) + INPUT_SHAPE, dtype=np.float32) if dtype != np.uint8 else None
+        predict_batch(model, _as_model_input(inputs[0, :1], dtype, scratch))
+    except Exception as e:
+        results.put(("error", worker_id, f"{type(e).__name__}: {e}"))
+        return
+    results.put(("ready", worker_id, os.getpid(), time.perf_counter() - started))
+
+    stop = False
+    carry = None
+    while not stop:
+        task = carry if carry is not None else tasks.get()
+        carry = None
+        if task is None:
+            break
+        # Drain whatever else is already queued into the same forward pass
+        batch, size = [task], task[1]
+        while size < capacity:
+            try:
+                task = tasks.get_nowait()
+            except queue.Empty:
+                break
+            if task is None:
+                stop = True
+                break
+            if size + task[1] > capacity:
+                carry = task
+                break
+            batch.append(task)
+            size += task[1]
+
+        started = time.perf_counter()
+        slot_ids = [slot for slot, _ in batch]
+        try:
+            if len(batch) == 1:
+                images = inputs[batch[0][0], :batch[0][1]]
+            else:
+                images = np.concatenate([inputs[slot, :n] for slot, n in batch])
+            probabilities = predict_batch(model, _as_model_input(images, dtype, scratch))
+            offset = 0
+            for slot, n in batch:
+                outputs[slot, :n] = probabilities[offset:offset + n]
+                offset += n
+        except Exception as e:
+            results.put(("failed", worker_id, slot_ids, f"{type(e).__name__}: {e}"))
+            continue
+        results.put(("done", worker_id, slot_ids, time.perf_counter() - started, size))
+
+
+class _Worker:
+    """
+    Parent-side bookkeeping for one worker process
+    """
+
+    def __init__(self, worker_id, shm, slots, capacity, num_classes, cores):
+        self.worker_id = worker_id
+        self.shm = shm
+        self.inputs, self.outputs = _slot_arrays(shm.buf, slots, capacity, num_classes)
+        self.cores = cores
+        self.free_slots = deque(range(slots))
+        self.pending = {}  # slot -> (chunk, rows)
+        self.in_flight = 0  # images
+        self.process = None
+        self.tasks = None
+        self.pid = None
+        self.alive = False
+        self.load_seconds = None
+        self.requests = 0
+        self.batches = 0
+        self.images = 0
+        self.busy_seconds = 0.0
+
+
+class _Chunk:
+    """
+    Part of a submitted request that fits in one ring slot
+    """
+    __slots__ = ("future", "parts", "index", "remaining", "lock")
+
+    def __init__(self, future, parts, index, remaining, lock):
+        self.future = future
+        self.parts = parts
+        self.index = index
+        self.remaining = remaining
+        self.lock = lock
+
+
+class InferenceWorkerPool:
+    """
+    Multi-process inference with the same interface as InferenceServer.
+
+    ``workers`` processes are forked, each pinned to its own cores with a
+    fixed intra-op thread count, and load the model from ``model_path``.
+    Only .tflite models are memory-mapped, so that their weights live once
+    in the page cache for all workers; any other model (including either
+    stage of a cascade) would be loaded once per worker, so it is refused
+    with more than one worker. Pixels travel through a per-worker
+    shared-memory ring of ``slots`` slots holding up to ``max_batch_size``
+    uint8 images each; only slot numbers are sent over the pipes. The
+    scheduler picks the worker with the fewest images in flight and blocks
+    for up to ``queue_timeout`` seconds when every slot is taken
+    (backpressure), then raises TimeoutError.
+
+    Start the pool before TensorFlow is imported in the parent process:
+    forked children must not inherit an initialized TensorFlow runtime.
+    """
+
+    def __init__(self, model_path, class_labels, workers=2, max_batch_size=16, slots=4, threads_per_worker=None,
+                 pin_cores=True, queue_timeout=5.0, start_method=None, **load_options):
+        if workers < 1:
+            raise ValueError("workers must be at least 1")
+        if workers > 1:
+            # An explicit backend only applies to the full model, not to a cascade's first stage
+            stages = [(model_path, load_options.get("backend")), (load_options.get("first_stage"), None)]
+            for path, backend in stages:
+                if path and not _shares_weights(path, backend):
+                    raise ValueError(
+                        f"{path} would be loaded separately by each of the {workers} inference workers; "
+                        f"convert it to .tflite (memory-mapped and shared) or use a single worker"
+                    )
+        self.model_path = model_path
+        self.class_labels = class_labels
+        self.num_classes = len(class_labels)
+        self.workers = workers
+        self.max_batch_size = max_batch_size
+        self.slots = slots
+        self.queue_timeout = queue_timeout
+        self.load_options = load_options
+        self.input_dtype = np.uint8
+
+        available = sorted(os.sched_getaffinity(0)) if hasattr(os, "sched_getaffinity") else list(range(os.cpu_count() or 1))
+        self.threads_per_worker = threads_per_worker or max(1, len(available) // workers)
+        self._core_sets = [
+            [available[(i * self.threads_per_worker + j) % len(available)] for j in range(self.threads_per_worker)]
+            if pin_cores else None
+            for i in range(workers)
+        ]
+
+        default_method = "fork" if "fork" in multiprocessing.get_all_start_methods() else "spawn"
+        self._context = multiprocessing.get_context(start_method or default_method)
+        self._results = None
+        self._collector = None
+        self._cond = threading.Condition()
+        self._workers = []
+        self._started_at = None
+
+    def start(self, timeout=300.0):
+        """
+        Start the workers and wait until every one has loaded and warmed up the model
+
+        Raises:
+            RuntimeError if a worker fails to load the model
+        """
+        if self._workers:
+            return self
+        if self._context.get_start_method() == "fork" and "tensorflow" in sys.modules:
+            logger.warning("TensorFlow is already imported; forked inference workers may misbehave")
+
+        self._results = self._context.Queue()
+        size = _slot_bytes(self.slots, self.max_batch_size, self.num_classes)
+        for worker_id in range(self.workers):
+            shm = shared_memory.SharedMemory(create=True, size=size)
+            worker = _Worker(worker_id, shm, self.slots, self.max_batch_size, self.num_classes,
+                             self._core_sets[worker_id])
+            worker.tasks = self._context.Queue()
+            worker.process = self._context.Process(
+                target=_worker_main,
+                args=(worker_id, self.model_path, self.load_options, shm, self.slots, self.max_batch_size,
+                      self.num_classes, worker.tasks, self._results, worker.cores, self.threads_per_worker),
+                name=f"inference-worker-{worker_id}",
+                daemon=True,
+            )
+            worker.process.start()
+            self._workers.append(worker)
+
+        deadline = time.monotonic() + timeout
+        waiting = set(range(self.workers))
+        try:
+            while waiting:
+                message = self._results.get(timeout=max(0.0, deadline - time.monotonic()))
+                if message[0] == "error":
+                    raise RuntimeError(f"Inference worker {message[1]} failed to start: {message[2]}")
+                if message[0] == "ready":
+                    _, worker_id, pid, load_seconds = message
+                    worker = self._workers[worker_id]
+                    worker.pid, worker.load_seconds, worker.alive = pid, load_seconds, True
+                    waiting.discard(worker_id)
+        except queue.Empty:
+            self.stop()
+            raise RuntimeError(f"Inference workers {sorted(waiting)} did not start within {timeout}s")
+        except Exception:
+            self.stop()
+            raise
+
+        self._started_at = time.perf_counter()
+        # Release the shared memory even if the app exits without calling stop()
+        atexit.register(self.stop)
+        self._collector = threading.Thread(target=self._collect, name="inference-pool", daemon=True)
+        self._collector.start()
+        logger.info(
+            f"Inference pool started ({self.workers} workers x {self.threads_per_worker} threads, "
+            f"{self.slots} slots of {self.max_batch_size} images each)"
+        )
+        return self
+
+    def stop(self, timeout=10.0):
+        """
+        Stop the workers and release the shared memory
+        """
+        atexit.unregister(self.stop)
+        for worker in self._workers:
+            if worker.process.is_alive():
+                worker.tasks.put(None)
+        for worker in self._workers:
+            worker.process.join(timeout)
+            if worker.process.is_alive():
+                worker.process.terminate()
+            worker.alive = False
+        if self._collector is not None:
+            self._results.put(_STOP)
+            self._collector.join(timeout)
+            self._collector = None
+        with self._cond:
+            for worker in self._workers:
+                for chunk, _ in worker.pending.values():
+                    if not chunk.future.done():
+                        chunk.future.set_exception(RuntimeError("Inference pool stopped"))
+                worker.pending.clear()
+                worker.inputs = worker.outputs = None
+                worker.shm.close()
+                worker.shm.unlink()
+            self._workers = []
+            self._cond.notify_all()
+
+    def submit(self, preprocessed_image):
+        """
+        Queue a preprocessed image batch for inference
+
+        Args:
+            preprocessed_image: Array of shape (N, 224, 224, 3), uint8 pixels
+                                or float32 in [0, 1]; batches larger than
+                                ``max_batch_size`` are split across workers
+
+        Returns:
+            Future resolving to an array of class probabilities of shape (N, num_classes)
+
+        Raises:
+            TimeoutError when every ring slot stays busy for ``queue_timeout`` seconds
+        """
+        if not self._workers:
+            raise RuntimeError("Inference pool is not running; call start() first")
+        images = np.asarray(preprocessed_image)
+        if images.ndim == 3:
+            images = images[np.newaxis]
+
+        future = Future()
+        starts = range(0, len(images), self.max_batch_size)
+        parts = [None] * len(starts)
+        remaining = [len(parts)]
+        lock = threading.Lock()
+        for index, start in enumerate(starts):
+            chunk = _Chunk(future, parts, index, remaining, lock)
+            self._dispatch(chunk, images[start:start + self.max_batch_size])
+        return future
+
+    def predict(self, preprocessed_image, timeout=None):
+        """
+        Blocking helper with the same contract as model_loader.predict_disease
+
+        Returns:
+            Tuple of (predicted disease label, confidence percentage)
+        """
+        probabilities = self.submit(preprocessed_image).result(timeout)
+        return decode_prediction(probabilities[0], self.class_labels)
+
+    def stats(self):
+        """
+        Per-worker load and utilization (share of wall time spent in forward passes)
+
+        Returns:
+            Dictionary with pool settings and a ``workers`` list
+        """
+        elapsed = time.perf_counter() - self._started_at if self._started_at else 0.0
+        with self._cond:
+            workers = [
+                {
+                    "worker": w.worker_id,
+                    "pid": w.pid,
+                    "cores": w.cores,
+                    "alive": w.alive,
+                    "in_flight": w.in_flight,
+                    "free_slots": len(w.free_slots),
+                    "requests": w.requests,
+                    "batches": w.batches,
+                    "images": w.images,
+                    "mean_batch_size": w.images / w.batches if w.batches else 0.0,
+                    "busy_seconds": w.busy_seconds,
+                    "utilization": w.busy_seconds / elapsed if elapsed else 0.0,
+                    "load_seconds": w.load_seconds,
+                }
+                for w in self._workers
+            ]
+        return {
+            "workers": workers,
+            "threads_per_worker": self.threads_per_worker,
+            "slots": self.slots,
+            "max_batch_size": self.max_batch_size,
+            "queue_depth": sum(w["in_flight"] for w in workers),
+        }
+
+    def _dispatch(self, chunk, images):
+        """
+        Copy a chunk into a free ring slot of the least-loaded worker
+        """
+        queued_at = time.monotonic()
+        deadline = queued_at + self.queue_timeout
+        with self._cond:
+            while True:
+                candidates = [w for w in self._workers if w.alive and w.free_slots]
+                if candidates:
+                    break
+                if not any(w.alive for w in self._workers):
+                    raise RuntimeError("No inference workers are running")
+                remaining = deadline - time.monotonic()
+                if remaining <= 0 or not self._cond.wait(remaining):
+                    raise TimeoutError(f"All inference workers stayed busy for {self.queue_timeout}s")
+            metrics.QUEUE_WAIT_SECONDS.observe(time.monotonic() - queued_at, queue="worker_slots")
+            worker = min(candidates, key=lambda w: (w.in_flight, w.worker_id))
+            slot = worker.free_slots.popleft()
+            worker.pending[slot] = (chunk, len(images))
+            worker.in_flight += len(images)
+            worker.requests += 1
+
+        target = worker.inputs[slot, :len(images)]
+        if images.dtype == np.uint8:
+            target[...] = images
+        else:
+            np.rint(np.multiply(images, 255.0), out=target, casting="unsafe")
+        worker.tasks.put((slot, len(images)))
+
+    def _collect(self):
+        next_check = time.monotonic() + LIVENESS_INTERVAL
+        while True:
+            try:
+                message = self._results.get(timeout=max(0.0, next_check - time.monotonic()))
+            except queue.Empty:
+                message = None
+            # On a timer rather than only when the queue goes quiet: under steady
+            # traffic it never does, and a dead worker's requests would hang
+            if time.monotonic() >= next_check:
+                self._check_workers()
+                next_check = time.monotonic() + LIVENESS_INTERVAL
+            if message is None:
+                continue
+            if message == _STOP:
+                return
+            kind, worker_id, slot_ids = message[:3]
+            worker = self._workers[worker_id]
+            if kind == "done":
+                busy_seconds, size = message[3], message[4]
+                # Forward passes run in the worker processes; record them here
+                metrics.STAGE_SECONDS.observe(busy_seconds, stage="forward")
+                metrics.BATCH_IMAGES.observe(size)
+                with self._cond:
+                    worker.batches += 1
+                    worker.images += size
+                    worker.busy_seconds += busy_seconds
+                for slot in slot_ids:
+                    self._finish(worker, slot, probabilities=worker.outputs[slot])
+            elif kind == "failed":
+                for slot in slot_ids:
+                    self._finish(worker, slot, error=RuntimeError(message[3]))
+
+    def _finish(self, worker, slot, probabilities=None, error=None):
+        with self._cond:
+            entry = worker.pending.pop(slot, None)
+            if entry is None:
+                # Already failed because the worker died after sending this result
+                return
+            chunk, rows = entry
+            result = probabilities[:rows].copy() if probabilities is not None else None
+            worker.free_slots.append(slot)
+            worker.in_flight -= rows
+            self._cond.notify()
+
+        if error is not None:
+            if not chunk.future.done():
+                chunk.future.set_exception(error)
+            return
+        with chunk.lock:
+            chunk.parts[chunk.index] = result
+            chunk.remaining[0] -= 1
+            complete = chunk.remaining[0] == 0
+        if complete and not chunk.future.done():
+            parts = chunk.parts
+            chunk.future.set_result(parts[0] if len(parts) == 1 else np.concatenate(parts))
+
+    def _check_workers(self):
+        """
+        Fail the in-flight requests of workers that died
+        """
+        for worker in self._workers:
+            if worker.alive and not worker.process.is_alive():
+                logger.error(f"Inference worker {worker.worker_id} (pid {worker.pid}) exited "
+                             f"with code {worker.process.exitcode}")
+                with self._cond:
+                    worker.alive = False
+                    pending = list(worker.pending)
+                for slot in pending:
+                    self._finish(worker, slot, error=RuntimeError(f"Inference worker {worker.worker_id} died"))